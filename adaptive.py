@@ -0,0 +1,144 @@
+# adaptive.py
+
+import time
+import math
+import threading
+import logging
+
+logger = logging.getLogger()
+
+# Seconds between controller decisions
+DEFAULT_CONTROL_INTERVAL = 2.0
+# Share of a stage's thread time spent stalled above which the stage is considered the bottleneck
+STALL_THRESHOLD = 0.25
+# An added thread is kept only if throughput rises by at least this share
+MIN_GAIN = 0.05
+# A throughput drop larger than this share after an increase triggers a multiplicative decrease
+DROP_TOLERANCE = 0.15
+# Factor applied to a stage's thread count on a multiplicative decrease
+DECREASE_FACTOR = 0.5
+# Intervals to wait before probing a stage again after an added thread did not help
+PROBE_COOLDOWN = 5
+# How often threads waiting for a slot check whether the pipeline was stopped
+WAIT_INTERVAL = 0.1
+
+class ConcurrencyLimit:
+    """
+    Resizable cap on how many threads of a stage work at once. A stage starts its maximum
+    number of threads; threads above the current limit wait for a slot instead of taking items.
+    """
+
+    def __init__(self, limit, maximum):
+        self.maximum = max(1, maximum)
+        self.limit = max(1, min(limit, self.maximum))
+        self._active = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, stop_event):
+        """Wait for a free slot. Returns False if the pipeline was stopped first."""
+        with self._condition:
+            while self._active >= self.limit:
+                if stop_event.is_set():
+                    return False
+                self._condition.wait(WAIT_INTERVAL)
+            self._active += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+    def resize(self, limit):
+        """Set a new limit, clamped to [1, maximum]. Threads already working finish their item."""
+        with self._condition:
+            self.limit = max(1, min(limit, self.maximum))
+            self._condition.notify_all()
+        return self.limit
+
+class ConcurrencyController(threading.Thread):
+    """
+    Adjusts the reader and analyzer limits of a running pipeline to maximize documents per second.
+
+    Every interval it measures throughput and where the stages stall. If analyzers wait on
+    reads, a reader is added; if readers wait on a full prefetch queue, an analyzer is added
+    (additive increase). An added thread that does not raise throughput is removed again, and
+    a clear throughput drop halves the stage that was last grown (multiplicative decrease).
+    Every change is logged.
+    """
+
+    def __init__(self, read_stats, analyze_stats, read_limit, analyze_limit, stop_event,
+                 interval=DEFAULT_CONTROL_INTERVAL):
+        """
+        Parameters:
+            read_stats (pipeline.StageStats): Statistics of the read stage.
+            analyze_stats (pipeline.StageStats): Statistics of the decode/analyze stage.
+            read_limit (ConcurrencyLimit): Limit on active reader threads.
+            analyze_limit (ConcurrencyLimit): Limit on active analyzer threads.
+            stop_event (threading.Event): Set when the pipeline stops.
+            interval (float): Seconds between decisions.
+        """
+        super().__init__(name="pipeline-controller", daemon=True)
+        self.stats = {"read": read_stats, "analyze": analyze_stats}
+        self.limits = {"read": read_limit, "analyze": analyze_limit}
+        self.stop_event = stop_event
+        self.interval = interval
+        self.decisions = []
+        self._last_rate = None
+        self._last_increase = None
+        self._cooldown = {"read": 0, "analyze": 0}
+
+    def run(self):
+        previous = self._snapshot()
+        while not self.stop_event.wait(self.interval):
+            current = self._snapshot()
+            self._step(previous, current)
+            previous = current
+
+    def _snapshot(self):
+        return time.perf_counter(), {name: stats.as_dict() for name, stats in self.stats.items()}
+
+    def _resize(self, stage, limit, rate, reason):
+        old = self.limits[stage].limit
+        new = self.limits[stage].resize(limit)
+        if new != old:
+            self.decisions.append((stage, old, new, rate))
+            threads = "readers" if stage == "read" else "analyzers"
+            logger.info(f"Concurrency controller: {rate:.1f} docs/s, {reason}; {threads} {old} -> {new}.")
+        return new != old
+
+    def _step(self, previous, current):
+        elapsed = current[0] - previous[0]
+        delta = {
+            name: {key: current[1][name][key] - previous[1][name][key] for key in current[1][name]}
+            for name in self.stats
+        }
+        if not delta["analyze"]["items"]:
+            return  # Paused, finishing, or stuck on a single huge page: nothing to learn from
+
+        rate = delta["analyze"]["items"] / elapsed
+        starved = delta["analyze"]["input_wait_seconds"] / (elapsed * self.limits["analyze"].limit)
+        blocked = delta["read"]["output_wait_seconds"] / (elapsed * self.limits["read"].limit)
+        for stage in self._cooldown:
+            self._cooldown[stage] = max(0, self._cooldown[stage] - 1)
+
+        last_rate, stage = self._last_rate, self._last_increase
+        self._last_rate, self._last_increase = rate, None
+        if stage is not None:
+            limit = self.limits[stage].limit
+            if rate < last_rate * (1 - DROP_TOLERANCE):
+                self._resize(stage, math.floor(limit * DECREASE_FACTOR), rate,
+                             f"down from {last_rate:.1f} docs/s after the last increase")
+                self._cooldown[stage] = PROBE_COOLDOWN
+                return
+            if rate < last_rate * (1 + MIN_GAIN):
+                self._resize(stage, limit - 1, rate, f"no gain over {last_rate:.1f} docs/s")
+                self._cooldown[stage] = PROBE_COOLDOWN
+                return
+
+        if starved > STALL_THRESHOLD and not self._cooldown["read"]:
+            if self._resize("read", self.limits["read"].limit + 1, rate, f"analyzers waiting on reads {starved:.0%}"):
+                self._last_increase = "read"
+        elif blocked > STALL_THRESHOLD and not self._cooldown["analyze"]:
+            if self._resize("analyze", self.limits["analyze"].limit + 1, rate, f"readers waiting on analysis {blocked:.0%}"):
+                self._last_increase = "analyze"
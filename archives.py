@@ -0,0 +1,311 @@
+# archives.py
+
+import os
+import shutil
+import tarfile
+import zipfile
+import threading
+import logging
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger()
+
+# File names treated as archives; a path running through one of them addresses its members
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# A regular file inside an archive: its normalized name, position in the archive, size and
+# the ZipInfo/TarInfo used to open it
+ArchiveMember = namedtuple("ArchiveMember", ["name", "offset", "size", "info"])
+# The members of an archive in archive order, keyed by name, and every folder they imply.
+# kind is "zip" or "tar"; mode is the tarfile mode that opens the archive.
+ArchiveIndex = namedtuple("ArchiveIndex", ["kind", "mode", "members", "folders"])
+
+_indexes = {}
+_index_lock = threading.Lock()
+_known_archives = set()
+# Open archive handles per thread; ZipFile and TarFile reads are not safe to share
+_local = threading.local()
+# Every open handle as (pid, thread, handle), so close_handles can reach those of finished threads
+_open_handles = []
+_handles_lock = threading.Lock()
+
+def _is_archive_file(path):
+    if path in _known_archives:
+        return True
+    if os.path.isfile(path):
+        _known_archives.add(path)
+        return True
+    return False
+
+def split_archive_path(path):
+    """
+    Split a path that runs through an archive file into the archive and the path inside it,
+    so "D:/Box 12.zip/Folder 3/JPG" addresses the "Folder 3/JPG" folder of Box 12.zip.
+
+    Parameters:
+        path (str): A file or folder path.
+
+    Returns:
+        tuple: (archive path, inner path with "/" separators, "" for the archive root),
+               or (None, path) if the path does not run through an archive.
+    """
+    candidate = os.path.normpath(path)
+    inner = []
+    while True:
+        if candidate.lower().endswith(ARCHIVE_SUFFIXES) and _is_archive_file(candidate):
+            return candidate, "/".join(reversed(inner))
+        parent, name = os.path.split(candidate)
+        if not name or parent == candidate:
+            return None, path
+        inner.append(name)
+        candidate = parent
+
+def is_archive_path(path):
+    """True if the path is an archive file or runs through one."""
+    return split_archive_path(path)[0] is not None
+
+def _member_name(name):
+    """Normalize a member name: "/" separators, no leading "./" or "/"."""
+    name = name.replace("\\", "/")
+    while name.startswith("./"):
+        name = name[2:]
+    return name.strip("/")
+
+def _build_index(archive_path):
+    """Read the central directory of a ZIP, or the member headers of a TAR, in archive order."""
+    members = {}
+    folders = {""}
+    if zipfile.is_zipfile(archive_path):
+        kind, mode = "zip", None
+        with zipfile.ZipFile(archive_path) as archive:
+            # The central directory is normally in write order; header offsets make sure
+            entries = sorted(archive.infolist(), key=lambda info: info.header_offset)
+        for info in entries:
+            name = _member_name(info.filename)
+            if info.is_dir():
+                folders.add(name)
+            elif name:
+                members[name] = ArchiveMember(name, info.header_offset, info.file_size, info)
+    else:
+        kind = "tar"
+        try:
+            # Uncompressed TARs are opened for random access; compressed ones are read at
+            # decompression speed and cost a rewind whenever a member lies behind the last one read
+            archive = tarfile.open(archive_path, "r:")
+            mode = "r:"
+        except tarfile.ReadError:
+            archive = tarfile.open(archive_path, "r:*")
+            mode = "r:*"
+        with archive:
+            entries = archive.getmembers()
+        for info in entries:
+            name = _member_name(info.name)
+            if info.isdir():
+                folders.add(name)
+            elif info.isfile() and name:
+                members[name] = ArchiveMember(name, info.offset_data, info.size, info)
+    for name in members:
+        parts = name.split("/")[:-1]
+        folders.update("/".join(parts[:depth]) for depth in range(1, len(parts) + 1))
+    logger.info(f"Indexed {len(members)} files in archive '{archive_path}'.")
+    return ArchiveIndex(kind, mode, members, folders)
+
+def archive_index(archive_path):
+    """
+    Return the index of an archive, built once per process and rebuilt if the file changes.
+
+    Parameters:
+        archive_path (str): The archive file.
+
+    Returns:
+        ArchiveIndex: The archive's members and folders.
+    """
+    stat = os.stat(archive_path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _index_lock:
+        cached = _indexes.get(archive_path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, _build_index(archive_path))
+            _indexes[archive_path] = cached
+    return cached[1]
+
+def _member(path):
+    """Return (archive path, index, member) of an archive member path."""
+    archive_path, inner = split_archive_path(path)
+    index = archive_index(archive_path)
+    member = index.members.get(inner)
+    if member is None:
+        raise FileNotFoundError(f"No file '{inner}' in archive '{archive_path}'.")
+    return archive_path, index, member
+
+def _handle(archive_path, index):
+    """Return this thread's open handle of an archive."""
+    if getattr(_local, "pid", None) != os.getpid():
+        # Handles inherited through fork share their file offset with the parent; never reuse them
+        _local.pid = os.getpid()
+        _local.handles = {}
+    handle = _local.handles.get(archive_path)
+    if handle is None:
+        if index.kind == "zip":
+            handle = zipfile.ZipFile(archive_path)
+        else:
+            handle = tarfile.open(archive_path, index.mode)
+        _local.handles[archive_path] = handle
+        with _handles_lock:
+            _open_handles.append((os.getpid(), threading.current_thread(), handle))
+    return handle
+
+def close_handles():
+    """
+    Close the archive handles of the calling thread and of threads that have finished, such
+    as the workers of a run that is over, so archives are not held open (and locked on
+    Windows) between runs. Threads still running keep theirs. The calling thread opens new
+    handles on its next read.
+    """
+    pid, current = os.getpid(), threading.current_thread()
+    with _handles_lock:
+        closing = [entry for entry in _open_handles
+                   if entry[0] == pid and (entry[1] is current or not entry[1].is_alive())]
+        # Entries copied in through fork belong to the parent and are only dropped
+        _open_handles[:] = [entry for entry in _open_handles if entry[0] == pid and entry not in closing]
+    if getattr(_local, "pid", None) == pid:
+        _local.handles = {}
+    for _, _, handle in closing:
+        try:
+            handle.close()
+        except OSError as e:
+            logger.debug(f"Could not close archive handle: {str(e)}")
+
+def is_archive_member(path):
+    """True if the path addresses a file inside an archive."""
+    archive_path, inner = split_archive_path(path)
+    return archive_path is not None and bool(inner)
+
+def member_offset(path):
+    """
+    Locate an archive member for ordering reads.
+
+    Parameters:
+        path (str): A file path, possibly inside an archive.
+
+    Returns:
+        tuple: (archive path, byte offset of the member in the archive), or (None, 0) for a plain file.
+    """
+    if not is_archive_member(path):
+        return None, 0
+    archive_path, _, member = _member(path)
+    return archive_path, member.offset
+
+def open_file(path):
+    """
+    Open a file or archive member for binary reading. Members are streamed from the archive;
+    the returned file object belongs to the calling thread and should be closed before the
+    thread opens the next member of the same archive.
+    """
+    if not is_archive_member(path):
+        return open(path, 'rb')
+    archive_path, index, member = _member(path)
+    handle = _handle(archive_path, index)
+    if index.kind == "zip":
+        return handle.open(member.info)
+    return handle.extractfile(member.info)
+
+def read_bytes(path):
+    """Read the whole content of a file or archive member."""
+    with open_file(path) as f:
+        return f.read()
+
+def file_size(path):
+    """Size of a file or archive member in bytes (uncompressed for members)."""
+    if not is_archive_member(path):
+        return os.path.getsize(path)
+    return _member(path)[2].size
+
+def read_image(path, flags=cv2.IMREAD_COLOR):
+    """
+    Decode an image file or archive member. Members are decoded from memory with
+    cv2.imdecode and never written to disk.
+
+    Parameters:
+        path (str): The image path.
+        flags (int): cv2.imread flags.
+
+    Returns:
+        numpy.ndarray: The image, or None if it couldn't be decoded.
+    """
+    if not is_archive_member(path):
+        return cv2.imread(path, flags)
+    return cv2.imdecode(np.frombuffer(read_bytes(path), dtype=np.uint8), flags)
+
+def copy_file(path, output_dir):
+    """Copy a file or archive member into a folder, keeping its base name."""
+    if not is_archive_member(path):
+        shutil.copy2(path, output_dir)
+        return
+    with open_file(path) as src, open(os.path.join(output_dir, os.path.basename(path)), 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+
+def exists(path):
+    """os.path.exists for paths that may run through an archive."""
+    archive_path, inner = split_archive_path(path)
+    if archive_path is None:
+        return os.path.exists(path)
+    index = archive_index(archive_path)
+    return inner in index.members or inner in index.folders
+
+def is_folder(path):
+    """os.path.isdir for paths that may run through an archive; an archive is a folder."""
+    archive_path, inner = split_archive_path(path)
+    if archive_path is None:
+        return os.path.isdir(path)
+    return inner in archive_index(archive_path).folders
+
+def _children(path):
+    """Yield (name, is_folder) for the direct children of a folder inside an archive, in archive order."""
+    archive_path, inner = split_archive_path(path)
+    index = archive_index(archive_path)
+    if inner not in index.folders:
+        raise FileNotFoundError(f"No folder '{inner}' in archive '{archive_path}'.")
+    prefix = f"{inner}/" if inner else ""
+    for name in index.members:
+        if name.startswith(prefix) and "/" not in name[len(prefix):]:
+            yield name[len(prefix):], False
+    for name in index.folders:
+        if name and name.startswith(prefix) and "/" not in name[len(prefix):]:
+            yield name[len(prefix):], True
+
+def list_folder(path):
+    """
+    os.listdir for folders that may be inside an archive. Files inside an archive are
+    listed in archive order, so processing them in listing order reads the archive front to back.
+
+    Parameters:
+        path (str): The folder path.
+
+    Returns:
+        list: Names of the files (and, outside archives, folders) directly in the folder.
+    """
+    if not is_archive_path(path):
+        return os.listdir(path)
+    return [name for name, folder in _children(path) if not folder]
+
+def list_subfolders(path):
+    """
+    Sorted names of the subfolders of a folder, inside archives too. Outside archives,
+    archive files count as subfolders and are listed under their own file name.
+    """
+    if not is_archive_path(path):
+        with os.scandir(path) as entries:
+            return sorted(entry.name for entry in entries
+                          if entry.is_dir() or (entry.is_file() and entry.name.lower().endswith(ARCHIVE_SUFFIXES)))
+    return sorted(name for name, folder in _children(path) if folder)
+
+def strip_archive_suffix(name):
+    """Return a file name without its archive suffix, e.g. "Box 12" for "Box 12.tar.gz"."""
+    for suffix in sorted(ARCHIVE_SUFFIXES, key=len, reverse=True):
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return name
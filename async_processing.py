@@ -0,0 +1,193 @@
+# async_processing.py
+
+import queue
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from processing import (
+    ProcessingError, plan_documents, evaluate_group, skipped_result, read_document_group, analyze_document_bytes
+)
+from scheduling import schedule_tasks
+from progress import ProgressReporter
+
+logger = logging.getLogger()
+
+# Default number of documents in flight at once
+DEFAULT_CONCURRENCY = 4
+# How often paused workers check whether the job was resumed or cancelled
+PAUSE_POLL_INTERVAL = 0.2
+
+async def _analyze_task(loop, task, cpu_executor):
+    """
+    Read a task's JPG on the default (I/O) executor and analyze it on the CPU executor.
+    Returns the gray percentage, or None if reading or analysis failed.
+    """
+    try:
+        data = await loop.run_in_executor(None, read_document_group, task)
+        return await loop.run_in_executor(cpu_executor, analyze_document_bytes, task, data)
+    except Exception as e:
+        logger.error(f"Exception while analyzing '{task[0][0][0]}': {str(e)}")
+        return None
+
+async def _iter_planned_async(plan, low_threshold, high_threshold, concurrency, executor, job=None):
+    """
+    Analyze the tasks of a plan with at most `concurrency` in flight and yield a
+    DocumentResult for every JPG as each unique content is decided. While the job is
+    paused no new task is started; once it is cancelled, the tasks in flight are finished
+    and iteration stops.
+    """
+    loop = asyncio.get_running_loop()
+    owns_executor = executor is None
+    cpu_executor = ThreadPoolExecutor(max_workers=concurrency) if owns_executor else executor
+
+    for jpg_file in plan["skipped_files"]:
+        yield skipped_result(jpg_file)
+
+    tasks = plan["tasks"]
+    # Largest pages first, as in processing.iter_planned_documents
+    pending = ((index, tasks[index]) for index in schedule_tasks(tasks, concurrency))
+    # Bounded so workers pause when the consumer falls behind
+    results = asyncio.Queue(maxsize=concurrency)
+
+    async def worker():
+        while True:
+            if job is not None:
+                while job.paused and not job.cancelled:
+                    await asyncio.sleep(PAUSE_POLL_INTERVAL)
+                if job.cancelled:
+                    break
+            # The iterator is shared; asyncio runs one worker at a time, so this is safe
+            item = next(pending, None)
+            if item is None:
+                break
+            index, task = item
+            gray_pct = await _analyze_task(loop, task, cpu_executor)
+            await results.put((index, gray_pct))
+        # Tells the consumer this worker is done
+        await results.put(None)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(tasks)))]
+    try:
+        running = len(workers)
+        while running:
+            item = await results.get()
+            if item is None:
+                running -= 1
+                continue
+            index, gray_pct = item
+            for result in evaluate_group(plan["groups"][index], gray_pct, low_threshold, high_threshold):
+                yield result
+    finally:
+        for worker_task in workers:
+            worker_task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if owns_executor:
+            cpu_executor.shutdown(wait=False, cancel_futures=True)
+
+async def iter_documents_async(input_dir_jpg, input_dir_tiff, low_threshold, high_threshold, mixed_raster_dir=None,
+                               concurrency=DEFAULT_CONCURRENCY, executor=None):
+    """
+    Asynchronously iterate over the decisions for every JPG in a folder pair, in completion order.
+
+    File reads run on the event loop's default executor and decoding/analysis runs on
+    `executor` (a thread pool sized to `concurrency` when not given; pass a
+    ProcessPoolExecutor to use several cores).
+
+    Parameters:
+        input_dir_jpg (str): Directory containing JPG files.
+        input_dir_tiff (str): Directory containing TIFF files.
+        low_threshold (float): Low gray threshold percentage.
+        high_threshold (float): High gray threshold percentage.
+        mixed_raster_dir (str): Directory for mixed-raster output, or None to skip it.
+        concurrency (int): Maximum number of documents being read or analyzed at once.
+        executor (concurrent.futures.Executor): Executor for the CPU work, or None for a private thread pool.
+
+    Yields:
+        DocumentResult: The decision for each JPG, in completion order.
+
+    Raises:
+        ProcessingError: If the folders hold no valid TIFF or JPG files.
+    """
+    loop = asyncio.get_running_loop()
+    plan = await loop.run_in_executor(
+        None, plan_documents, input_dir_jpg, input_dir_tiff, low_threshold, high_threshold, mixed_raster_dir
+    )
+    async for item in _iter_planned_async(plan, low_threshold, high_threshold, concurrency, executor):
+        yield item
+
+async def process_documents_async(input_dir_jpg, input_dir_tiff, low_threshold, high_threshold, progress_callback=None,
+                                  mixed_raster_dir=None, concurrency=DEFAULT_CONCURRENCY, executor=None, job=None):
+    """
+    Asynchronous counterpart of process_documents for embedding in asyncio services.
+    Progress is reported by awaiting progress_callback with the same message tuples that
+    process_documents puts on its queue: coalesced "current_file" and "progress" updates
+    (see progress.ProgressReporter), then "complete", "cancelled" or "error".
+
+    Parameters:
+        input_dir_jpg (str): Directory containing JPG files.
+        input_dir_tiff (str): Directory containing TIFF files.
+        low_threshold (float): Low gray threshold percentage.
+        high_threshold (float): High gray threshold percentage.
+        progress_callback (callable): Async callable receiving each progress message, or None.
+        mixed_raster_dir (str): Directory for mixed-raster output, or None to skip it.
+        concurrency (int): Maximum number of documents being read or analyzed at once.
+        executor (concurrent.futures.Executor): Executor for the CPU work, or None for a private thread pool.
+        job (jobs.JobHandle): Optional handle for cancelling, pausing and resuming the run.
+
+    Returns:
+        tuple: (flagged_count, log_entries_sorted, duplicate_groups), or None if processing failed.
+    """
+    # The reporter posts to a local queue that is handed to the callback after every file
+    messages = queue.SimpleQueue()
+
+    async def drain():
+        while not messages.empty():
+            message = messages.get_nowait()
+            if progress_callback is not None:
+                await progress_callback(message)
+
+    async def report(*message):
+        messages.put(message)
+        await drain()
+
+    try:
+        loop = asyncio.get_running_loop()
+        plan = await loop.run_in_executor(
+            None, plan_documents, input_dir_jpg, input_dir_tiff, low_threshold, high_threshold, mixed_raster_dir
+        )
+
+        log_entries = []
+        reporter = ProgressReporter(messages, plan["total_files"])
+
+        async for result in _iter_planned_async(plan, low_threshold, high_threshold, concurrency, executor, job):
+            if result.skipped:
+                reporter.file_done(skipped=True)
+            else:
+                log_entries.append(result.to_log_entry())
+                reporter.file_done(result.jpg_file, flagged=result.flagged == "Yes")
+            await drain()
+
+        flagged_count = reporter.flagged
+        # Sort the log entries based on the sort key (first digit, then last four digits)
+        log_entries_sorted = sorted(log_entries, key=lambda x: x[0])
+
+    except ProcessingError as e:
+        logger.error(str(e))
+        await report("error", str(e))
+        return None
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during processing: {str(e)}")
+        await report("error", f"An unexpected error occurred: {str(e)}")
+        return None
+
+    if job is not None and job.cancelled:
+        cancel_message = f"Processing cancelled after {len(log_entries_sorted)} of {plan['total_files']} files."
+        logger.info(cancel_message)
+        reporter.finish("cancelled", cancel_message, flagged_count, log_entries_sorted, plan["duplicate_groups"])
+    else:
+        completion_message = "Processing complete."
+        logger.info(completion_message)
+        reporter.finish("complete", completion_message, flagged_count, log_entries_sorted, plan["duplicate_groups"])
+    await drain()
+    return flagged_count, log_entries_sorted, plan["duplicate_groups"]
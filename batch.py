@@ -0,0 +1,331 @@
+# batch.py
+
+import os
+import sys
+import csv
+import argparse
+import logging
+from collections import namedtuple, Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from processing import ProcessingError, plan_documents, iter_task_results, evaluate_group, PROCESSING_MODES, DISPATCH_ORDERS
+from progress import ProgressReporter
+from governor import ResourceGovernor, GOVERNOR_PROFILES
+from staging import DEFAULT_CACHE_BYTES
+from archives import ARCHIVE_SUFFIXES, list_subfolders, is_folder, strip_archive_suffix, close_handles
+from text_density import is_mostly_graphics
+from jobs import JobHandle
+
+logger = logging.getLogger()
+
+# Threads listing and planning folders; the work is I/O bound, so this may exceed the CPU count
+CRAWL_THREADS = 8
+
+# One Folder of a Box: TIFs in Post Scan Output/Box/Folder, JPGs in Post Scan Raw/Box/Folder/JPG
+TreeFolder = namedtuple("TreeFolder", ["box", "folder", "input_dir_jpg", "input_dir_tiff"])
+
+def _box_path(root, box):
+    """Find a Box under a root: the Box folder, or else a Box archive such as "Box 12.zip"."""
+    path = os.path.join(root, box)
+    if os.path.isdir(path):
+        return path
+    for suffix in ARCHIVE_SUFFIXES:
+        if os.path.isfile(path + suffix):
+            return path + suffix
+    return path
+
+def _crawl_box(output_root, raw_root, box_entry):
+    """List the Folders of one Box, given as a folder or archive name, as TreeFolder entries."""
+    box = strip_archive_suffix(box_entry)
+    output_box = os.path.join(output_root, box_entry)
+    raw_box = _box_path(raw_root, box)
+    return [
+        TreeFolder(box, folder, os.path.join(raw_box, folder, "JPG"), os.path.join(output_box, folder))
+        for folder in list_subfolders(output_box)
+    ]
+
+def crawl_tree(output_root, raw_root, crawl_threads=CRAWL_THREADS):
+    """
+    Find every Box/Folder in a Post Scan Output tree, listing the Boxes in parallel.
+
+    Parameters:
+        output_root (str): The Post Scan Output folder (Box/Folder/*.tif).
+        raw_root (str): The Post Scan Raw folder (Box/Folder/JPG/*.jpg).
+        crawl_threads (int): Number of Boxes listed at once.
+
+    Returns:
+        list: TreeFolder entries in Box, then Folder order.
+    """
+    boxes = list_subfolders(output_root)
+    with ThreadPoolExecutor(max_workers=crawl_threads) as executor:
+        folders = [folder for box_folders in executor.map(lambda box: _crawl_box(output_root, raw_root, box), boxes)
+                   for folder in box_folders]
+    logger.info(f"Found {len(folders)} folders in {len(boxes)} boxes under '{output_root}'.")
+    return folders
+
+def _plan_folder(folder, low_threshold, high_threshold, mixed_raster_root, orientation_root):
+    """Plan one folder, returning (plan, None) or (None, error message)."""
+    if not is_folder(folder.input_dir_jpg):
+        return None, f"JPG folder not found: {folder.input_dir_jpg}"
+    mixed_raster_dir = os.path.join(mixed_raster_root, folder.box, folder.folder) if mixed_raster_root else None
+    orientation_dir = os.path.join(orientation_root, folder.box, folder.folder) if orientation_root else None
+    try:
+        return plan_documents(folder.input_dir_jpg, folder.input_dir_tiff, low_threshold, high_threshold,
+                              mixed_raster_dir, orientation_dir), None
+    except ProcessingError as e:
+        return None, str(e)
+    except Exception as e:
+        return None, f"An unexpected error occurred: {str(e)}"
+
+def _check_graphics(input_dir_tiff, tiff_files):
+    """Return "Yes" if any of a page's TIFFs is mostly graphics, "No" if none is, or "" if none could be read."""
+    answers = [is_mostly_graphics(os.path.join(input_dir_tiff, tiff_file)) for tiff_file in tiff_files]
+    if any(answers):
+        return "Yes"
+    return "No" if any(answer is not None for answer in answers) else ""
+
+def process_tree(output_root, raw_root, low_threshold, high_threshold, mixed_raster_root=None,
+                 execution_mode="processes", max_workers=None, pipeline_options=None, job=None,
+                 progress_queue=None, crawl_threads=CRAWL_THREADS, dispatch="size", orientation_root=None,
+                 staging=None, graphics_check=False):
+    """
+    Process every Folder of every Box in a Post Scan Output/Raw tree as one run.
+
+    Boxes are crawled and Folders planned (paired and deduplicated) in parallel, then the
+    tasks of all Folders go into a single worker pool, so cores stay busy across Folder and
+    Box boundaries. A Folder that cannot be planned is reported with its error and does not
+    stop the run. A Box may also be a ZIP or TAR archive in either root (for example
+    "Box 12.zip" holding Folder/*.tif or Folder/JPG/*.jpg); it is read without extracting it,
+    and dispatch="physical" reads it in archive order.
+
+    Parameters:
+        output_root (str): The Post Scan Output folder.
+        raw_root (str): The Post Scan Raw folder.
+        low_threshold (float): Low gray threshold percentage.
+        high_threshold (float): High gray threshold percentage.
+        mixed_raster_root (str): Folder for mixed-raster output (Box/Folder below it), or None to skip it.
+        execution_mode (str): "serial", "threads", "processes", "pipeline", "adaptive" or "shared".
+        max_workers (int): Number of workers; defaults to the CPU count.
+        pipeline_options (dict): Extra keyword arguments for iter_pipeline.
+        job (jobs.JobHandle): Optional handle for pausing and cancelling the run.
+        progress_queue (queue.Queue): Optional queue for progress updates, as in process_documents.
+        crawl_threads (int): Number of Boxes and Folders crawled at once.
+        dispatch (str): One of DISPATCH_ORDERS, see iter_task_results; "physical" suits trees on HDDs.
+        orientation_root (str): Folder for upright copies of the pages (JPG and TIFFs) that are confidently
+                                not upright (Box/Folder below it), or None to skip orientation correction.
+                                The scanned files are never changed.
+        staging (dict): Options of a local staging cache for trees on a network share, see iter_task_results.
+        graphics_check (bool): After the run, check the TIFFs of flagged pages for pictures and graphs
+                               (see text_density.is_mostly_graphics), crawl_threads pages at once.
+
+    Returns:
+        list: One dict per Folder, in Box, then Folder order, with the keys box, folder,
+              total_files, flagged_count, skipped_count, log_entries (sorted),
+              duplicate_groups, mostly_graphics (the "Yes"/"No" graphics check of each flagged
+              entry's documents, or None without graphics_check) and error (None unless the
+              Folder could not be planned).
+    """
+    folders = crawl_tree(output_root, raw_root, crawl_threads)
+    with ThreadPoolExecutor(max_workers=crawl_threads) as executor:
+        plans = list(executor.map(
+            lambda folder: _plan_folder(folder, low_threshold, high_threshold, mixed_raster_root, orientation_root),
+            folders
+        ))
+
+    tree_results = []
+    # Every task of the tree in one list, with the Folder result and group each belongs to
+    tasks = []
+    owners = []
+    for folder, (plan, error) in zip(folders, plans):
+        folder_result = {
+            "box": folder.box,
+            "folder": folder.folder,
+            "total_files": plan["total_files"] if plan else 0,
+            "flagged_count": 0,
+            "skipped_count": 0,
+            "log_entries": [],
+            "duplicate_groups": plan["duplicate_groups"] if plan else [],
+            "mostly_graphics": {} if graphics_check else None,
+            "error": error,
+        }
+        tree_results.append(folder_result)
+        if error:
+            logger.error(f"Skipping {folder.box}/{folder.folder}: {error}")
+            continue
+        tasks += plan["tasks"]
+        owners += [(folder_result, folder, group) for group in plan["groups"]]
+        folder_result["skipped_count"] = len(plan["skipped_files"])
+
+    reporter = None
+    if progress_queue is not None:
+        reporter = ProgressReporter(progress_queue, sum(result["total_files"] for result in tree_results))
+        for folder_result in tree_results:
+            for _ in range(folder_result["skipped_count"]):
+                reporter.file_done(skipped=True)
+
+    # (Folder result, documents, TIFF folder, TIFF files) of each flagged entry, for the graphics check
+    flagged_pages = []
+    for task_index, gray_pct in iter_task_results(tasks, execution_mode, max_workers, pipeline_options, job,
+                                                  dispatch=dispatch, staging=staging):
+        folder_result, folder, group = owners[task_index]
+        tiff_files = {candidate[0]: candidate[3] for candidate in group}
+        for result in evaluate_group(group, gray_pct, low_threshold, high_threshold):
+            if result.skipped:
+                folder_result["skipped_count"] += 1
+            else:
+                folder_result["log_entries"].append(result.to_log_entry())
+                if result.flagged == "Yes":
+                    folder_result["flagged_count"] += 1
+                    if graphics_check:
+                        flagged_pages.append((folder_result, result.selected_documents, folder.input_dir_tiff,
+                                              tiff_files[result.jpg_file]))
+            if reporter is not None:
+                reporter.file_done(
+                    os.path.join(folder_result["box"], folder_result["folder"], result.jpg_file),
+                    flagged=result.flagged == "Yes", skipped=result.skipped
+                )
+    if reporter is not None:
+        reporter.flush()
+
+    if flagged_pages:
+        # Decoding and labelling release the GIL, so threads check pages in parallel
+        with ThreadPoolExecutor(max_workers=crawl_threads) as executor:
+            answers = executor.map(lambda page: _check_graphics(page[2], page[3]), flagged_pages)
+            for (folder_result, selected_documents, _, _), answer in zip(flagged_pages, answers):
+                folder_result["mostly_graphics"][selected_documents] = answer
+        close_handles()
+        logger.info(f"Checked {len(flagged_pages)} flagged pages for pictures and graphs.")
+
+    for folder_result in tree_results:
+        folder_result["log_entries"].sort(key=lambda x: x[0])
+    return tree_results
+
+def summarize_tree(tree_results):
+    """
+    Total the Folder results per Box and for the whole tree.
+
+    Parameters:
+        tree_results (list): The Folder results returned by process_tree.
+
+    Returns:
+        tuple: (box_totals, grand_total), where box_totals maps each Box to its totals dict and
+               each totals dict holds folders, failed_folders, files, flagged, skipped and a
+               formats Counter of selected formats.
+    """
+    def empty_totals():
+        return {"folders": 0, "failed_folders": 0, "files": 0, "flagged": 0, "skipped": 0, "formats": Counter()}
+
+    box_totals = {}
+    grand_total = empty_totals()
+    for folder_result in tree_results:
+        for totals in (box_totals.setdefault(folder_result["box"], empty_totals()), grand_total):
+            totals["folders"] += 1
+            totals["failed_folders"] += folder_result["error"] is not None
+            totals["files"] += folder_result["total_files"]
+            totals["flagged"] += folder_result["flagged_count"]
+            totals["skipped"] += folder_result["skipped_count"]
+            totals["formats"].update(entry[3] for entry in folder_result["log_entries"])
+    return box_totals, grand_total
+
+def write_tree_reports(tree_results, report_dir):
+    """
+    Write one TSV log per Box and a summary.tsv with a row per Folder, per Box and for the tree.
+    The Box logs get a Mostly_Graphics column if the tree was processed with graphics_check.
+
+    Parameters:
+        tree_results (list): The Folder results returned by process_tree.
+        report_dir (str): Folder for the reports; created if missing.
+
+    Returns:
+        str: File path of the summary.
+    """
+    os.makedirs(report_dir, exist_ok=True)
+    box_totals, grand_total = summarize_tree(tree_results)
+    formats = sorted(grand_total["formats"])
+    graphics_checked = any(folder_result.get("mostly_graphics") is not None for folder_result in tree_results)
+
+    for box in box_totals:
+        with open(os.path.join(report_dir, f"{box}.tsv"), mode='w', newline='') as log_csv:
+            log_writer = csv.writer(log_csv, delimiter='\t')
+            log_writer.writerow(['Folder', 'Document', 'Gray_Percentage', 'Selected_Format', 'Flagged_Files']
+                                + (['Mostly_Graphics'] if graphics_checked else []))
+            for folder_result in tree_results:
+                if folder_result["box"] != box:
+                    continue
+                mostly_graphics = folder_result.get("mostly_graphics") or {}
+                for _, selected_documents, gray_pct_str, selected_format, flagged in folder_result["log_entries"]:
+                    row = [folder_result["folder"], selected_documents, gray_pct_str, selected_format, flagged]
+                    if graphics_checked:
+                        row.append(mostly_graphics.get(selected_documents, ""))
+                    log_writer.writerow(row)
+
+    summary_path = os.path.join(report_dir, "summary.tsv")
+    with open(summary_path, mode='w', newline='') as summary_csv:
+        summary_writer = csv.writer(summary_csv, delimiter='\t')
+        summary_writer.writerow(['Box', 'Folder', 'Files', 'Flagged', 'Skipped'] + formats + ['Error'])
+        for folder_result in tree_results:
+            folder_formats = Counter(entry[3] for entry in folder_result["log_entries"])
+            summary_writer.writerow(
+                [folder_result["box"], folder_result["folder"], folder_result["total_files"],
+                 folder_result["flagged_count"], folder_result["skipped_count"]]
+                + [folder_formats[name] for name in formats] + [folder_result["error"] or ""]
+            )
+        for box, totals in list(box_totals.items()) + [("All boxes", grand_total)]:
+            summary_writer.writerow(
+                [box, f"{totals['folders']} folders ({totals['failed_folders']} failed)", totals["files"],
+                 totals["flagged"], totals["skipped"]]
+                + [totals["formats"][name] for name in formats] + [""]
+            )
+    return summary_path
+
+def main(argv=None):
+    """
+    Command line entry point:
+        python batch.py POST_SCAN_OUTPUT POST_SCAN_RAW REPORT_DIR [--mode processes] [--workers N]
+    """
+    parser = argparse.ArgumentParser(description="Process every Box and Folder of a Post Scan Output tree.")
+    parser.add_argument("output_root", help="The Post Scan Output folder (Box/Folder/*.tif).")
+    parser.add_argument("raw_root", help="The Post Scan Raw folder (Box/Folder/JPG/*.jpg).")
+    parser.add_argument("report_dir", help="Folder for the per-Box logs and summary.tsv.")
+    parser.add_argument("--low", type=float, default=10.0, help="Low gray threshold (%%).")
+    parser.add_argument("--high", type=float, default=15.0, help="High gray threshold (%%).")
+    parser.add_argument("--mode", default="processes", choices=PROCESSING_MODES)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dispatch", default="size", choices=DISPATCH_ORDERS,
+                        help="Task order: largest first, report order, or on-disk order for HDDs and Box archives.")
+    parser.add_argument("--mixed-raster", default=None, help="Folder for mixed-raster output of intermediate pages.")
+    parser.add_argument("--correct-orientation", default=None, metavar="FOLDER",
+                        help="Folder for upright copies of pages scanned sideways or upside down.")
+    parser.add_argument("--priority", default="full speed", choices=GOVERNOR_PROFILES,
+                        help="Resource profile; 'background' leaves room for scanning on the same PC.")
+    parser.add_argument("--stage", action="store_true",
+                        help="Copy JPGs from a slow network share to a local cache just ahead of the workers.")
+    parser.add_argument("--stage-dir", default=None, help="Local folder for the staging cache; defaults to the temp folder.")
+    parser.add_argument("--stage-mb", type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+                        help="Most megabytes kept in the staging cache at once.")
+    parser.add_argument("--graphics-check", action="store_true",
+                        help="Mark flagged pages whose TIFF is mostly pictures or graphs in the Box logs.")
+    args = parser.parse_args(argv)
+
+    staging = None
+    if args.stage:
+        staging = {"cache_dir": args.stage_dir, "max_bytes": args.stage_mb * 1024 * 1024}
+    job = JobHandle()
+    governor = ResourceGovernor(job, args.priority)
+    governor.start()
+    try:
+        tree_results = process_tree(
+            args.output_root, args.raw_root, args.low, args.high, args.mixed_raster,
+            execution_mode=args.mode, max_workers=args.workers, job=job, dispatch=args.dispatch,
+            orientation_root=args.correct_orientation, staging=staging, graphics_check=args.graphics_check
+        )
+    finally:
+        governor.stop()
+    _, grand_total = summarize_tree(tree_results)
+    summary_path = write_tree_reports(tree_results, args.report_dir)
+    print(f"Processed {grand_total['files']} files in {grand_total['folders']} folders "
+          f"({grand_total['failed_folders']} failed); {grand_total['flagged']} flagged. Summary: {summary_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
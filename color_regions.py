@@ -0,0 +1,146 @@
+# color_regions.py
+
+import os
+import csv
+import cv2
+import numpy as np
+import logging
+
+from archives import read_image, copy_file
+
+logger = logging.getLogger()
+
+# Longest side of the downsampled map used to search for colored regions
+LOCALIZATION_MAX_SIDE = 512
+# Minimum distance from neutral gray in Lab (a, b) space for a pixel to count as colored
+CHROMA_THRESHOLD = 18.0
+# Fraction of mid-tone pixels in a neighbourhood above which the area is treated as photographic
+PHOTO_DENSITY_THRESHOLD = 0.6
+# Regions smaller than this fraction of the page are treated as noise
+MIN_REGION_AREA_FRACTION = 0.002
+# Padding (in full-resolution pixels) added around each region before cropping
+REGION_PADDING = 16
+
+def find_color_regions(image, max_side=LOCALIZATION_MAX_SIDE, chroma_threshold=CHROMA_THRESHOLD,
+                       photo_density_threshold=PHOTO_DENSITY_THRESHOLD,
+                       min_area_fraction=MIN_REGION_AREA_FRACTION, padding=REGION_PADDING):
+    """
+    Locate colored or photographic regions in a page using connected components
+    on a downsampled chroma map.
+
+    Parameters:
+        image (numpy.ndarray): Full-resolution BGR page image.
+        max_side (int): Longest side of the downsampled map.
+        chroma_threshold (float): Minimum Lab chroma for a pixel to count as colored.
+        photo_density_threshold (float): Minimum local fraction of mid-tone pixels for photographic areas.
+        min_area_fraction (float): Minimum region area as a fraction of the page area.
+        padding (int): Padding added around each region, in full-resolution pixels.
+
+    Returns:
+        list: (x, y, width, height) bounding boxes in full-resolution coordinates, largest first.
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, max_side / float(max(height, width)))
+    small_size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    small = cv2.resize(image, small_size, interpolation=cv2.INTER_AREA)
+
+    # Chroma is the distance from the neutral axis in the (a, b) plane of Lab
+    lab = cv2.cvtColor(small, cv2.COLOR_BGR2LAB).astype(np.float32)
+    chroma = np.hypot(lab[:, :, 1] - 128.0, lab[:, :, 2] - 128.0)
+    mask = (chroma > chroma_threshold).astype(np.uint8)
+
+    # Grayscale photographs have no chroma, so also keep dense mid-tone areas
+    lightness = lab[:, :, 0]
+    midtones = ((lightness > 40) & (lightness < 215)).astype(np.float32)
+    density = cv2.blur(midtones, (9, 9))
+    mask |= (density > photo_density_threshold).astype(np.uint8)
+
+    # Merge nearby fragments into whole regions before labelling
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+
+    num_labels, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    min_area = min_area_fraction * small_size[0] * small_size[1]
+
+    regions = []
+    for label in range(1, num_labels):  # Label 0 is the background
+        x, y, w, h, area = stats[label]
+        if area < min_area:
+            continue
+        # Scale back to full resolution and pad, clipping to the page
+        x0 = max(0, int(x / scale) - padding)
+        y0 = max(0, int(y / scale) - padding)
+        x1 = min(width, int((x + w) / scale) + padding)
+        y1 = min(height, int((y + h) / scale) + padding)
+        regions.append((x0, y0, x1 - x0, y1 - y0))
+
+    regions.sort(key=lambda r: r[2] * r[3], reverse=True)
+    return regions
+
+def write_mixed_raster(jpg_path, tiff_paths, output_dir, regions, jpeg_quality=85, image=None):
+    """
+    Write a mixed-raster result: the bilevel TIFF(s) plus JPEG crops of the colored regions
+    and a TSV manifest holding the crop coordinates.
+
+    Parameters:
+        jpg_path (str): Path to the full-color JPG.
+        tiff_paths (list): Paths to the bilevel TIFF(s) for the same document.
+        output_dir (str): Directory the mixed-raster files are written to.
+        regions (list): (x, y, width, height) bounding boxes in JPG coordinates.
+        jpeg_quality (int): JPEG quality used for the crops.
+        image (numpy.ndarray): Already decoded BGR JPG, to avoid decoding it again.
+
+    Returns:
+        list: (crop_filename, x, y, width, height) for every crop written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if image is None:
+        image = read_image(jpg_path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise IOError(f"Error reading image: {jpg_path}")
+
+    for tiff_path in tiff_paths:
+        copy_file(tiff_path, output_dir)
+
+    base_name, _ = os.path.splitext(os.path.basename(jpg_path))
+    crops = []
+    for index, (x, y, w, h) in enumerate(regions, start=1):
+        crop_filename = f"{base_name}_crop{index}.jpg"
+        crop = image[y:y + h, x:x + w]
+        if not cv2.imwrite(os.path.join(output_dir, crop_filename), crop, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]):
+            raise IOError(f"Error writing crop: {crop_filename}")
+        crops.append((crop_filename, x, y, w, h))
+
+    manifest_path = os.path.join(output_dir, f"{base_name}_regions.tsv")
+    with open(manifest_path, mode='w', newline='') as manifest:
+        writer = csv.writer(manifest, delimiter='\t')
+        writer.writerow(['Crop', 'X', 'Y', 'Width', 'Height'])
+        writer.writerows(crops)
+
+    return crops
+
+def export_mixed_raster(jpg_path, tiff_paths, output_dir):
+    """
+    Localize the colored regions of a JPG and write its mixed-raster result.
+
+    Parameters:
+        jpg_path (str): Path to the full-color JPG.
+        tiff_paths (list): Paths to the bilevel TIFF(s) for the same document.
+        output_dir (str): Directory the mixed-raster files are written to.
+
+    Returns:
+        list: (crop_filename, x, y, width, height) for every crop written, or None on error.
+    """
+    try:
+        image = read_image(jpg_path, cv2.IMREAD_COLOR)
+        if image is None:
+            logger.error(f"Error reading image: {jpg_path}")
+            return None
+        regions = find_color_regions(image)
+        crops = write_mixed_raster(jpg_path, tiff_paths, output_dir, regions, image=image)
+        logger.info(f"Wrote mixed raster for '{os.path.basename(jpg_path)}' with {len(crops)} color crops.")
+        return crops
+    except Exception as e:
+        logger.error(f"Exception while exporting mixed raster for '{jpg_path}': {str(e)}")
+        return None
@@ -0,0 +1,103 @@
+# dedup.py
+
+import hashlib
+import logging
+
+from archives import open_file, file_size
+
+logger = logging.getLogger()
+
+# Files are hashed in 1 MB chunks so large scans never have to sit in memory at once
+HASH_CHUNK_SIZE = 1024 * 1024
+# Number of bytes sampled from each end of a file for the cheap prefilter
+PREFILTER_SAMPLE_SIZE = 64 * 1024
+
+def compute_head_tail_signature(file_path, sample_size=PREFILTER_SAMPLE_SIZE):
+    """
+    Compute a cheap signature from the first and last bytes of a file.
+    Files whose signatures differ cannot have identical content, so this is used
+    to avoid hashing files in full when they only share a size.
+
+    Parameters:
+        file_path (str): The file path to sample.
+        sample_size (int): Number of bytes to read from each end of the file.
+
+    Returns:
+        str: Hex digest of the sampled bytes.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    size = file_size(file_path)
+    with open_file(file_path) as f:
+        hasher.update(f.read(sample_size))
+        if size > sample_size:
+            f.seek(max(sample_size, size - sample_size))
+            hasher.update(f.read(sample_size))
+    return hasher.hexdigest()
+
+def compute_content_hash(file_path, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Compute a BLAKE2b hash over the full content of a file, streamed in chunks.
+
+    Parameters:
+        file_path (str): The file path to hash.
+        chunk_size (int): Number of bytes read per chunk.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    hasher = hashlib.blake2b()
+    with open_file(file_path) as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def _group_by(paths, key_func, stage_name):
+    """
+    Group paths by the value returned from key_func, dropping groups with a single member.
+    Paths that cannot be read are logged and left out of every group.
+    """
+    groups = {}
+    for path in paths:
+        try:
+            key = key_func(path)
+        except OSError as e:
+            logger.warning(f"Could not compute {stage_name} for '{path}': {str(e)}")
+            continue
+        groups.setdefault(key, []).append(path)
+    return [group for group in groups.values() if len(group) > 1]
+
+def find_duplicate_groups(file_paths):
+    """
+    Find files with byte-identical content.
+    Candidates are narrowed by file size, then by a head/tail signature, and only
+    the files that still collide are hashed in full.
+
+    Parameters:
+        file_paths (list): File paths to compare, in processing order.
+
+    Returns:
+        tuple: (canonical_map, duplicate_groups) where canonical_map maps every duplicate
+               path to the first path with the same content, and duplicate_groups is a list
+               of path lists (first path is the representative) with two or more members.
+    """
+    size_groups = _group_by(file_paths, file_size, "file size")
+    signature_groups = []
+    for group in size_groups:
+        signature_groups.extend(_group_by(group, compute_head_tail_signature, "head/tail signature"))
+    duplicate_groups = []
+    for group in signature_groups:
+        duplicate_groups.extend(_group_by(group, compute_content_hash, "content hash"))
+
+    # Keep groups and their members in the original processing order
+    order = {path: index for index, path in enumerate(file_paths)}
+    for group in duplicate_groups:
+        group.sort(key=order.get)
+    duplicate_groups.sort(key=lambda group: order[group[0]])
+
+    canonical_map = {}
+    for group in duplicate_groups:
+        for path in group[1:]:
+            canonical_map[path] = group[0]
+
+    logger.info(f"Found {len(duplicate_groups)} duplicate content groups among {len(file_paths)} files.")
+    return canonical_map, duplicate_groups
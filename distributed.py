@@ -0,0 +1,445 @@
+# distributed.py
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import logging
+
+from processing import ProcessingError, plan_documents, iter_planned_documents, PROCESSING_MODES
+from jobs import JobHandle
+
+logger = logging.getLogger()
+
+# A claimed shard is handed to another worker if its lease is not renewed within this many seconds
+DEFAULT_LEASE_SECONDS = 120.0
+# Shards that failed or whose worker died this many times are marked as failed
+DEFAULT_MAX_ATTEMPTS = 3
+# Seconds an idle worker waits before polling the queue again
+DEFAULT_POLL_INTERVAL = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    input_dir_jpg TEXT NOT NULL,
+    input_dir_tiff TEXT NOT NULL,
+    low_threshold REAL NOT NULL,
+    high_threshold REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    updated REAL,
+    UNIQUE (input_dir_jpg, input_dir_tiff)
+);
+CREATE INDEX IF NOT EXISTS shards_status ON shards (status, lease_expires);
+"""
+
+def default_worker_id():
+    """
+    Build a worker id that is unique across machines sharing the queue.
+
+    Returns:
+        str: "<hostname>:<pid>"
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class ShardQueue:
+    """
+    Durable queue of folder shards stored in an SQLite database.
+
+    Workers claim a shard with a lease, renew the lease while processing, and write the
+    result back. A shard whose lease expires (its worker died) is claimed again by another
+    worker, up to max_attempts times.
+
+    The default journal mode, DELETE, relies only on file locks, so workers on several
+    machines can share a database on a NAS. WAL gives better concurrency but needs shared
+    memory, so every process must run on the host that stores the database file; on a
+    network share it corrupts or locks up the queue.
+
+    Folders are stored relative to a root folder, so workstations that mount the share at
+    different places (drive letters, mount points) find the same folders: each opens the
+    queue with the root as it sees it, by default the folder holding the database.
+
+    Lease expiry compares the time.time() of the machine that wrote the lease with that of
+    the machine checking it, so the clocks of all workstations must be in sync (NTP). A
+    worker whose clock runs ahead reclaims shards that are still being processed.
+    """
+
+    def __init__(self, db_path, journal_mode="DELETE", max_attempts=DEFAULT_MAX_ATTEMPTS, root=None):
+        """
+        Parameters:
+            db_path (str): File path of the SQLite database; created if missing.
+            journal_mode (str): SQLite journal mode, "DELETE" or "WAL" (only with every worker on this host).
+            max_attempts (int): Number of attempts before a shard is marked as failed.
+            root (str): Folder the queued folders are stored relative to, as seen from this
+                        machine; defaults to the folder holding the database.
+        """
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.root = os.path.abspath(root or os.path.dirname(os.path.abspath(db_path)))
+        # Autocommit mode; write transactions are opened explicitly with BEGIN IMMEDIATE
+        self.connection = sqlite3.connect(db_path, timeout=60.0, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute(f"PRAGMA journal_mode={journal_mode}")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _relative(self, path):
+        """Path of a folder relative to the root, with "/" separators so every platform reads it."""
+        try:
+            relative = os.path.relpath(os.path.abspath(path), self.root)
+        except ValueError:
+            raise ValueError(f"'{path}' is on another drive than the queue root '{self.root}'.")
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            raise ValueError(f"'{path}' is outside the queue root '{self.root}'.")
+        return relative.replace(os.sep, "/")
+
+    def _resolve(self, relative):
+        """Folder path on this machine of a path stored by _relative."""
+        return os.path.join(self.root, *relative.split("/"))
+
+    def _transaction(self, statements):
+        """Run (sql, parameters) pairs in one write transaction and return the last cursor."""
+        cursor = self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, parameters in statements:
+                cursor = self.connection.execute(sql, parameters)
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return cursor
+
+    def enqueue(self, input_dir_jpg, input_dir_tiff, low_threshold, high_threshold):
+        """
+        Add a folder pair to the queue. A pair that is already queued is left unchanged.
+
+        Parameters:
+            input_dir_jpg (str): Directory containing JPG files, below the queue root.
+            input_dir_tiff (str): Directory containing TIFF files, below the queue root.
+            low_threshold (float): Low gray threshold percentage.
+            high_threshold (float): High gray threshold percentage.
+
+        Returns:
+            bool: True if the shard was added, False if it was already queued.
+
+        Raises:
+            ValueError: If a folder is not below the queue root.
+        """
+        cursor = self._transaction([(
+            "INSERT OR IGNORE INTO shards (input_dir_jpg, input_dir_tiff, low_threshold, high_threshold, updated) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (self._relative(input_dir_jpg), self._relative(input_dir_tiff), low_threshold, high_threshold, time.time()),
+        )])
+        return cursor.rowcount == 1
+
+    def claim(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Claim the next pending shard, or a running shard whose lease has expired.
+
+        Parameters:
+            worker_id (str): Id of the claiming worker.
+            lease_seconds (float): Length of the lease.
+
+        Returns:
+            dict: The claimed shard row, with its folders resolved against the root, or None if
+                  there is nothing to claim.
+        """
+        now = time.time()
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Shards abandoned by dead workers too many times are given up on
+            self.connection.execute(
+                "UPDATE shards SET status = 'failed', error = 'Lease expired too many times', updated = ? "
+                "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            row = self.connection.execute(
+                "SELECT * FROM shards WHERE status = 'pending' OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is not None:
+                if row["status"] == "running":
+                    logger.warning(f"Reclaiming shard {row['id']} from worker '{row['owner']}' whose lease expired.")
+                self.connection.execute(
+                    "UPDATE shards SET status = 'running', owner = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                    "WHERE id = ?",
+                    (worker_id, now + lease_seconds, now, row["id"]),
+                )
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return dict(row, owner=worker_id, attempts=row["attempts"] + 1,
+                    input_dir_jpg=self._resolve(row["input_dir_jpg"]),
+                    input_dir_tiff=self._resolve(row["input_dir_tiff"]))
+
+    def renew(self, shard_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Extend the lease on a shard.
+
+        Returns:
+            bool: False if the worker no longer holds the shard (its lease expired and it was reclaimed).
+        """
+        cursor = self._transaction([(
+            "UPDATE shards SET lease_expires = ?, updated = ? WHERE id = ? AND owner = ? AND status = 'running'",
+            (time.time() + lease_seconds, time.time(), shard_id, worker_id),
+        )])
+        return cursor.rowcount == 1
+
+    def complete(self, shard_id, worker_id, result):
+        """
+        Store the result of a shard and mark it as done.
+
+        Returns:
+            bool: False if the worker no longer held the shard, in which case the result is discarded.
+        """
+        cursor = self._transaction([(
+            "UPDATE shards SET status = 'done', result = ?, error = NULL, lease_expires = NULL, updated = ? "
+            "WHERE id = ? AND owner = ? AND status = 'running'",
+            (json.dumps(result), time.time(), shard_id, worker_id),
+        )])
+        return cursor.rowcount == 1
+
+    def fail(self, shard_id, worker_id, error):
+        """
+        Record a failed attempt. The shard is retried until it reaches max_attempts.
+        """
+        self._transaction([(
+            "UPDATE shards SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = ?, owner = NULL, lease_expires = NULL, updated = ? "
+            "WHERE id = ? AND owner = ? AND status = 'running'",
+            (self.max_attempts, error, time.time(), shard_id, worker_id),
+        )])
+
+    def counts(self):
+        """
+        Returns:
+            dict: Number of shards in each status.
+        """
+        rows = self.connection.execute("SELECT status, COUNT(*) AS n FROM shards GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def results(self):
+        """
+        Returns:
+            list: (input_dir_jpg, input_dir_tiff, result dict) for every finished shard, in queue order.
+        """
+        rows = self.connection.execute(
+            "SELECT input_dir_jpg, input_dir_tiff, result FROM shards WHERE status = 'done' ORDER BY id"
+        ).fetchall()
+        return [(self._resolve(row["input_dir_jpg"]), self._resolve(row["input_dir_tiff"]), json.loads(row["result"]))
+                for row in rows]
+
+class _LeaseKeeper(threading.Thread):
+    """
+    Renews a shard lease in the background and cancels the job if the lease is lost. A
+    renewal that fails (the share is briefly unreachable, the database is locked) is
+    retried at the next renewal; once the lease has run out without one, the shard is
+    abandoned, since another worker may already have claimed it.
+    """
+
+    def __init__(self, db_path, journal_mode, shard_id, worker_id, lease_seconds, job):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.journal_mode = journal_mode
+        self.shard_id = shard_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        # SQLite connections cannot be shared between threads
+        shard_queue = None
+        last_renewal = time.monotonic()
+        try:
+            while not self.stopped.wait(self.lease_seconds / 3):
+                try:
+                    if shard_queue is None:
+                        shard_queue = ShardQueue(self.db_path, self.journal_mode)
+                    renewed = shard_queue.renew(self.shard_id, self.worker_id, self.lease_seconds)
+                except sqlite3.Error as e:
+                    if time.monotonic() - last_renewal >= self.lease_seconds:
+                        logger.error(f"Worker '{self.worker_id}' could not renew the lease on shard {self.shard_id} "
+                                     f"before it expired; abandoning the shard: {str(e)}")
+                        self.job.cancel()
+                        return
+                    logger.warning(f"Worker '{self.worker_id}' could not renew the lease on shard {self.shard_id}; "
+                                   f"retrying: {str(e)}")
+                    continue
+                if not renewed:
+                    logger.warning(f"Worker '{self.worker_id}' lost the lease on shard {self.shard_id}.")
+                    self.job.cancel()
+                    return
+                last_renewal = time.monotonic()
+        finally:
+            if shard_queue is not None:
+                shard_queue.close()
+
+def process_shard(shard, execution_mode="serial", max_workers=None, job=None):
+    """
+    Process one shard with process_documents semantics.
+
+    Parameters:
+        shard (dict): The claimed shard row.
+        execution_mode (str): Processing mode used inside the worker.
+        max_workers (int): Number of workers for the processing mode.
+        job (jobs.JobHandle): Optional handle; the run stops early when it is cancelled.
+
+    Returns:
+        dict: total_files, flagged_count, the sorted log_entries and duplicate_groups.
+
+    Raises:
+        ProcessingError: If the folders hold no valid TIFF or JPG files.
+    """
+    plan = plan_documents(shard["input_dir_jpg"], shard["input_dir_tiff"], shard["low_threshold"], shard["high_threshold"])
+    log_entries = []
+    flagged_count = 0
+    for result in iter_planned_documents(plan, execution_mode, max_workers, job=job):
+        if result.skipped:
+            continue
+        log_entries.append(result.to_log_entry())
+        if result.flagged == "Yes":
+            flagged_count += 1
+    return {
+        "total_files": plan["total_files"],
+        "flagged_count": flagged_count,
+        "log_entries": sorted(log_entries, key=lambda x: x[0]),
+        "duplicate_groups": plan["duplicate_groups"],
+    }
+
+def run_worker(db_path, worker_id=None, journal_mode="DELETE", lease_seconds=DEFAULT_LEASE_SECONDS,
+               execution_mode="serial", max_workers=None, poll_interval=DEFAULT_POLL_INTERVAL, exit_when_empty=True,
+               root=None):
+    """
+    Claim and process shards until the queue is empty (or forever if exit_when_empty is False).
+
+    Parameters:
+        db_path (str): File path of the SQLite queue.
+        worker_id (str): Id of this worker; defaults to "<hostname>:<pid>".
+        journal_mode (str): SQLite journal mode, "DELETE" or "WAL" (see ShardQueue).
+        lease_seconds (float): Length of each shard lease; renewed every third of it.
+        execution_mode (str): Processing mode used for each shard.
+        max_workers (int): Number of workers for the processing mode.
+        poll_interval (float): Seconds to wait before polling an empty queue again.
+        exit_when_empty (bool): Return once no shard is pending or running.
+        root (str): The queue root as seen from this machine (see ShardQueue).
+
+    Returns:
+        int: Number of shards this worker completed.
+    """
+    worker_id = worker_id or default_worker_id()
+    completed = 0
+    with ShardQueue(db_path, journal_mode, root=root) as shard_queue:
+        while True:
+            shard = shard_queue.claim(worker_id, lease_seconds)
+            if shard is None:
+                counts = shard_queue.counts()
+                if exit_when_empty and not counts.get("pending") and not counts.get("running"):
+                    logger.info(f"Worker '{worker_id}' found no more shards; exiting after {completed} shards.")
+                    return completed
+                time.sleep(poll_interval)
+                continue
+
+            logger.info(f"Worker '{worker_id}' claimed shard {shard['id']} ({shard['input_dir_jpg']}), attempt {shard['attempts']}.")
+            job = JobHandle()
+            keeper = _LeaseKeeper(db_path, journal_mode, shard["id"], worker_id, lease_seconds, job)
+            keeper.start()
+            try:
+                result = process_shard(shard, execution_mode, max_workers, job)
+            except ProcessingError as e:
+                shard_queue.fail(shard["id"], worker_id, str(e))
+                logger.error(f"Shard {shard['id']} failed: {str(e)}")
+                continue
+            except Exception as e:
+                shard_queue.fail(shard["id"], worker_id, f"An unexpected error occurred: {str(e)}")
+                logger.error(f"Shard {shard['id']} failed: {str(e)}")
+                continue
+            finally:
+                keeper.stopped.set()
+                keeper.join()
+
+            if job.cancelled:
+                logger.warning(f"Discarding partial result of shard {shard['id']}; this worker lost its lease.")
+            elif shard_queue.complete(shard["id"], worker_id, result):
+                completed += 1
+                logger.info(f"Worker '{worker_id}' completed shard {shard['id']}.")
+
+def main(argv=None):
+    """
+    Command line entry point:
+        python distributed.py enqueue QUEUE_DB PARENT_FOLDER... [--low 10] [--high 15]
+        python distributed.py work QUEUE_DB [--mode processes] [--workers N]
+        python distributed.py status QUEUE_DB
+    Each PARENT_FOLDER holds the JPG and TIF folders, as selected in the GUI, and must be
+    below the queue root: the folder holding QUEUE_DB unless --root gives the share's
+    location on this machine.
+    """
+    parser = argparse.ArgumentParser(description="Distribute JPG/TIFF processing across workstations.")
+    parser.add_argument("--journal-mode", default="DELETE", choices=("DELETE", "WAL"),
+                        help="WAL is faster but only safe when every worker runs on the host storing the database.")
+    parser.add_argument("--root", default=None,
+                        help="Folder the queued folders are relative to, as mounted on this machine; "
+                             "defaults to the folder holding the queue database.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="Queue parent folders for processing.")
+    enqueue_parser.add_argument("db_path")
+    enqueue_parser.add_argument("parent_folders", nargs="+")
+    enqueue_parser.add_argument("--low", type=float, default=10.0, help="Low gray threshold (%%).")
+    enqueue_parser.add_argument("--high", type=float, default=15.0, help="High gray threshold (%%).")
+
+    work_parser = subparsers.add_parser("work", help="Process queued shards until none are left.")
+    work_parser.add_argument("db_path")
+    work_parser.add_argument("--mode", default="serial", choices=PROCESSING_MODES)
+    work_parser.add_argument("--workers", type=int, default=None)
+    work_parser.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS)
+    work_parser.add_argument("--forever", action="store_true", help="Keep polling for new shards.")
+
+    status_parser = subparsers.add_parser("status", help="Show shard counts.")
+    status_parser.add_argument("db_path")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "enqueue":
+        with ShardQueue(args.db_path, args.journal_mode, root=args.root) as shard_queue:
+            for parent in args.parent_folders:
+                try:
+                    added = shard_queue.enqueue(os.path.join(parent, "JPG"), os.path.join(parent, "TIF"),
+                                                args.low, args.high)
+                except ValueError as e:
+                    print(f"Not queued: {str(e)}")
+                    continue
+                print(f"{'Queued' if added else 'Already queued'}: {parent}")
+    elif args.command == "work":
+        completed = run_worker(
+            args.db_path, journal_mode=args.journal_mode, lease_seconds=args.lease,
+            execution_mode=args.mode, max_workers=args.workers, exit_when_empty=not args.forever, root=args.root
+        )
+        print(f"Completed {completed} shards.")
+    else:
+        with ShardQueue(args.db_path, args.journal_mode) as shard_queue:
+            print(json.dumps(shard_queue.counts()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+# executors.py
+
+import os
+import math
+import time
+import itertools
+import threading
+import multiprocessing
+import logging
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from thread_budget import apply_thread_budget, library_threads
+from lanes import PriorityExecutor
+from archives import close_handles
+
+logger = logging.getLogger()
+
+# Execution backends accepted by create_executor
+EXECUTION_MODES = ("serial", "threads", "processes")
+# Number of chunks each worker should receive; more chunks balance load, fewer amortize IPC
+CHUNKS_PER_WORKER = 4
+# Upper bound on tasks per chunk so pause and cancel still take effect quickly on large runs
+MAX_CHUNKSIZE = 8
+# Chunks a pooled worker process handles before it is replaced, so leaked memory is returned
+DEFAULT_MAX_TASKS_PER_CHILD = 200
+
+class SerialExecutor(Executor):
+    """
+    Executor that runs every task immediately in the calling thread.
+    It has the same interface as the pool executors so callers need no special cases.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def map(self, fn, *iterables, timeout=None, chunksize=1):
+        # Yield lazily so progress is reported as each task finishes
+        return map(fn, *iterables)
+
+def default_worker_count():
+    """
+    Return the default number of workers for the pool backends.
+
+    Returns:
+        int: The number of CPUs available, or 1 if it cannot be determined.
+    """
+    return os.cpu_count() or 1
+
+def create_executor(mode="serial", max_workers=None):
+    """
+    Create an executor for the requested backend.
+
+    Parameters:
+        mode (str): One of "serial", "threads" or "processes".
+        max_workers (int): Number of workers for the pool backends; defaults to the CPU count.
+
+    Returns:
+        concurrent.futures.Executor: The executor. Use it as a context manager to shut it down.
+                                     Worker processes limit OpenCV and BLAS to their share of the CPUs.
+    """
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode '{mode}'. Expected one of: {', '.join(EXECUTION_MODES)}.")
+
+    if mode == "serial":
+        return SerialExecutor()
+
+    workers = max_workers or default_worker_count()
+    logger.info(f"Starting {mode} executor with {workers} workers.")
+    if mode == "threads":
+        return ThreadPoolExecutor(max_workers=workers)
+    return ProcessPoolExecutor(
+        max_workers=workers, initializer=apply_thread_budget, initargs=(library_threads(mode, workers),)
+    )
+
+def _init_pooled_worker(threads):
+    """
+    Initializer of pooled workers: set the thread budget, then import cv2, numpy and the
+    analysis code before the first task.
+    """
+    apply_thread_budget(threads)
+    import processing  # noqa: F401
+
+def _pool_context():
+    """
+    Start method for pooled workers. Recycling workers rules out fork; forkserver (POSIX)
+    forks replacements from a server that has already imported the analysis code, while
+    spawn (Windows) re-imports it in each new worker during the initializer.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["processing"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+def _worker_pid():
+    return os.getpid()
+
+class WarmWorkerPool(Executor):
+    """
+    Long-lived process pool that is reused across runs, so a run starts crunching without
+    paying for process start-up and the cv2/numpy imports in every worker. Workers are
+    replaced after max_tasks_per_child chunks to limit leaks (this needs Python 3.11 or
+    later). Tasks carry their own thresholds and folders, so the pool stays valid when
+    settings change between runs. If a worker dies and breaks the pool, the pool is
+    restarted the next time work is submitted.
+
+    Work can be submitted through lanes (see lanes.PriorityExecutor), so interactive QC
+    requests jump ahead of a batch run that shares the pool.
+    """
+
+    def __init__(self, max_workers=None, max_tasks_per_child=DEFAULT_MAX_TASKS_PER_CHILD):
+        """
+        Parameters:
+            max_workers (int): Number of worker processes; defaults to the CPU count.
+            max_tasks_per_child (int): Chunks a worker handles before it is replaced.
+        """
+        self.max_workers = max_workers or default_worker_count()
+        self.max_tasks_per_child = max_tasks_per_child
+        self._executor = None
+        self._lanes = None
+        self._lock = threading.Lock()
+
+    def get(self, max_workers=None):
+        """
+        Start the pool if needed and return it as an executor for a run. The pool is
+        restarted if the requested worker count differs.
+
+        Parameters:
+            max_workers (int): Number of worker processes; defaults to the current count.
+
+        Returns:
+            WarmWorkerPool: This pool. Callers that are handed it as an executor must not shut it down.
+        """
+        self._start(max_workers)
+        return self
+
+    def submit(self, fn, /, *args, **kwargs):
+        executor = self._start()
+        try:
+            return executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            logger.warning("A worker process died and broke the worker pool; restarting it.")
+            return self._start(broken=executor).submit(fn, *args, **kwargs)
+
+    def _start(self, max_workers=None, broken=None):
+        """Return the running ProcessPoolExecutor, replacing it if the worker count changed or it is the broken one."""
+        with self._lock:
+            workers = max_workers or self.max_workers
+            if self._executor is not None and (workers != self.max_workers or self._executor is broken):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                self._lanes.shutdown(wait=False, cancel_futures=True)
+                self._lanes = None
+            if self._executor is None:
+                self.max_workers = workers
+                self._executor = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=_pool_context(), initializer=_init_pooled_worker,
+                    initargs=(library_threads("processes", workers),), max_tasks_per_child=self.max_tasks_per_child
+                )
+                self._lanes = PriorityExecutor(self, workers)
+                logger.info(f"Started worker pool with {workers} processes.")
+            return self._executor
+
+    def lane(self, name, max_workers=None):
+        """
+        Return an executor that submits to one lane of the pool ("interactive" or "batch").
+        Do not shut the pool down through it; shutting a lane down only cancels its queued calls.
+
+        Parameters:
+            name (str): The lane.
+            max_workers (int): Number of worker processes, as in get().
+
+        Returns:
+            lanes.LaneExecutor: The lane's executor.
+        """
+        self._start(max_workers)
+        with self._lock:
+            return self._lanes.lane(name)
+
+    def warm_up(self, max_workers=None):
+        """
+        Start every worker process and wait until each has imported the analysis code.
+        Blocks, so call it from a background thread.
+        """
+        start = time.perf_counter()
+        executor = self.get(max_workers)
+        futures = [executor.submit(_worker_pid) for _ in range(self.max_workers)]
+        wait(futures)
+        pids = {future.result() for future in futures if not future.exception()}
+        logger.info(f"Worker pool warmed up in {time.perf_counter() - start:.2f}s ({len(pids)} processes ready).")
+
+    def shutdown(self, wait=False, *, cancel_futures=True):
+        """Stop the worker processes; queued work is always cancelled."""
+        with self._lock:
+            if self._executor is not None:
+                self._lanes.shutdown(wait=False, cancel_futures=True)
+                self._lanes = None
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+
+def compute_chunksize(total_tasks, max_workers, chunks_per_worker=CHUNKS_PER_WORKER, max_chunksize=MAX_CHUNKSIZE):
+    """
+    Pick a chunk size that sends each worker a few batches of tasks, so per-task IPC
+    overhead is amortized while the load stays balanced across workers.
+
+    Parameters:
+        total_tasks (int): Number of tasks to be mapped.
+        max_workers (int): Number of workers in the pool.
+        chunks_per_worker (int): Target number of chunks per worker.
+        max_chunksize (int): Largest chunk size returned.
+
+    Returns:
+        int: The chunk size to pass to iter_map_bounded.
+    """
+    workers = max(1, max_workers or default_worker_count())
+    return max(1, min(max_chunksize, math.ceil(total_tasks / (workers * chunks_per_worker))))
+
+def _apply_chunk(fn, chunk):
+    """Apply fn to every item of a chunk inside a worker. Top-level so it can be pickled."""
+    try:
+        return [fn(item) for item in chunk]
+    finally:
+        if multiprocessing.parent_process() is not None:
+            # Pooled workers outlive the run (see WarmWorkerPool), so they must not keep archives open
+            close_handles()
+
+def iter_map_bounded(executor, fn, items, chunksize=1, max_pending_chunks=None, job=None):
+    """
+    Map fn over items on an executor, yielding results in input order.
+
+    Unlike Executor.map, chunks are submitted lazily with at most max_pending_chunks in
+    flight, so memory stays bounded and a job handle can pause or cancel submission
+    between chunks. When the job is paused or cancelled, chunks already in flight are
+    still drained and their results yielded.
+
+    Parameters:
+        executor (concurrent.futures.Executor): The executor to submit chunks to.
+        fn (callable): Picklable top-level function applied to each item.
+        items (iterable): The items to map over.
+        chunksize (int): Number of items sent to a worker at once.
+        max_pending_chunks (int): Maximum number of chunks submitted but not yet yielded;
+                                  defaults to twice the CPU count.
+        job (jobs.JobHandle): Optional handle checked before each chunk is submitted.
+
+    Yields:
+        The result of fn for each item, in input order.
+    """
+    max_pending = max_pending_chunks or 2 * default_worker_count()
+    iterator = iter(items)
+    pending = deque()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                if job is not None:
+                    if job.cancelled:
+                        exhausted = True
+                        break
+                    if job.paused:
+                        if pending:
+                            break  # Drain the chunks in flight before waiting
+                        job.wait_while_paused()
+                        continue
+                chunk = list(itertools.islice(iterator, chunksize))
+                if not chunk:
+                    exhausted = True
+                    break
+                pending.append(executor.submit(_apply_chunk, fn, chunk))
+
+            if not pending:
+                return
+            yield from pending.popleft().result()
+    finally:
+        # Drop chunks that never started if the caller stopped iterating early
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,447 @@
+# governor.py
+
+import os
+import sys
+import time
+import ctypes
+import signal
+import platform
+import threading
+import logging
+from collections import namedtuple
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from thread_budget import _proc_descendants
+
+logger = logging.getLogger()
+
+# Limits applied to a run. cpu_percent and memory_percent are shares of the whole machine
+# (None for no cap); nice is the Unix niceness; io_priority is "normal" or "idle";
+# affinity is a list of CPU numbers or None for all CPUs.
+GovernorProfile = namedtuple("GovernorProfile", ["cpu_percent", "nice", "io_priority", "affinity", "memory_percent"])
+
+PROFILES = {
+    "full speed": GovernorProfile(None, 0, "normal", None, None),
+    # Leaves half the CPU, the disk and most of the memory to the scanning software
+    "background": GovernorProfile(50, 10, "idle", None, 50),
+}
+GOVERNOR_PROFILES = tuple(PROFILES)
+
+# Seconds between measurements of the run's CPU and memory use
+DEFAULT_GOVERNOR_INTERVAL = 0.5
+# A memory hold is released once usage falls below this share of the ceiling
+MEMORY_RESUME_FRACTION = 0.9
+# Longest throttle pause per interval, as a multiple of the interval
+MAX_THROTTLE_FACTOR = 4.0
+
+# Linux ioprio_set/ioprio_get: syscall numbers, "who" selector and I/O classes (linux/ioprio.h)
+IOPRIO_SET_SYSCALLS = {"x86_64": 251, "aarch64": 30, "armv7l": 314, "i686": 289}
+IOPRIO_GET_SYSCALLS = {"x86_64": 252, "aarch64": 31, "armv7l": 315, "i686": 290}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
+def _thread_ids(pid):
+    """
+    Linux applies niceness, I/O priority and affinity per thread, so threads that already
+    exist are changed one by one. Elsewhere the process id stands for the whole process.
+    """
+    try:
+        return [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+    except OSError:
+        return [pid]
+
+def _set_io_priority(tid, io_priority):
+    """Set the I/O priority of a thread (a process on Windows) through psutil, or the ioprio_set syscall on Linux."""
+    if psutil is not None and hasattr(psutil.Process, "ionice"):
+        if sys.platform == "win32":
+            psutil.Process(tid).ionice(psutil.IOPRIO_VERYLOW if io_priority == "idle" else psutil.IOPRIO_NORMAL)
+        elif io_priority == "idle":
+            psutil.Process(tid).ionice(psutil.IOPRIO_CLASS_IDLE)
+        else:
+            psutil.Process(tid).ionice(psutil.IOPRIO_CLASS_BE, 4)
+        return
+    _ioprio_set(tid, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT if io_priority == "idle" else (IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT) | 4)
+
+def _ioprio_syscall(syscalls, *args):
+    """Call ioprio_get or ioprio_set; returns None where the syscall is unavailable."""
+    syscall = syscalls.get(platform.machine())
+    if not sys.platform.startswith("linux") or syscall is None:
+        return None
+    libc = ctypes.CDLL(None, use_errno=True)
+    result = libc.syscall(syscall, IOPRIO_WHO_PROCESS, *args)
+    if result < 0:
+        raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    return result
+
+def _ioprio_set(tid, value):
+    _ioprio_syscall(IOPRIO_SET_SYSCALLS, tid, value)
+
+def _get_io_priority(tid):
+    """Read the I/O priority of a thread in the form _restore_io_priority takes."""
+    if psutil is not None and hasattr(psutil.Process, "ionice"):
+        return psutil.Process(tid).ionice()
+    return _ioprio_syscall(IOPRIO_GET_SYSCALLS, tid)
+
+def _restore_io_priority(tid, saved):
+    """Put back an I/O priority read by _get_io_priority."""
+    if saved is None:
+        return
+    if psutil is not None and hasattr(psutil.Process, "ionice"):
+        if sys.platform == "win32":
+            psutil.Process(tid).ionice(saved)
+        elif saved.ioclass in (psutil.IOPRIO_CLASS_RT, psutil.IOPRIO_CLASS_BE):
+            psutil.Process(tid).ionice(saved.ioclass, saved.value)
+        else:
+            psutil.Process(tid).ionice(saved.ioclass)
+        return
+    _ioprio_set(tid, saved)
+
+def _set_nice(tid, nice):
+    """Set the niceness of a thread, or the priority class of a process on Windows."""
+    if sys.platform == "win32":
+        if psutil is not None:
+            psutil.Process(tid).nice(psutil.BELOW_NORMAL_PRIORITY_CLASS if nice > 0 else psutil.NORMAL_PRIORITY_CLASS)
+        return
+    os.setpriority(os.PRIO_PROCESS, tid, nice)
+
+def _get_nice(tid):
+    """Read the niceness of a thread (the priority class of a process on Windows)."""
+    if sys.platform == "win32":
+        return psutil.Process(tid).nice() if psutil is not None else None
+    return os.getpriority(os.PRIO_PROCESS, tid)
+
+def _restore_nice(tid, saved):
+    """Put back a niceness read by _get_nice. Lowering it again needs administrator rights on Unix."""
+    if saved is None:
+        return
+    if sys.platform == "win32":
+        psutil.Process(tid).nice(saved)
+        return
+    os.setpriority(os.PRIO_PROCESS, tid, saved)
+
+def _set_affinity(tid, cpus):
+    """Pin a thread (a process where threads can't be pinned separately) to the given CPUs."""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(tid, cpus)
+    elif psutil is not None and hasattr(psutil.Process, "cpu_affinity"):
+        psutil.Process(tid).cpu_affinity(list(cpus))
+
+def _get_affinity(tid):
+    """Read the CPUs a thread may run on, or None where that is unknown."""
+    if hasattr(os, "sched_getaffinity"):
+        return os.sched_getaffinity(tid)
+    if psutil is not None and hasattr(psutil.Process, "cpu_affinity"):
+        return psutil.Process(tid).cpu_affinity()
+    return None
+
+def _restore_affinity(tid, saved):
+    if saved is not None:
+        _set_affinity(tid, saved)
+
+def _helper_pids():
+    """
+    Pids of multiprocessing's forkserver and resource tracker. They outlive every run and
+    the forkserver starts replacement workers, which would inherit a lowered priority.
+    """
+    pids = set()
+    try:
+        from multiprocessing import forkserver
+        pids.add(getattr(forkserver._forkserver, "_forkserver_pid", None))
+    except ImportError:
+        pass
+    try:
+        from multiprocessing import resource_tracker
+        pids.add(getattr(resource_tracker._resource_tracker, "_pid", None))
+    except ImportError:
+        pass
+    pids.discard(None)
+    return pids
+
+def _suspend_process(pid):
+    """Stop a worker process where it is, mid-page; psutil suspends it on Windows."""
+    if psutil is not None:
+        psutil.Process(pid).suspend()
+    else:
+        os.kill(pid, signal.SIGSTOP)
+
+def _resume_process(pid):
+    if psutil is not None:
+        psutil.Process(pid).resume()
+    else:
+        os.kill(pid, signal.SIGCONT)
+
+def _process_tree():
+    """This process and all its worker processes."""
+    if psutil is not None:
+        parent = psutil.Process()
+        return [parent.pid] + [child.pid for child in parent.children(recursive=True)]
+    if os.path.exists("/proc/self/stat"):
+        return [os.getpid()] + _proc_descendants(os.getpid())
+    return [os.getpid()]
+
+def _proc_usage(pid):
+    """Read (CPU seconds, resident bytes) of a process from /proc."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    resident = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    return cpu_seconds, resident
+
+def sample_usage():
+    """
+    Total the CPU time and resident memory of this process and its workers.
+
+    Returns:
+        tuple: (CPU seconds, resident bytes), or None if neither psutil nor /proc is available.
+    """
+    cpu_seconds, resident = 0.0, 0
+    if psutil is not None:
+        for pid in _process_tree():
+            try:
+                process = psutil.Process(pid)
+                times = process.cpu_times()
+                cpu_seconds += times.user + times.system
+                resident += process.memory_info().rss
+            except psutil.Error:
+                continue  # The worker exited between listing and reading it
+        return cpu_seconds, resident
+    if not os.path.exists("/proc/self/stat"):
+        return None
+    for pid in _process_tree():
+        try:
+            process_cpu, process_resident = _proc_usage(pid)
+        except (OSError, IndexError, ValueError):
+            continue
+        cpu_seconds += process_cpu
+        resident += process_resident
+    return cpu_seconds, resident
+
+def total_memory():
+    """Physical memory of the machine in bytes, or None if unknown."""
+    if psutil is not None:
+        return psutil.virtual_memory().total
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+class ResourceGovernor(threading.Thread):
+    """
+    Keeps a run from competing with the scanning software on the same PC.
+
+    On every profile change the governor sets the niceness, I/O priority and CPU affinity
+    of the worker threads and worker processes, and applies them to threads and workers
+    started later (recycled pool workers, shared-ring processes) as they appear. The main
+    thread (the GUI) and multiprocessing's helper processes are left alone. The original
+    settings are saved and put back on every profile change and on stop, so "full speed"
+    and later runs are not left throttled. While running it measures
+    the CPU and memory use of the whole process tree and pauses the job (see jobs.JobHandle)
+    to hold the CPU share under the cap, and while resident memory is above the ceiling.
+    A CPU throttle also suspends the worker processes for the length of the pause, so the
+    chunks they are in the middle of stop using the CPU too; worker threads finish their
+    current page.
+
+    The profile can be switched at any time with set_profile, for example from the GUI.
+    Raising priority back (a lower niceness) needs administrator rights on Unix; without
+    them the niceness of running workers stays lowered, which is counted in unrestored and
+    logged; those workers keep running at the lower priority until they are recycled.
+    """
+
+    def __init__(self, job, profile="background", interval=DEFAULT_GOVERNOR_INTERVAL):
+        """
+        Parameters:
+            job (jobs.JobHandle): The job to throttle.
+            profile (str or GovernorProfile): A name from PROFILES, or explicit limits.
+            interval (float): Seconds between measurements.
+        """
+        super().__init__(name="resource-governor", daemon=True)
+        self.job = job
+        self.interval = interval
+        self.throttled_seconds = 0.0
+        self.memory_holds = 0
+        self.unrestored = 0
+        self._saved = {}
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._adjusted = set()
+        self._memory_held = False
+        self._warned = set()
+        self.set_profile(profile)
+
+    def set_profile(self, profile):
+        """Switch to another profile and apply it to this process and its workers now."""
+        if isinstance(profile, str):
+            profile = PROFILES[profile]
+        with self._lock:
+            self.profile = profile
+        logger.info(f"Resource governor profile: CPU cap {profile.cpu_percent or 100}%, nice {profile.nice}, "
+                    f"I/O {profile.io_priority}, CPUs {profile.affinity or 'all'}, "
+                    f"memory ceiling {f'{profile.memory_percent}%' if profile.memory_percent else 'none'}.")
+        self._restore_priorities()
+        self._apply_priorities()
+
+    def _warn_once(self, setting, error):
+        if setting not in self._warned:
+            self._warned.add(setting)
+            logger.warning(f"Resource governor could not set {setting}: {str(error)}")
+
+    @staticmethod
+    def _changes(profile):
+        """The settings a profile changes as (name, getter, setter, restorer); "full speed" changes none."""
+        changes = []
+        if profile.nice:
+            changes.append(("niceness", _get_nice, lambda tid: _set_nice(tid, profile.nice), _restore_nice))
+        if profile.io_priority != "normal":
+            changes.append(("I/O priority", _get_io_priority,
+                            lambda tid: _set_io_priority(tid, profile.io_priority), _restore_io_priority))
+        if profile.affinity:
+            changes.append(("CPU affinity", _get_affinity, lambda tid: _set_affinity(tid, profile.affinity),
+                            _restore_affinity))
+        return changes
+
+    def _apply_priorities(self):
+        """Apply the profile's settings to worker threads that do not have them yet, saving the originals."""
+        with self._lock:
+            profile = self.profile
+            changes = self._changes(profile)
+            if not changes:
+                return
+            helpers = _helper_pids()
+            # On Linux the main thread's id is the process id; elsewhere the id stands for the whole process
+            tids = [tid for pid in _process_tree() if pid not in helpers for tid in _thread_ids(pid)
+                    if tid != os.getpid() and tid not in self._adjusted]
+            self._adjusted.update(tids)
+        for tid in tids:
+            for setting, get, apply, restore in changes:
+                try:
+                    original = get(tid)
+                    apply(tid)
+                    with self._lock:
+                        self._saved.setdefault(tid, {}).setdefault(setting, (restore, original))
+                except (OSError, ValueError) as e:
+                    if not isinstance(e, ProcessLookupError):  # The thread exited while being adjusted
+                        self._warn_once(setting, e)
+                except Exception as e:
+                    if psutil is not None and isinstance(e, psutil.Error):
+                        continue  # The worker exited while being adjusted
+                    raise
+
+    def _restore_priorities(self):
+        """Put back the original settings of every thread the governor changed."""
+        with self._lock:
+            saved, self._saved = self._saved, {}
+            self._adjusted = set()
+        for tid, settings in saved.items():
+            for setting, (restore, original) in settings.items():
+                try:
+                    restore(tid, original)
+                except ProcessLookupError:
+                    continue  # The thread or worker has exited
+                except (OSError, ValueError) as e:
+                    self.unrestored += 1
+                    self._warn_once(f"{setting} back", e)
+                except Exception as e:
+                    if psutil is not None and isinstance(e, psutil.NoSuchProcess):
+                        continue
+                    if psutil is not None and isinstance(e, psutil.Error):
+                        self.unrestored += 1
+                        continue
+                    raise
+
+    def run(self):
+        previous = sample_usage()
+        if previous is None:
+            logger.warning("Resource governor limits CPU and memory only with psutil on this platform.")
+            return
+        previous_time = time.perf_counter()
+        memory_total = total_memory()
+        cpus = os.cpu_count() or 1
+        while not self._stopped.wait(self.interval):
+            self._apply_priorities()
+            current, now = sample_usage(), time.perf_counter()
+            # Workers that exited take their CPU time with them, so a negative delta counts as zero
+            usage = max(0.0, current[0] - previous[0]) / ((now - previous_time) * cpus) * 100
+            previous, previous_time = current, now
+            profile = self.profile
+
+            if profile.memory_percent and memory_total:
+                ceiling = memory_total * profile.memory_percent / 100
+                if not self._memory_held and current[1] > ceiling:
+                    self._memory_held = True
+                    self.memory_holds += 1
+                    self.job.pause("governor-memory")
+                    logger.info(f"Resource governor: {current[1] / 2**20:.0f} MB resident exceeds the "
+                                f"{ceiling / 2**20:.0f} MB ceiling; holding new work.")
+                elif self._memory_held and current[1] < ceiling * MEMORY_RESUME_FRACTION:
+                    self._memory_held = False
+                    self.job.resume("governor-memory")
+            elif self._memory_held:
+                self._memory_held = False
+                self.job.resume("governor-memory")
+
+            if profile.cpu_percent and usage > profile.cpu_percent:
+                # Idle long enough that the average over interval + pause falls to the cap
+                pause = min(self.interval * (usage / profile.cpu_percent - 1), self.interval * MAX_THROTTLE_FACTOR)
+                logger.debug(f"Resource governor: CPU {usage:.0f}% over the {profile.cpu_percent}% cap; pausing {pause:.2f}s.")
+                self.job.pause("governor-cpu")
+                suspended = self._suspend_workers()
+                try:
+                    self._stopped.wait(pause)
+                finally:
+                    self._resume_workers(suspended)
+                    self.job.resume("governor-cpu")
+                self.throttled_seconds += pause
+                # The pause already brought the average down; measure the next interval on its own
+                previous, previous_time = sample_usage(), time.perf_counter()
+
+    def _suspend_workers(self):
+        """Suspend the worker processes (not this process or multiprocessing's helpers); returns their pids."""
+        helpers = _helper_pids()
+        suspended = []
+        for pid in _process_tree():
+            if pid == os.getpid() or pid in helpers:
+                continue
+            try:
+                _suspend_process(pid)
+                suspended.append(pid)
+            except ProcessLookupError:
+                continue  # The worker exited
+            except OSError as e:
+                self._warn_once("worker suspension", e)
+            except Exception as e:
+                if psutil is not None and isinstance(e, psutil.Error):
+                    continue
+                raise
+        return suspended
+
+    def _resume_workers(self, pids):
+        for pid in pids:
+            try:
+                _resume_process(pid)
+            except ProcessLookupError:
+                continue
+            except OSError as e:
+                self._warn_once("worker resumption", e)
+            except Exception as e:
+                if psutil is not None and isinstance(e, psutil.Error):
+                    continue
+                raise
+
+    def stop(self):
+        """Stop governing, release any hold on the job, restore the original priorities and log a summary."""
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+        self.job.resume("governor-cpu")
+        self.job.resume("governor-memory")
+        self._restore_priorities()
+        if self.unrestored:
+            logger.warning(f"Resource governor could not restore {self.unrestored} worker settings.")
+        logger.info(f"Resource governor throttled the run for {self.throttled_seconds:.1f}s "
+                    f"and held it {self.memory_holds} times for memory.")
@@ -13,13 +13,22 @@ from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import Font
 
-from processing import process_documents
+from processing import process_documents, PROCESSING_MODES
+from executors import default_worker_count, WarmWorkerPool
+from jobs import JobHandle
+from governor import ResourceGovernor, GOVERNOR_PROFILES
+from progress import PROGRESS_QUEUE_SIZE, post_final
+from journal import default_journal_path
+from archives import ARCHIVE_SUFFIXES, is_archive_path, strip_archive_suffix, exists, copy_file, close_handles
 
 import csv  # Needed for parsing the TSV log file
 import shutil  # Needed for copying files
 
 import logging  # Ensure logging is imported if not already
 
+# Selection logs streamed into the output folder when the sorted report is written during the run
+STREAMED_LOG_BASENAME = "Selection Log"
+
 class App:
     def __init__(self, root):
         self.root = root
@@ -30,8 +39,20 @@ class App:
         self.parent_folder = tk.StringVar()
         self.low_threshold = tk.DoubleVar(value=10.0)   # Default low threshold
         self.high_threshold = tk.DoubleVar(value=15.0)  # Default high threshold
+        self.export_mixed_raster = tk.BooleanVar(value=False)  # Export color crops for intermediate pages
+        self.resume_run = tk.BooleanVar(value=False)  # Resume from the checkpoint journal of an interrupted run
+        self.stream_sorted_log = tk.BooleanVar(value=False)  # Write the sorted log while the run is in progress
+        self.disk_order = tk.BooleanVar(value=False)  # Read files in on-disk order, for HDDs and USB drives
+        self.correct_orientation = tk.BooleanVar(value=False)  # Write upright copies of sideways pages
+        self.stage_locally = tk.BooleanVar(value=False)  # Copy JPGs from a network share to a local cache first
+        self.execution_mode = tk.StringVar(value="processes")  # Backend used for the analysis
+        self.max_workers = tk.IntVar(value=default_worker_count())  # Worker count for the pool backends
         self.processing_thread = None
-        self.progress_queue = queue.Queue()
+        self.progress_queue = queue.Queue(maxsize=PROGRESS_QUEUE_SIZE)  # Bounded; progress updates are coalesced
+        self.job = None  # Handle for cancelling or pausing the running job
+        self.resource_profile = tk.StringVar(value="full speed")  # "background" leaves room for the scanning software
+        self.governor = None  # Applies the resource profile to the running job
+        self.worker_pool = WarmWorkerPool(self.max_workers.get())  # Reused by every "processes" run
         
         # List to keep track of flagged files
         self.flagged_files = []
@@ -41,9 +62,16 @@ class App:
         
         # Initialize log entries
         self.log_entries = []  # To store log data
+
+        # Groups of byte-identical JPGs found during the last run
+        self.duplicate_groups = []
         
         # Create GUI components
         self.create_widgets()
+        
+        # Start the worker processes in the background so the first run begins immediately
+        threading.Thread(target=self.worker_pool.warm_up, daemon=True).start()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
     
     def create_widgets(self):
         # ---------------------------- Folder Selection ---------------------------- #
@@ -53,6 +81,7 @@ class App:
         ttk.Label(folder_frame, text="Parent Folder:").pack(side='left', padx=(0,5))
         ttk.Entry(folder_frame, textvariable=self.parent_folder, width=50).pack(side='left', fill='x', expand=True)
         ttk.Button(folder_frame, text="Select Folder", command=self.select_folder).pack(side='left', padx=(5,0))
+        ttk.Button(folder_frame, text="Select Archive", command=self.select_archive).pack(side='left', padx=(5,0))
         
         # ---------------------------- Thresholds ---------------------------- #
         threshold_frame = ttk.Frame(self.root)
@@ -66,6 +95,33 @@ class App:
         ttk.Label(threshold_frame, text="High Gray Threshold (%):").pack(side='left', padx=(0,5))
         ttk.Entry(threshold_frame, textvariable=self.high_threshold, width=10, validate='key', validatecommand=vcmd).pack(side='left')
         
+        # ---------------------------- Mixed Raster Option ---------------------------- #
+        options_frame = ttk.Frame(self.root)
+        options_frame.pack(padx=10, pady=5, fill='x')
+        
+        ttk.Checkbutton(options_frame, text="Export mixed raster (TIFF + color crops) for intermediate pages", variable=self.export_mixed_raster).pack(side='left')
+        ttk.Checkbutton(options_frame, text="Resume interrupted run", variable=self.resume_run).pack(side='left', padx=(15,0))
+        ttk.Checkbutton(options_frame, text="Stream sorted log", variable=self.stream_sorted_log).pack(side='left', padx=(15,0))
+        ttk.Checkbutton(options_frame, text="Disk order reads (HDD)", variable=self.disk_order).pack(side='left', padx=(15,0))
+        ttk.Checkbutton(options_frame, text="Correct orientation", variable=self.correct_orientation).pack(side='left', padx=(15,0))
+        ttk.Checkbutton(options_frame, text="Stage files locally", variable=self.stage_locally).pack(side='left', padx=(15,0))
+        
+        # ---------------------------- Execution Settings ---------------------------- #
+        execution_frame = ttk.Frame(self.root)
+        execution_frame.pack(padx=10, pady=5, fill='x')
+        
+        ttk.Label(execution_frame, text="Execution Mode:").pack(side='left', padx=(0,5))
+        ttk.Combobox(execution_frame, textvariable=self.execution_mode, values=PROCESSING_MODES, state='readonly', width=12).pack(side='left', padx=(0,15))
+        
+        ttk.Label(execution_frame, text="Workers:").pack(side='left', padx=(0,5))
+        ttk.Spinbox(execution_frame, textvariable=self.max_workers, from_=1, to=max(64, default_worker_count()), width=5).pack(side='left')
+        
+        ttk.Label(execution_frame, text="Priority:").pack(side='left', padx=(15,5))
+        profile_box = ttk.Combobox(execution_frame, textvariable=self.resource_profile, values=GOVERNOR_PROFILES, state='readonly', width=12)
+        profile_box.pack(side='left')
+        # Switching takes effect immediately, also while a run is in progress
+        profile_box.bind("<<ComboboxSelected>>", self.change_resource_profile)
+        
         # ---------------------------- Run Button ---------------------------- #
         run_frame = ttk.Frame(self.root)
         run_frame.pack(padx=10, pady=10, fill='x')
@@ -73,6 +129,12 @@ class App:
         self.run_button = ttk.Button(run_frame, text="Run Script", command=self.run_script)
         self.run_button.pack(side='left')
         
+        self.pause_button = ttk.Button(run_frame, text="Pause", command=self.toggle_pause, state='disabled')
+        self.pause_button.pack(side='left', padx=(5,0))
+        
+        self.cancel_button = ttk.Button(run_frame, text="Cancel", command=self.cancel_run, state='disabled')
+        self.cancel_button.pack(side='left', padx=(5,0))
+        
         # ---------------------------- Progress Bar ---------------------------- #
         progress_frame = ttk.Frame(self.root)
         progress_frame.pack(padx=10, pady=10, fill='x')
@@ -126,6 +188,26 @@ class App:
         if folder_selected:
             self.parent_folder.set(folder_selected)
     
+    def select_archive(self):
+        """Select a ZIP or TAR archive holding the JPG and TIF folders; it is processed without extracting it."""
+        archive_selected = filedialog.askopenfilename(
+            filetypes=[("ZIP/TAR archives", " ".join(f"*{suffix}" for suffix in ARCHIVE_SUFFIXES)), ("All files", "*.*")]
+        )
+        if archive_selected:
+            self.parent_folder.set(archive_selected)
+    
+    def output_folder(self):
+        """
+        Folder for the files a run writes (streamed logs, mixed raster): the parent
+        folder, or for an archive a folder of the same name next to it, e.g. "Box 12" for "Box 12.zip".
+        """
+        parent = self.parent_folder.get()
+        if not is_archive_path(parent):
+            return parent
+        folder = strip_archive_suffix(parent)
+        os.makedirs(folder, exist_ok=True)
+        return folder
+    
     def run_script(self):
         if not self.parent_folder.get():
             messagebox.showerror("Error", "Please select a parent folder.")
@@ -139,6 +221,13 @@ class App:
         # Disable the Run button to prevent multiple runs
         self.run_button.config(state='disabled')
         
+        # Enable job controls for this run
+        self.job = JobHandle()
+        self.governor = ResourceGovernor(self.job, self.resource_profile.get())
+        self.governor.start()
+        self.pause_button.config(state='normal', text="Pause")
+        self.cancel_button.config(state='normal')
+        
         # Clear previous logs
         self.log_text.configure(state='normal')
         self.log_text.delete(1.0, tk.END)
@@ -159,11 +248,14 @@ class App:
         
         # Clear previous log entries
         self.log_entries = []
+        self.duplicate_groups = []
         
         # Start the processing in a separate thread
+        # A daemon, so closing the window mid-run does not leave it waiting on the GUI queue
         self.processing_thread = threading.Thread(
             target=self.process,
-            args=()
+            args=(),
+            daemon=True
         )
         self.processing_thread.start()
         
@@ -173,6 +265,17 @@ class App:
     def process(self):
         input_dir_jpg = os.path.join(self.parent_folder.get(), "JPG")
         input_dir_tiff = os.path.join(self.parent_folder.get(), "TIF")
+        try:
+            output_folder = self.output_folder()
+        except OSError as e:
+            # For example a read-only share next to the archive; the run would have nowhere to write
+            logging.error(f"Could not create the output folder: {str(e)}")
+            post_final(self.progress_queue, ("error", f"Could not create the output folder: {str(e)}"))
+            return
+        mixed_raster_dir = os.path.join(output_folder, "Mixed Raster") if self.export_mixed_raster.get() else None
+        orientation_dir = os.path.join(output_folder, "Upright") if self.correct_orientation.get() else None
+        stream_sorted_log = self.stream_sorted_log.get()
+        log_base = os.path.join(output_folder, STREAMED_LOG_BASENAME)
         
         # Call the processing function without specifying log file paths
         process_documents(
@@ -180,9 +283,77 @@ class App:
             input_dir_tiff,
             self.progress_queue,
             self.low_threshold.get(),
-            self.high_threshold.get()
+            self.high_threshold.get(),
+            mixed_raster_dir=mixed_raster_dir,
+            execution_mode=self.execution_mode.get(),
+            max_workers=self.max_workers.get(),
+            job=self.job,
+            journal_path=default_journal_path(self.parent_folder.get()),
+            resume=self.resume_run.get(),
+            executor=self.worker_pool.get(self.max_workers.get()) if self.execution_mode.get() == "processes" else None,
+            sorted_output=stream_sorted_log,
+            tsv_path=f"{log_base}.tsv" if stream_sorted_log else None,
+            excel_path=f"{log_base}.xlsx" if stream_sorted_log else None,
+            dispatch="physical" if self.disk_order.get() else None,
+            orientation_dir=orientation_dir,
+            staging={} if self.stage_locally.get() else None
         )
     
+    def toggle_pause(self):
+        """Pause the running job, or resume it if it is paused."""
+        if not self.job:
+            return
+        # The governor may hold the job too; only the user's own pause decides the toggle
+        if self.job.is_held("user"):
+            self.job.resume()
+            self.pause_button.config(text="Pause")
+            status = "Resumed."
+        else:
+            self.job.pause()
+            self.pause_button.config(text="Resume")
+            status = "Pausing after the files in progress..."
+        self.log_text.configure(state='normal')
+        self.log_text.insert(tk.END, f"{status}\n")
+        self.log_text.configure(state='disabled')
+    
+    def cancel_run(self):
+        """Cancel the running job; files in progress finish and partial results are kept."""
+        if not self.job:
+            return
+        self.job.cancel()
+        self.pause_button.config(state='disabled')
+        self.cancel_button.config(state='disabled')
+        self.log_text.configure(state='normal')
+        self.log_text.insert(tk.END, "Cancelling after the files in progress...\n")
+        self.log_text.configure(state='disabled')
+    
+    def change_resource_profile(self, event=None):
+        """Apply the selected resource profile to the running job."""
+        if self.governor and self.governor.is_alive():
+            self.governor.set_profile(self.resource_profile.get())
+            self.log_text.configure(state='normal')
+            self.log_text.insert(tk.END, f"Priority set to {self.resource_profile.get()}.\n")
+            self.log_text.configure(state='disabled')
+    
+    def end_job_controls(self):
+        """Disable the job controls and allow a new run."""
+        if self.governor:
+            # Settings that could not be put back are logged by the governor; the warm pool is kept
+            self.governor.stop()
+            self.governor = None
+        self.pause_button.config(state='disabled', text="Pause")
+        self.cancel_button.config(state='disabled')
+        self.run_button.config(state='normal')
+    
+    def on_close(self):
+        """Stop the running job and the worker pool, then close the window."""
+        if self.job:
+            self.job.cancel()
+        if self.governor:
+            self.governor.stop()
+        self.worker_pool.shutdown()
+        self.root.destroy()
+    
     def process_queue(self):
         try:
             while True:
@@ -196,24 +367,43 @@ class App:
                     if total > 0:
                         progress_value = (processed / total) * 100
                         self.progress['value'] = progress_value
-                        self.progress_label.config(text=f"{progress_value:.2f}%")
+                        label = f"{progress_value:.2f}%"
+                        if len(message) > 3:
+                            # Aggregate counters carried with coalesced updates
+                            label += f" ({processed}/{total} files, {message[3]['flagged']} flagged)"
+                        self.progress_label.config(text=label)
+                elif message[0] == "entries":
+                    # Log entries streamed in final order by a sorted run
+                    self.log_entries.extend(message[1])
+                    self.log_text.configure(state='normal')
+                    for _, selected_documents, gray_pct_str, selected_format, flagged in message[1]:
+                        self.log_text.insert(tk.END, f"{selected_documents}: {selected_format} ({gray_pct_str}%)\n")
+                    self.log_text.configure(state='disabled')
                 elif message[0] == "error":
                     self.log_text.configure(state='normal')
                     self.log_text.insert(tk.END, f"Error: {message[1]}\n")
                     self.log_text.configure(state='disabled')
+                    self.end_job_controls()
                     messagebox.showerror("Error", message[1])
-                elif message[0] == "complete":
+                elif message[0] in ("complete", "cancelled"):
                     completion_message = message[1]
                     flagged_count = message[2]
                     log_entries_sorted = message[3]  # Retrieve log data
+                    duplicate_groups = message[4]  # Groups of byte-identical JPGs
                     
                     self.log_text.configure(state='normal')
                     self.log_text.insert(tk.END, f"{completion_message}\nFlagged Files Count: {flagged_count}\n")
+                    if duplicate_groups:
+                        self.log_text.insert(tk.END, f"Duplicate Groups Found: {len(duplicate_groups)}\n")
+                        for group in duplicate_groups:
+                            self.log_text.insert(tk.END, f"Duplicates: {', '.join(group)}\n")
                     self.log_text.configure(state='disabled')
-                    messagebox.showinfo("Complete", f"{completion_message}\nFlagged Files Count: {flagged_count}")
+                    title = "Complete" if message[0] == "complete" else "Cancelled"
+                    messagebox.showinfo(title, f"{completion_message}\nFlagged Files Count: {flagged_count}")
                     
                     # Store the log entries for downloading
                     self.log_entries = log_entries_sorted
+                    self.duplicate_groups = duplicate_groups
                     
                     # Enable the Download Log Buttons
                     self.download_tsv_button.config(state='normal')
@@ -226,7 +416,7 @@ class App:
                     self.download_selected_button.config(state='normal')
                     
                     # Re-enable the Run button
-                    self.run_button.config(state='normal')
+                    self.end_job_controls()
                     
                     # Populate the flagged_files list by reading the log entries
                     self.populate_flagged_files()
@@ -236,7 +426,8 @@ class App:
                     
         except queue.Empty:
             pass
-        if self.processing_thread and self.processing_thread.is_alive():
+        # Keep polling until the worker has exited and its final messages are drained
+        if (self.processing_thread and self.processing_thread.is_alive()) or not self.progress_queue.empty():
             self.root.after(100, self.process_queue)
     
     def populate_flagged_files(self):
@@ -253,7 +444,7 @@ class App:
                     for ext in possible_extensions:
                         filename = document + ext
                         filepath = os.path.join(input_dir_tiff, filename)
-                        if os.path.exists(filepath):
+                        if exists(filepath):
                             self.flagged_files.append(filepath)
                             break
                     else:
@@ -282,7 +473,7 @@ class App:
                     for ext in possible_extensions:
                         filename = document + ext
                         filepath = os.path.join(input_dir_jpg, filename)
-                        if os.path.exists(filepath):
+                        if exists(filepath):
                             self.selected_files.append(filepath)
                             break
                 elif selected_format in ["TIFF", "TIF (Intermediate)"]:
@@ -291,7 +482,7 @@ class App:
                     for ext in possible_extensions:
                         filename = document + ext
                         filepath = os.path.join(input_dir_tiff, filename)
-                        if os.path.exists(filepath):
+                        if exists(filepath):
                             self.selected_files.append(filepath)
                             break
                 # If needed, handle other formats
@@ -377,6 +568,17 @@ class App:
                             pass
                     adjusted_width = (max_length + 2)
                     ws.column_dimensions[column_letter].width = adjusted_width
+
+                # List groups of byte-identical JPGs on their own sheet
+                if self.duplicate_groups:
+                    dup_ws = wb.create_sheet(title="Duplicate Groups")
+                    for col_num, header in enumerate(['Group', 'Representative', 'Duplicates'], 1):
+                        cell = dup_ws.cell(row=1, column=col_num, value=header)
+                        cell.font = header_font
+                    for row_num, group in enumerate(self.duplicate_groups, start=2):
+                        dup_ws.cell(row=row_num, column=1, value=row_num - 1)
+                        dup_ws.cell(row=row_num, column=2, value=group[0])
+                        dup_ws.cell(row=row_num, column=3, value=', '.join(group[1:]))
     
                 # Save the workbook
                 wb.save(destination_path)
@@ -477,10 +679,11 @@ class App:
         
         for filepath in self.flagged_files:
             try:
-                shutil.copy2(filepath, destination_folder)
+                copy_file(filepath, destination_folder)
                 copied_count += 1
             except Exception as e:
                 failed_files.append((filepath, str(e)))
+        close_handles()
         
         # Notify the user upon completion
         if failed_files:
@@ -497,10 +700,11 @@ class App:
         
         for filepath in self.selected_files:
             try:
-                shutil.copy2(filepath, destination_folder)
+                copy_file(filepath, destination_folder)
                 copied_count += 1
             except Exception as e:
                 failed_files.append((filepath, str(e)))
+        close_handles()
         
         # Notify the user upon completion
         if failed_files:
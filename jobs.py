@@ -0,0 +1,65 @@
+# jobs.py
+
+import threading
+
+class JobHandle:
+    """
+    Handle for controlling a running job from another thread. Cancel, pause and resume are
+    cooperative: the job checks the handle between files and between pipeline stages,
+    finishes the work already in flight, and keeps the results produced so far.
+
+    Pauses are held per reason, so the user's pause and a throttle (see governor) do not
+    undo each other: the job runs again only once every reason has been resumed.
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self._holds = set()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """Stop the job after the work already in flight. Also wakes a paused job."""
+        self._cancelled.set()
+        self._running.set()
+
+    def pause(self, reason="user"):
+        """Stop starting new work until resume() with the same reason, or cancel(), is called."""
+        with self._lock:
+            self._holds.add(reason)
+            if not self._cancelled.is_set():
+                self._running.clear()
+
+    def resume(self, reason="user"):
+        """Release a pause; the job continues once no other reason holds it."""
+        with self._lock:
+            self._holds.discard(reason)
+            if not self._holds:
+                self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        """True while any reason holds the job, including throttles."""
+        return not self._running.is_set()
+
+    def is_held(self, reason="user"):
+        """True while the given reason holds the job, e.g. to toggle the user's own pause."""
+        with self._lock:
+            return reason in self._holds
+
+    def wait_while_paused(self, timeout=None):
+        """
+        Block while the job is paused.
+
+        Parameters:
+            timeout (float): Maximum number of seconds to wait, or None to wait until resumed or cancelled.
+
+        Returns:
+            bool: True if the job is no longer paused, False if the timeout expired first.
+        """
+        return self._running.wait(timeout)
@@ -0,0 +1,172 @@
+# journal.py
+
+import os
+import json
+import time
+import hashlib
+import logging
+
+logger = logging.getLogger()
+
+# Format version written in the journal header
+JOURNAL_VERSION = 1
+# Records are fsync'd after this many appends or this many seconds, whichever comes first
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_FLUSH_INTERVAL = 2.0
+# Folder under the user's local application data holding journals kept outside the scanned folders
+JOURNAL_APP_FOLDER = os.path.join("JPG and TIFF Processor", "journals")
+
+def default_journal_path(input_path):
+    """
+    Path of the journal for an input folder or archive, in the user's local application
+    data (%LOCALAPPDATA% on Windows, ~/.local/state elsewhere). Keeping journals there lets
+    runs on read-only shares and archive drives be resumed and leaves delivery folders clean.
+
+    Parameters:
+        input_path (str): The parent folder or archive being processed.
+
+    Returns:
+        str: The journal file path; CheckpointJournal.open creates its folder.
+    """
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".local", "state")
+    folder = os.path.join(base, JOURNAL_APP_FOLDER)
+    key = hashlib.sha1(os.path.abspath(input_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(folder, f"{key}.jsonl")
+
+class CheckpointJournal:
+    """
+    Append-only journal of completed document decisions, one JSON object per line.
+
+    The first line is a header describing the run (folders and thresholds). Records are
+    written through a buffered file and fsync'd in batches, so a crash loses at most the
+    last batch. A torn final line from a crash is ignored when the journal is loaded.
+    Once a run completes the journal is deleted (see discard), so only interrupted runs
+    leave one behind.
+    """
+
+    def __init__(self, path, run_info, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        """
+        Parameters:
+            path (str): File path of the journal.
+            run_info (dict): JSON-serializable description of the run; a journal written
+                             for a different run is never resumed.
+            batch_size (int): Number of records between fsyncs.
+            flush_interval (float): Maximum number of seconds between fsyncs.
+        """
+        self.path = path
+        self.run_info = dict(run_info, journal=JOURNAL_VERSION)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._file = None
+        self._valid_length = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def open(self, resume=False):
+        """
+        Open the journal for appending.
+
+        Parameters:
+            resume (bool): Keep the records of a previous run with the same run_info.
+                           Otherwise (or if the existing journal is for another run) start a new journal.
+
+        Returns:
+            list: The records (dicts) already in the journal, empty when starting fresh.
+        """
+        records = self._load() if resume else None
+        if records is None:
+            records = []
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._file.write(json.dumps(self.run_info) + "\n")
+            self.sync()
+        else:
+            # Cut off a torn final record so new records start on a fresh line
+            with open(self.path, 'r+b') as f:
+                f.truncate(self._valid_length)
+            self._file = open(self.path, 'a', encoding='utf-8')
+            logger.info(f"Resuming from journal '{self.path}' with {len(records)} completed records.")
+        return records
+
+    def _load(self):
+        """Read the records of an existing journal, or return None if it is missing or for another run."""
+        if not os.path.exists(self.path):
+            return None
+
+        records = []
+        with open(self.path, 'rb') as f:
+            lines = f.read().split(b"\n")
+        try:
+            header = json.loads(lines[0].decode('utf-8'))
+        except ValueError:
+            logger.warning(f"Journal '{self.path}' has an unreadable header. Starting a new journal.")
+            return None
+        if header != self.run_info:
+            logger.warning(f"Journal '{self.path}' belongs to a different run. Starting a new journal.")
+            return None
+
+        # Every complete record ends with a newline, so the text after the last one was torn by a crash
+        if lines[-1]:
+            logger.warning(f"Ignoring incomplete record at the end of journal '{self.path}'.")
+        self._valid_length = len(lines[0]) + 1
+        for line in lines[1:-1]:
+            try:
+                records.append(json.loads(line.decode('utf-8')))
+            except ValueError:
+                logger.warning(f"Ignoring unreadable record and everything after it in journal '{self.path}'.")
+                break
+            self._valid_length += len(line) + 1
+        return records
+
+    def append(self, record):
+        """
+        Append a record, fsyncing once the current batch is full or old enough.
+
+        Parameters:
+            record (dict): JSON-serializable record.
+        """
+        self._file.write(json.dumps(record) + "\n")
+        self._unsynced += 1
+        if self._unsynced >= self.batch_size or time.monotonic() - self._last_sync >= self.flush_interval:
+            self.sync()
+
+    def sync(self):
+        """Flush buffered records and fsync them to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        """Sync and close the journal. A failing sync is logged, since the run's results do not depend on it."""
+        if self._file is not None:
+            try:
+                self.sync()
+            except OSError as e:
+                logger.warning(f"Could not sync journal '{self.path}': {str(e)}")
+            self.abandon()
+
+    def abandon(self):
+        """Close the journal without syncing, for example after a write error; later closes do nothing."""
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass  # The buffered records are lost either way
+            self._file = None
+
+    def discard(self):
+        """Close and delete the journal, once the run it protects has completed."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not delete journal '{self.path}' of a completed run: {str(e)}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,173 @@
+# lanes.py
+
+import time
+import threading
+import logging
+from collections import deque
+from concurrent.futures import Executor, Future, wait as wait_futures
+
+logger = logging.getLogger()
+
+# Work lanes, highest priority first
+INTERACTIVE = "interactive"
+BATCH = "batch"
+LANES = (INTERACTIVE, BATCH)
+# Interactive calls dispatched in a row while batch work waits before one batch call goes through
+DEFAULT_INTERACTIVE_BURST = 8
+# Batch work older than this is dispatched next even while interactive work is queued
+DEFAULT_BATCH_MAX_WAIT = 10.0
+
+class PriorityExecutor(Executor):
+    """
+    Two-lane front end for a shared worker pool. Calls wait in this object's own queues and
+    are handed to the pool only while fewer than max_in_flight are running there, so the
+    pool never holds a backlog: an interactive call (for example a QC thumbnail) waits for
+    one running call to finish rather than for every batch chunk queued before it.
+
+    The interactive lane goes first. Batch work is protected from starvation: after
+    interactive_burst interactive calls in a row, or once the oldest batch call has waited
+    batch_max_wait seconds, the next batch call is dispatched.
+    """
+
+    def __init__(self, executor, max_in_flight, interactive_burst=DEFAULT_INTERACTIVE_BURST,
+                 batch_max_wait=DEFAULT_BATCH_MAX_WAIT):
+        """
+        Parameters:
+            executor (concurrent.futures.Executor): The shared pool; it is not shut down by this object.
+            max_in_flight (int): Calls running in the pool at once, normally its worker count.
+            interactive_burst (int): Interactive calls dispatched in a row before a waiting batch call.
+            batch_max_wait (float): Seconds after which a waiting batch call goes first.
+        """
+        self.executor = executor
+        self.max_in_flight = max(1, max_in_flight)
+        self.interactive_burst = interactive_burst
+        self.batch_max_wait = batch_max_wait
+        self.dispatched = {lane: 0 for lane in LANES}
+        self._queues = {lane: deque() for lane in LANES}
+        self._in_flight = 0
+        self._burst = 0
+        self._shutdown = False
+        self._lock = threading.Lock()
+        # Notified when the last call in the pool finishes and none is queued
+        self._idle = threading.Condition(self._lock)
+
+    def lane(self, name):
+        """Return an executor that submits to one lane, for code that takes a plain executor."""
+        if name not in LANES:
+            raise ValueError(f"Unknown lane '{name}'. Expected one of: {', '.join(LANES)}.")
+        return LaneExecutor(self, name)
+
+    def submit(self, fn, /, *args, lane=BATCH, **kwargs):
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            self._queues[lane].append((time.monotonic(), future, fn, args, kwargs))
+        self._dispatch()
+        return future
+
+    def _next_call(self):
+        """Pick the next queued call according to the lane rules. Called with the lock held."""
+        interactive, batch = self._queues[INTERACTIVE], self._queues[BATCH]
+        batch_due = batch and (
+            self._burst >= self.interactive_burst or time.monotonic() - batch[0][0] >= self.batch_max_wait
+        )
+        if interactive and not batch_due:
+            self._burst += 1
+            return INTERACTIVE, interactive.popleft()
+        if batch:
+            self._burst = 0
+            return BATCH, batch.popleft()
+        return None, None
+
+    def _dispatch(self):
+        """Hand queued calls to the pool while it has free workers."""
+        while True:
+            with self._lock:
+                if self._in_flight >= self.max_in_flight:
+                    return
+                lane, call = self._next_call()
+                if call is None:
+                    return
+                _, future, fn, args, kwargs = call
+                if not future.set_running_or_notify_cancel():
+                    continue  # Cancelled while queued
+                self._in_flight += 1
+                self.dispatched[lane] += 1
+            try:
+                inner = self.executor.submit(fn, *args, **kwargs)
+            except BaseException as e:
+                with self._lock:
+                    self._in_flight -= 1
+                future.set_exception(e)
+                continue
+            inner.add_done_callback(lambda inner, future=future: self._finished(inner, future))
+
+    def _is_idle(self):
+        """Whether no call is running or waiting to run. Called with the lock held."""
+        return not self._in_flight and all(
+            future.cancelled() for queue in self._queues.values() for _, future, _, _, _ in queue
+        )
+
+    def _finished(self, inner, future):
+        with self._lock:
+            self._in_flight -= 1
+        if inner.cancelled():
+            future.set_exception(RuntimeError("The worker pool cancelled the call."))
+        elif inner.exception() is not None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(inner.result())
+        with self._lock:
+            if self._is_idle():
+                self._idle.notify_all()
+        self._dispatch()
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        """
+        Stop accepting calls. With cancel_futures, queued calls are cancelled; calls already
+        in the pool finish. With wait, return only once no call is queued or running. The
+        shared pool itself keeps running.
+        """
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                for queue in self._queues.values():
+                    for _, future, _, _, _ in queue:
+                        future.cancel()
+                    queue.clear()
+            if wait:
+                self._idle.wait_for(self._is_idle)
+
+class LaneExecutor(Executor):
+    """
+    One lane of a PriorityExecutor. Shutting it down cancels (with cancel_futures) or waits
+    for (with wait) the lane's own calls only, so a finished batch run does not stop
+    interactive work or the shared pool.
+    """
+
+    def __init__(self, scheduler, lane):
+        self.scheduler = scheduler
+        self.lane = lane
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = self.scheduler.submit(fn, *args, lane=self.lane, **kwargs)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            futures = list(self._futures)
+        if cancel_futures:
+            for future in futures:
+                future.cancel()
+        if wait:
+            wait_futures(futures)
@@ -0,0 +1,350 @@
+# orientation.py
+
+import os
+import struct
+import cv2
+import numpy as np
+import logging
+
+from archives import read_bytes
+
+logger = logging.getLogger()
+
+try:
+    import pytesseract
+except ImportError:  # OSD fallback is optional; the fast estimator works without it
+    pytesseract = None
+
+# Longest side of the binarized page used by the fast estimator
+ESTIMATOR_MAX_SIDE = 1024
+# Longest side of the image handed to tesseract OSD for low-confidence pages
+OSD_MAX_SIDE = 1600
+# Pages estimated with at least this confidence skip tesseract OSD
+CONFIDENCE_THRESHOLD = 0.6
+# Minimum number of text lines needed before the up/down cue is trusted
+MIN_TEXT_LINES = 3
+# EXIF/TIFF Orientation tag and its values for the clockwise rotation a viewer applies to show the page
+ORIENTATION_TAG = 0x0112
+ORIENTATION_BY_ROTATION = {0: 1, 90: 6, 180: 3, 270: 8}
+
+def downscale(image, max_side):
+    """
+    Shrink an image so its longer side is at most max_side pixels.
+
+    Parameters:
+        image (numpy.ndarray): The image to shrink.
+        max_side (int): Maximum length of the longer side.
+
+    Returns:
+        numpy.ndarray: The downscaled image, or the original if it is already small enough.
+    """
+    height, width = image.shape[:2]
+    scale = max_side / float(max(height, width))
+    if scale >= 1.0:
+        return image
+    return cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+
+def binarize_for_orientation(gray_image, max_side=ESTIMATOR_MAX_SIDE):
+    """
+    Downsample and binarize a grayscale page so that ink pixels are 1 and paper is 0.
+
+    Parameters:
+        gray_image (numpy.ndarray): Grayscale page image.
+        max_side (int): Longest side of the binarized page.
+
+    Returns:
+        numpy.ndarray: uint8 array of 0/1 values.
+    """
+    small = downscale(gray_image, max_side)
+    _, ink = cv2.threshold(small, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return ink
+
+def _line_direction(ink):
+    """
+    Compare the row and column projection profiles. Horizontal text lines make the row
+    profile alternate strongly between lines and gaps, so it has the higher variance.
+
+    Returns:
+        tuple: (is_horizontal, confidence between 0 and 1)
+    """
+    row_variance = float(np.var(ink.mean(axis=1)))
+    column_variance = float(np.var(ink.mean(axis=0)))
+    total = row_variance + column_variance
+    if total == 0:
+        return True, 0.0
+    horizontal_share = row_variance / total
+    return horizontal_share >= 0.5, abs(horizontal_share - 0.5) * 2
+
+def _upright_share(ink):
+    """
+    Measure how much ink sits above the x-height band compared with below the baseline,
+    summed over every horizontal text line. Latin text has more ascenders than descenders,
+    so upright pages have more ink above the band.
+
+    Returns:
+        tuple: (share of ascender ink between 0 and 1, number of text lines used)
+    """
+    profile = ink.sum(axis=1).astype(np.float64)
+    if not profile.any():
+        return 0.5, 0
+
+    in_line = profile > 0.05 * profile.max()
+    # Boundaries of runs of consecutive text rows
+    edges = np.diff(np.concatenate(([0], in_line.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    ascender_ink = 0.0
+    descender_ink = 0.0
+    line_count = 0
+    for start, end in zip(starts, ends):
+        if end - start < 4:
+            continue
+        line = profile[start:end]
+        core = np.flatnonzero(line >= 0.6 * line.max())
+        ascender_ink += line[:core[0]].sum()
+        descender_ink += line[core[-1] + 1:].sum()
+        line_count += 1
+
+    total = ascender_ink + descender_ink
+    if total == 0:
+        return 0.5, line_count
+    return ascender_ink / total, line_count
+
+def estimate_orientation(gray_image, max_side=ESTIMATOR_MAX_SIDE):
+    """
+    Estimate page orientation from projection profiles and text-line direction on a
+    downsampled binarized page.
+
+    Parameters:
+        gray_image (numpy.ndarray): Grayscale page image.
+        max_side (int): Longest side of the binarized page.
+
+    Returns:
+        tuple: (rotation, confidence) where rotation is the clockwise correction in degrees
+               (0, 90, 180 or 270, the same convention as tesseract's "Rotate:") and
+               confidence is between 0 and 1.
+    """
+    ink = binarize_for_orientation(gray_image, max_side)
+    is_horizontal, direction_confidence = _line_direction(ink)
+
+    if is_horizontal:
+        upright_share, line_count = _upright_share(ink)
+        rotation = 0 if upright_share >= 0.5 else 180
+    else:
+        # Turn the lines horizontal and check which way up they read
+        upright_share, line_count = _upright_share(cv2.rotate(ink, cv2.ROTATE_90_CLOCKWISE))
+        rotation = 90 if upright_share >= 0.5 else 270
+
+    if line_count < MIN_TEXT_LINES:
+        return rotation, 0.0
+    # Character spacing makes the column profile vary too, so a 62/38 variance split already
+    # means clear text lines; likewise a 62/38 ascender to descender split is a confident call
+    direction_confidence = min(1.0, direction_confidence * 4)
+    updown_confidence = min(1.0, abs(upright_share - 0.5) * 4)
+    return rotation, float(min(direction_confidence, updown_confidence))
+
+def osd_rotation(gray_image, max_side=OSD_MAX_SIDE):
+    """
+    Ask tesseract OSD for the page rotation, using a downscaled copy of the page.
+
+    Parameters:
+        gray_image (numpy.ndarray): Grayscale page image.
+        max_side (int): Longest side of the image passed to tesseract.
+
+    Returns:
+        int: The clockwise correction in degrees, or None if OSD is unavailable or fails.
+    """
+    if pytesseract is None:
+        logger.warning("pytesseract is not installed; skipping OSD fallback.")
+        return None
+    try:
+        ocr_result = pytesseract.image_to_osd(downscale(gray_image, max_side))
+        return int(ocr_result.split('\nRotate: ')[1].split('\n')[0])
+    except Exception as e:
+        logger.error(f"Exception while running tesseract OSD: {str(e)}")
+        return None
+
+def detect_rotation(gray_image, confidence_threshold=CONFIDENCE_THRESHOLD, image_name="image"):
+    """
+    Determine the clockwise correction for a page. The fast estimator handles confident
+    pages; only low-confidence pages go to tesseract OSD. A page is only turned on a
+    confident estimate or an OSD answer: without OSD, low-confidence pages are left as they are.
+
+    Parameters:
+        gray_image (numpy.ndarray): Grayscale page image.
+        confidence_threshold (float): Minimum estimator confidence to skip OSD.
+        image_name (str): Name used in log messages.
+
+    Returns:
+        int: The clockwise correction in degrees (0, 90, 180 or 270).
+    """
+    rotation, confidence = estimate_orientation(gray_image)
+    if confidence >= confidence_threshold:
+        logger.debug(f"Estimated rotation {rotation} for '{image_name}' with confidence {confidence:.2f}.")
+        return rotation
+
+    logger.info(f"Low orientation confidence ({confidence:.2f}) for '{image_name}'; falling back to OSD.")
+    osd_result = osd_rotation(gray_image)
+    if osd_result is None:
+        logger.info(f"Leaving '{image_name}' as it is; its orientation is uncertain.")
+        return 0
+    return osd_result
+
+def correct_orientation(image_path, output_path, confidence_threshold=CONFIDENCE_THRESHOLD):
+    """
+    Detect the orientation of an image file and, if it is confidently not upright, write an
+    upright copy of it (see rotate_image_file). The image file itself is not changed.
+
+    Parameters:
+        image_path (str): The file path to the image.
+        output_path (str): Where to write the upright copy.
+        confidence_threshold (float): Minimum estimator confidence to skip OSD.
+
+    Returns:
+        int: The clockwise correction applied in degrees, or None if the image couldn't be processed.
+    """
+    try:
+        gray_image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if gray_image is None:
+            logger.error(f"Error reading image: {image_path}")
+            return None
+
+        rotation = detect_rotation(gray_image, confidence_threshold, image_name=image_path)
+        if rotation:
+            rotate_image_file(image_path, rotation, output_path)
+            logger.info(f"Wrote '{image_path}' rotated by {rotation} degrees to '{output_path}'.")
+        return rotation
+    except Exception as e:
+        logger.error(f"Exception while correcting orientation for '{image_path}': {str(e)}")
+        return None
+
+def compose_orientation(orientation, rotation):
+    """
+    Return the Orientation tag value that shows an image rotated clockwise by rotation
+    degrees further than the given tag value does.
+
+    Raises:
+        ValueError: If the tag describes a mirrored image.
+    """
+    current = {value: degrees for degrees, value in ORIENTATION_BY_ROTATION.items()}.get(orientation)
+    if current is None:
+        raise ValueError(f"Orientation {orientation} is mirrored or invalid.")
+    return ORIENTATION_BY_ROTATION[(current + rotation) % 360]
+
+def _ifd_entries(data, start, ifd):
+    """Return the byte order and the (tag, type, count, value field position) entries of a TIFF IFD."""
+    order = {b"II": "<", b"MM": ">"}.get(bytes(data[start:start + 2]))
+    if order is None or struct.unpack_from(order + "H", data, start + 2)[0] != 42:
+        raise ValueError("Not a classic TIFF structure.")
+    position = start + ifd
+    count = struct.unpack_from(order + "H", data, position)[0]
+    return order, [struct.unpack_from(order + "HHI", data, position + 2 + 12 * n) + (position + 10 + 12 * n,)
+                   for n in range(count)]
+
+def _set_exif_orientation(exif, rotation):
+    """
+    Compose a rotation into the Orientation tag of the main image of an EXIF block (a TIFF
+    structure), held in a bytearray. If the first IFD has no Orientation tag, it is copied
+    to the end of the block with the tag added, so no existing offset moves.
+    """
+    order = {b"II": "<", b"MM": ">"}.get(bytes(exif[:2]))
+    first_ifd = struct.unpack_from(order + "I", exif, 4)[0] if order else 0
+    order, entries = _ifd_entries(exif, 0, first_ifd)
+    for tag, _, _, value_position in entries:
+        if tag == ORIENTATION_TAG:
+            # A SHORT value sits left-justified in the value field in both byte orders
+            orientation = struct.unpack_from(order + "H", exif, value_position)[0]
+            struct.pack_into(order + "H", exif, value_position, compose_orientation(orientation, rotation))
+            return
+    raw_entries = [bytes(exif[value_position - 8:value_position + 4]) for *_, value_position in entries]
+    raw_entries.append(struct.pack(order + "HHIHH", ORIENTATION_TAG, 3, 1, compose_orientation(1, rotation), 0))
+    raw_entries.sort(key=lambda entry: struct.unpack_from(order + "H", entry)[0])
+    next_ifd = bytes(exif[first_ifd + 2 + 12 * len(entries):first_ifd + 6 + 12 * len(entries)])
+    if len(exif) % 2:
+        exif.append(0)  # IFDs start on a word boundary
+    struct.pack_into(order + "I", exif, 4, len(exif))
+    exif += struct.pack(order + "H", len(raw_entries)) + b"".join(raw_entries) + next_ifd
+
+def _rotate_jpeg(data, rotation):
+    """Return JPEG bytes with a rotation composed into the EXIF Orientation, adding an EXIF segment if needed."""
+    position = insert_at = 2
+    while position + 4 <= len(data) and data[position] == 0xFF and data[position + 1] not in (0xDA, 0xD9):
+        marker = data[position + 1]
+        segment_end = position + 2 + struct.unpack_from(">H", data, position + 2)[0]
+        if marker == 0xE1 and data[position + 4:position + 10] == b"Exif\0\0":
+            exif = bytearray(data[position + 10:segment_end])
+            _set_exif_orientation(exif, rotation)
+            if len(exif) + 8 > 0xFFFF:
+                raise ValueError("The EXIF segment has no room for an Orientation tag.")
+            segment = b"\xff\xe1" + struct.pack(">H", len(exif) + 8) + b"Exif\0\0" + exif
+            return data[:position] + segment + data[segment_end:]
+        if marker == 0xE0:
+            # The JFIF segment, which holds the DPI, must stay first
+            insert_at = segment_end
+        position = segment_end
+    exif = (b"MM\x00\x2a" + struct.pack(">IH", 8, 1)
+            + struct.pack(">HHIHH", ORIENTATION_TAG, 3, 1, compose_orientation(1, rotation), 0) + struct.pack(">I", 0))
+    segment = b"\xff\xe1" + struct.pack(">H", len(exif) + 8) + b"Exif\0\0" + exif
+    return data[:insert_at] + segment + data[insert_at:]
+
+def _tiff_resolution(data):
+    """Return the cv2.imwrite parameters that carry over the resolution of a TIFF's first page."""
+    order = {b"II": "<", b"MM": ">"}.get(bytes(data[:2]))
+    _, entries = _ifd_entries(data, 0, struct.unpack_from(order + "I", data, 4)[0])
+    params = []
+    for tag, _, _, value_position in entries:
+        if tag in (282, 283):
+            # RATIONAL values never fit the value field, so it holds their offset
+            offset = struct.unpack_from(order + "I", data, value_position)[0]
+            numerator, denominator = struct.unpack_from(order + "II", data, offset)
+            params += [cv2.IMWRITE_TIFF_XDPI if tag == 282 else cv2.IMWRITE_TIFF_YDPI,
+                       round(numerator / denominator) if denominator else 0]
+        elif tag == 296:
+            params += [cv2.IMWRITE_TIFF_RESUNIT, struct.unpack_from(order + "H", data, value_position)[0]]
+    return params
+
+def _rotate_tiff(data, rotation):
+    """
+    Return TIFF bytes with every page rotated. OpenCV cannot read 90 or 270 degree TIFF
+    Orientation tags, nor write 1-bit Group 4 pages, so the pixels are turned and saved with
+    lossless LZW compression at the source resolution.
+    """
+    rotate_code = {90: cv2.ROTATE_90_CLOCKWISE, 180: cv2.ROTATE_180, 270: cv2.ROTATE_90_COUNTERCLOCKWISE}[rotation % 360]
+    ok, pages = cv2.imdecodemulti(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if not ok:
+        raise ValueError("Could not decode the TIFF.")
+    ok, encoded = cv2.imencodemulti(".tif", [cv2.rotate(page, rotate_code) for page in pages],
+                                    [cv2.IMWRITE_TIFF_COMPRESSION, cv2.IMWRITE_TIFF_COMPRESSION_LZW] + _tiff_resolution(data))
+    if not ok:
+        raise ValueError("Could not encode the rotated TIFF.")
+    return encoded.tobytes()
+
+def rotate_image_file(image_path, rotation, output_path=None):
+    """
+    Rotate a JPEG or TIFF file clockwise by a multiple of 90 degrees without losing detail.
+    A JPEG is not re-encoded: the rotation is composed into its EXIF Orientation tag, which
+    viewers and cv2.imread apply, so its pixels, quality and DPI stay exactly as scanned. A
+    TIFF's pixels are turned and saved losslessly at the same DPI (see _rotate_tiff).
+
+    Parameters:
+        image_path (str): The file path to the image, possibly inside an archive.
+        rotation (int): Clockwise rotation in degrees (90, 180 or 270).
+        output_path (str): File path of the rotated copy, or None to replace the file itself.
+
+    Raises:
+        ValueError: If the file is neither a JPEG nor a classic TIFF, or its EXIF orientation is mirrored.
+    """
+    data = read_bytes(image_path)
+    if data[:2] == b"\xff\xd8":
+        rotated = _rotate_jpeg(data, rotation)
+    elif data[:2] in (b"II", b"MM"):
+        rotated = _rotate_tiff(data, rotation)
+    else:
+        raise ValueError(f"Unsupported image format: {image_path}")
+    output_path = output_path or image_path
+    # Written beside the target and renamed, so a failed write never leaves a truncated scan
+    temporary_path = f"{output_path}.tmp"
+    with open(temporary_path, 'wb') as f:
+        f.write(rotated)
+    os.replace(temporary_path, output_path)
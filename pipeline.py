@@ -0,0 +1,312 @@
+# pipeline.py
+
+import os
+import time
+import queue
+import threading
+import logging
+
+from adaptive import ConcurrencyLimit, ConcurrencyController, DEFAULT_CONTROL_INTERVAL
+
+logger = logging.getLogger()
+
+# Default number of threads prefetching file bytes
+DEFAULT_READER_THREADS = 2
+# Upper bound on reader threads when the adaptive controller may add readers
+DEFAULT_MAX_READER_THREADS = 8
+# Default depth of each bounded queue between stages
+DEFAULT_TASK_QUEUE_DEPTH = 64
+DEFAULT_PREFETCH_DEPTH = 16
+DEFAULT_RESULT_QUEUE_DEPTH = 64
+# How often blocked stages wake up to check whether the pipeline was stopped
+POLL_INTERVAL = 0.1
+
+# Marks the end of the stream on a queue
+_END = object()
+
+class StageStats:
+    """
+    Thread-safe counters for one pipeline stage: items handled, time spent working,
+    and time stalled waiting for input (upstream too slow) or output (downstream too slow).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.input_wait_seconds = 0.0
+        self.output_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items=0, busy=0.0, input_wait=0.0, output_wait=0.0):
+        with self._lock:
+            self.items += items
+            self.busy_seconds += busy
+            self.input_wait_seconds += input_wait
+            self.output_wait_seconds += output_wait
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "items": self.items,
+                "busy_seconds": self.busy_seconds,
+                "input_wait_seconds": self.input_wait_seconds,
+                "output_wait_seconds": self.output_wait_seconds,
+            }
+
+def format_stage_report(stage_stats):
+    """
+    Format the per-stage statistics collected by iter_pipeline as log lines.
+
+    Parameters:
+        stage_stats (dict): Mapping of stage name to its statistics dictionary.
+
+    Returns:
+        list: One human-readable line per stage.
+    """
+    return [
+        f"Stage '{name}': {stats['items']} items, busy {stats['busy_seconds']:.2f}s, "
+        f"input stall {stats['input_wait_seconds']:.2f}s, output stall {stats['output_wait_seconds']:.2f}s"
+        for name, stats in stage_stats.items()
+    ]
+
+def _put(target_queue, item, stop_event):
+    """Put an item on a bounded queue, giving up if the pipeline is stopped. Returns the time spent blocked."""
+    start = time.perf_counter()
+    while not stop_event.is_set():
+        try:
+            target_queue.put(item, timeout=POLL_INTERVAL)
+            break
+        except queue.Full:
+            continue
+    return time.perf_counter() - start
+
+def _wait_for_job(job, stop_event):
+    """Block while the job is paused. Returns False if the job was cancelled or the pipeline stopped."""
+    if job is None:
+        return not stop_event.is_set()
+    while job.paused and not stop_event.is_set():
+        job.wait_while_paused(POLL_INTERVAL)
+    return not (job.cancelled or stop_event.is_set())
+
+def _get(source_queue, stop_event):
+    """Get an item from a queue, returning _END if the pipeline is stopped. Returns (item, time spent blocked)."""
+    start = time.perf_counter()
+    while not stop_event.is_set():
+        try:
+            return source_queue.get(timeout=POLL_INTERVAL), time.perf_counter() - start
+        except queue.Empty:
+            continue
+    return _END, time.perf_counter() - start
+
+class _StageGroup:
+    """
+    A group of threads running the same stage. The last thread to finish forwards one
+    end marker per downstream thread, so the next stage shuts down only after every
+    upstream item has been handed over.
+    """
+
+    def __init__(self, name, thread_count, downstream_queue, downstream_count, stop_event):
+        self.name = name
+        self.stats = StageStats(name)
+        self.thread_count = thread_count
+        self.downstream_queue = downstream_queue
+        self.downstream_count = downstream_count
+        self.stop_event = stop_event
+        self._remaining = thread_count
+        self._lock = threading.Lock()
+
+    def thread_finished(self):
+        with self._lock:
+            self._remaining -= 1
+            last = self._remaining == 0
+        if last:
+            for _ in range(self.downstream_count):
+                _put(self.downstream_queue, _END, self.stop_event)
+
+def iter_pipeline(tasks, read_func, analyze_func, reader_threads=DEFAULT_READER_THREADS,
+                  analyze_workers=None, task_queue_depth=DEFAULT_TASK_QUEUE_DEPTH,
+                  prefetch_depth=DEFAULT_PREFETCH_DEPTH, result_queue_depth=DEFAULT_RESULT_QUEUE_DEPTH,
+                  stage_stats=None, job=None, adaptive=False, max_reader_threads=None,
+                  max_analyze_workers=None, control_interval=DEFAULT_CONTROL_INTERVAL):
+    """
+    Run tasks through list -> read -> decode/analyze stages connected by bounded queues, so
+    file I/O for upcoming tasks overlaps with pixel work on the current ones. The consumer
+    of this generator is the single emit stage.
+
+    The lister, readers and analyzers run on background threads. Closing the generator
+    early stops them and waits for them to exit. If a job handle is given, every stage
+    waits while it is paused. On cancel the lister stops, queued but unread tasks are
+    dropped, and files that were already read are still analyzed and yielded.
+
+    With adaptive=True, a ConcurrencyController grows and shrinks the number of active
+    readers and analyzers while the run is in progress, starting from reader_threads and
+    analyze_workers, to maximize documents per second. Its decisions are logged.
+
+    Parameters:
+        tasks (list): The tasks to process.
+        read_func (callable): read_func(task) -> payload, typically the file bytes.
+        analyze_func (callable): analyze_func(task, payload) -> result, decoding and analyzing the payload.
+        reader_threads (int): Number of threads prefetching file bytes.
+        analyze_workers (int): Number of decode/analyze threads; defaults to the CPU count.
+        task_queue_depth (int): Depth of the queue between the lister and the readers.
+        prefetch_depth (int): Depth of the queue between the readers and the analyzers.
+        result_queue_depth (int): Depth of the queue between the analyzers and the emitter.
+        stage_stats (dict): If given, filled with the statistics of every stage
+                            ("list", "read", "analyze", "emit") once the generator finishes.
+        job (jobs.JobHandle): Optional handle for pausing and cancelling the run.
+        adaptive (bool): Adjust reader and analyzer concurrency while running.
+        max_reader_threads (int): Most readers the controller may use; defaults to DEFAULT_MAX_READER_THREADS.
+        max_analyze_workers (int): Most analyzers the controller may use; defaults to twice analyze_workers.
+        control_interval (float): Seconds between controller decisions.
+
+    Yields:
+        tuple: (index, result) in completion order. The result is None if reading or
+               analyzing the task raised an exception.
+    """
+    analyze_workers = analyze_workers or os.cpu_count() or 1
+    task_queue = queue.Queue(maxsize=task_queue_depth)
+    prefetch_queue = queue.Queue(maxsize=prefetch_depth)
+    result_queue = queue.Queue(maxsize=result_queue_depth)
+    stop_event = threading.Event()
+
+    # Every thread the controller may need is started up front; the limits decide how many work
+    if adaptive:
+        read_limit = ConcurrencyLimit(reader_threads, max(reader_threads, max_reader_threads or DEFAULT_MAX_READER_THREADS))
+        analyze_limit = ConcurrencyLimit(analyze_workers, max(analyze_workers, max_analyze_workers or 2 * analyze_workers))
+    else:
+        read_limit = ConcurrencyLimit(reader_threads, reader_threads)
+        analyze_limit = ConcurrencyLimit(analyze_workers, analyze_workers)
+
+    list_stage = _StageGroup("list", 1, task_queue, read_limit.maximum, stop_event)
+    read_stage = _StageGroup("read", read_limit.maximum, prefetch_queue, analyze_limit.maximum, stop_event)
+    analyze_stage = _StageGroup("analyze", analyze_limit.maximum, result_queue, 1, stop_event)
+    emit_stats = StageStats("emit")
+
+    def lister():
+        try:
+            for index, task in enumerate(tasks):
+                if not _wait_for_job(job, stop_event):
+                    break
+                list_stage.stats.add(items=1, output_wait=_put(task_queue, (index, task), stop_event))
+        finally:
+            list_stage.thread_finished()
+
+    def reader():
+        try:
+            while read_limit.acquire(stop_event):
+                try:
+                    item, waited = _get(task_queue, stop_event)
+                    read_stage.stats.add(input_wait=waited)
+                    if item is _END:
+                        break
+                    if not _wait_for_job(job, stop_event):
+                        continue  # Cancelled: drop tasks that were listed but not read yet
+                    index, task = item
+                    start = time.perf_counter()
+                    try:
+                        payload = read_func(task)
+                        failed = False
+                    except Exception as e:
+                        logger.error(f"Read stage failed for task {index}: {str(e)}")
+                        payload, failed = None, True
+                    read_stage.stats.add(items=1, busy=time.perf_counter() - start)
+                    if failed:
+                        # Nothing to analyze; send the failure straight to the emitter
+                        waited = _put(result_queue, (index, None), stop_event)
+                    else:
+                        waited = _put(prefetch_queue, (index, task, payload), stop_event)
+                    read_stage.stats.add(output_wait=waited)
+                finally:
+                    read_limit.release()
+        finally:
+            read_stage.thread_finished()
+
+    def analyzer():
+        try:
+            while analyze_limit.acquire(stop_event):
+                try:
+                    item, waited = _get(prefetch_queue, stop_event)
+                    analyze_stage.stats.add(input_wait=waited)
+                    if item is _END:
+                        break
+                    index, task, payload = item
+                    # Only pause here; files already read are still analyzed after a cancel
+                    while job is not None and job.paused and not stop_event.is_set():
+                        job.wait_while_paused(POLL_INTERVAL)
+                    start = time.perf_counter()
+                    try:
+                        result = analyze_func(task, payload)
+                    except Exception as e:
+                        logger.error(f"Analyze stage failed for task {index}: {str(e)}")
+                        result = None
+                    del payload  # Release the file bytes before blocking on the result queue
+                    analyze_stage.stats.add(items=1, busy=time.perf_counter() - start)
+                    analyze_stage.stats.add(output_wait=_put(result_queue, (index, result), stop_event))
+                finally:
+                    analyze_limit.release()
+        finally:
+            analyze_stage.thread_finished()
+
+    threads = [threading.Thread(target=lister, name="pipeline-list", daemon=True)]
+    threads += [threading.Thread(target=reader, name=f"pipeline-read-{n}", daemon=True) for n in range(read_limit.maximum)]
+    threads += [threading.Thread(target=analyzer, name=f"pipeline-analyze-{n}", daemon=True) for n in range(analyze_limit.maximum)]
+    if adaptive:
+        controller = ConcurrencyController(
+            read_stage.stats, analyze_stage.stats, read_limit, analyze_limit, stop_event, control_interval
+        )
+        threads.append(controller)
+    for thread in threads:
+        thread.start()
+
+    try:
+        # The consumer of the generator is the single emitter
+        while True:
+            item, waited = _get(result_queue, stop_event)
+            emit_stats.add(input_wait=waited)
+            if item is _END:
+                break
+            start = time.perf_counter()
+            yield item
+            emit_stats.add(items=1, busy=time.perf_counter() - start)
+    finally:
+        # Stops the background stages early if the consumer stopped iterating
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+
+        final_stats = {
+            "list": list_stage.stats.as_dict(),
+            "read": read_stage.stats.as_dict(),
+            "analyze": analyze_stage.stats.as_dict(),
+            "emit": emit_stats.as_dict(),
+        }
+        if stage_stats is not None:
+            stage_stats.update(final_stats)
+        for line in format_stage_report(final_stats):
+            logger.info(line)
+        if adaptive:
+            logger.info(
+                f"Concurrency controller made {len(controller.decisions)} changes; "
+                f"finished with {read_limit.limit} readers and {analyze_limit.limit} analyzers."
+            )
+
+def run_pipeline(tasks, read_func, analyze_func, emit_func, **pipeline_options):
+    """
+    Run iter_pipeline and call emit_func(index, result) for every result from the calling thread.
+
+    Parameters:
+        tasks (list): The tasks to process.
+        read_func (callable): read_func(task) -> payload, typically the file bytes.
+        analyze_func (callable): analyze_func(task, payload) -> result.
+        emit_func (callable): emit_func(index, result) called for every task. The result is None
+                              if reading or analyzing the task raised an exception.
+        **pipeline_options: Keyword arguments for iter_pipeline (reader_threads, queue depths, ...).
+
+    Returns:
+        dict: Mapping of stage name ("list", "read", "analyze", "emit") to its statistics.
+    """
+    stage_stats = {}
+    for index, result in iter_pipeline(tasks, read_func, analyze_func, stage_stats=stage_stats, **pipeline_options):
+        emit_func(index, result)
+    return stage_stats
@@ -1,6 +1,9 @@
 # processing.py
 
 import os
+import itertools
+import contextlib
+from collections import namedtuple
 import cv2
 import numpy as np
 import csv
@@ -10,6 +13,29 @@ from openpyxl.styles import Font
 import logging
 
 from utils import extract_first_digit, extract_last_four_digits, is_valid_jpg, is_valid_tiff
+from dedup import find_duplicate_groups
+from color_regions import export_mixed_raster
+from archives import list_folder, read_bytes, read_image, is_archive_path, close_handles
+from orientation import detect_rotation, rotate_image_file
+from executors import EXECUTION_MODES, create_executor, compute_chunksize, iter_map_bounded, default_worker_count
+from pipeline import iter_pipeline
+from shared_ring import iter_shared_pipeline
+from reorder import ReorderBuffer
+from scheduling import schedule_tasks
+from io_order import physical_order, iter_read_ahead
+from staging import StagingCache
+from lanes import LaneExecutor
+from thread_budget import thread_budget, library_threads, ThreadDiagnostics
+from journal import CheckpointJournal
+from progress import ProgressReporter, post_final
+from reports import ReportWriter
+
+# Processing modes: the executor backends plus the staged prefetch pipeline
+PROCESSING_MODES = EXECUTION_MODES + ("pipeline", "adaptive", "shared")
+# Orders in which tasks are dispatched: largest first, final report order, or on-disk position
+DISPATCH_ORDERS = ("size", "report", "physical")
+# Longest side of QC thumbnails in pixels
+THUMBNAIL_SIZE = 256
 
 # Configure logging
 logger = logging.getLogger()
@@ -35,7 +61,7 @@ def build_tiff_mapping(input_dir_tiff):
     tiff_mapping = {}
     try:
         all_tiff_files = [
-            f for f in os.listdir(input_dir_tiff)
+            f for f in list_folder(input_dir_tiff)
             if f.lower().endswith(('.tif', '.tiff')) and is_valid_tiff(f)
         ]
 
@@ -62,6 +88,21 @@ def build_tiff_mapping(input_dir_tiff):
 
     return tiff_mapping
 
+def compute_gray_percentage(image):
+    """
+    Calculate the percentage of gray pixels in an already decoded grayscale image.
+
+    Parameters:
+        image (numpy.ndarray): Grayscale image.
+
+    Returns:
+        float: The percentage of pixels with intensity strictly between 0 and 255.
+    """
+    total_pixels = image.size
+    # Count pixels that are not 0 and not 255
+    gray_pixels = np.count_nonzero((image > 0) & (image < 255))
+    return float(gray_pixels / total_pixels) * 100
+
 def calculate_gray_percentage(image_path):
     """
     Calculate the percentage of gray pixels in a grayscale image.
@@ -74,21 +115,41 @@ def calculate_gray_percentage(image_path):
         float: The percentage of gray pixels, or None if the image couldn't be read.
     """
     try:
-        image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        image = read_image(image_path, cv2.IMREAD_GRAYSCALE)
         if image is None:
             logger.error(f"Error reading image: {image_path}")
             return None
 
-        total_pixels = image.size
-        # Count pixels that are not 0 and not 255
-        gray_pixels = np.count_nonzero((image > 0) & (image < 255))
-        gray_percentage = (gray_pixels / total_pixels) * 100
+        gray_percentage = compute_gray_percentage(image)
         logger.debug(f"Image '{image_path}' has {gray_percentage:.2f}% gray pixels.")
         return gray_percentage
     except Exception as e:
         logger.error(f"Exception while calculating gray percentage for '{image_path}': {str(e)}")
         return None
 
+def render_thumbnail(image_path, max_side=THUMBNAIL_SIZE):
+    """
+    Render a small PNG preview of a JPG or TIFF page for quality control. Top-level so it can
+    be submitted to the worker pool's interactive lane.
+
+    Parameters:
+        image_path (str): The file path to the image.
+        max_side (int): Longest side of the thumbnail in pixels.
+
+    Returns:
+        bytes: The PNG-encoded thumbnail, or None if the image couldn't be read.
+    """
+    # IMREAD_REDUCED_COLOR_4 lets the JPEG decoder skip most of the work for a preview
+    image = read_image(image_path, cv2.IMREAD_REDUCED_COLOR_4)
+    if image is None:
+        logger.error(f"Error reading image for thumbnail: {image_path}")
+        return None
+    scale = max_side / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".png", image)
+    return encoded.tobytes() if ok else None
+
 def get_sort_key(first_digit, last_four_digits):
     """
     Generate a sort key based on first digit and last four digits.
@@ -116,119 +177,792 @@ def get_sort_key(first_digit, last_four_digits):
         logger.error(f"Exception in get_sort_key with first_digit='{first_digit}', last_four_digits='{last_four_digits}': {str(e)}")
         return (float('inf'), float('inf'))
 
-def process_documents(input_dir_jpg, input_dir_tiff, progress_queue, low_threshold, high_threshold):
+def decide_format(jpg_file, tiff_files, gray_pct, low_threshold, high_threshold):
     """
-    Process all JPG and TIFF pairs in the input directories, decide which format to use,
-    and prepare log entries based on the decision.
-    Sorts the log entries first by first digit (1 then 2), and within each group by last four digits from least to greatest.
-    Adds a count of "TIF (Intermediate)" selections.
+    Decide which format to deliver for a document based on its gray percentage.
 
     Parameters:
-        input_dir_jpg (str): Directory containing JPG files.
-        input_dir_tiff (str): Directory containing TIFF files.
-        progress_queue (queue.Queue): Queue to communicate progress to the GUI.
+        jpg_file (str): The JPG filename.
+        tiff_files (list): The corresponding TIFF filenames.
+        gray_pct (float): Gray percentage of the JPG.
         low_threshold (float): Low gray threshold percentage.
         high_threshold (float): High gray threshold percentage.
+
+    Returns:
+        tuple: (selected_documents, selected_format, flagged)
     """
+    if gray_pct < low_threshold:
+        # Log all corresponding TIFF base names, separated by commas
+        return ', '.join([os.path.splitext(tiff)[0] for tiff in tiff_files]), "TIFF", "No"
+    if gray_pct > high_threshold:
+        # Log the JPG's base name
+        return os.path.splitext(jpg_file)[0], "JPG", "No"
+    # Log the TIFF's base names
+    return ', '.join([os.path.splitext(tiff)[0] for tiff in tiff_files]), "TIF (Intermediate)", "Yes"
+
+def analyze_document_group(task):
+    """
+    Analyze one unique JPG content and run the per-document follow-up work for every
+    file that shares it. This is the unit of work handed to the executor, so it must
+    stay a picklable top-level function.
+
+    Parameters:
+        task (tuple): (members, low_threshold, high_threshold, mixed_raster_dir, orientation_dir) where
+                      members is a list of (jpg_path, tiff_paths) for byte-identical JPGs, representative
+                      first. With an orientation_dir, the orientation is also estimated from the same
+                      decoded page (see orient_document_group).
+
+    Returns:
+        float: The gray percentage of the shared content, or None if it couldn't be read.
+    """
+    if task[4]:
+        try:
+            image = decode_document_group(task)
+        except Exception as e:
+            logger.error(f"Exception while decoding '{task[0][0][0]}': {str(e)}")
+            image = None
+        if image is None:
+            return finish_document_group(task, None)
+        return analyze_document_raster(task, image)
+    gray_pct = calculate_gray_percentage(task[0][0][0])
+    return finish_document_group(task, gray_pct)
+
+def orient_document_group(task, image):
+    """
+    Estimate the orientation of a task's page from its already decoded raster and, only if
+    it is confidently not upright, write rotated copies of the group's JPGs and their TIFFs
+    to the task's orientation_dir (see orientation.rotate_image_file). The scanned files are
+    never changed, and a JPG and its TIFFs are always turned together. The estimate comes
+    from the same decode as the gray analysis, so no page is decoded twice.
+
+    Parameters:
+        task (tuple): The task passed to analyze_document_group.
+        image (numpy.ndarray): The decoded grayscale page.
+
+    Returns:
+        int: The clockwise correction applied in degrees, or None if it failed.
+    """
+    members, orientation_dir = task[0], task[4]
     try:
-        # Build TIFF mapping
-        tiff_mapping = build_tiff_mapping(input_dir_tiff)
-        if not tiff_mapping:
-            error_message = "No valid TIFF files found in the selected directory."
-            logger.error(error_message)
-            progress_queue.put(("error", error_message))
-            return
-
-        # Collect all JPG files
-        all_jpg_files = [
-            f for f in os.listdir(input_dir_jpg)
-            if f.lower().endswith(('.jpg', '.jpeg')) and is_valid_jpg(f)
-        ]
+        rotation = detect_rotation(image, image_name=members[0][0])
+        if rotation:
+            os.makedirs(orientation_dir, exist_ok=True)
+            for jpg_path, tiff_paths in members:
+                for path in [jpg_path] + tiff_paths:
+                    rotate_image_file(path, rotation, os.path.join(orientation_dir, os.path.basename(path)))
+                logger.info(f"Wrote '{os.path.basename(jpg_path)}' and its TIFFs rotated by {rotation} degrees "
+                            f"to '{orientation_dir}'.")
+        return rotation
+    except Exception as e:
+        logger.error(f"Exception while correcting orientation for '{members[0][0]}': {str(e)}")
+        return None
 
-        if not all_jpg_files:
-            error_message = "No valid JPG files found in the selected directory."
-            logger.error(error_message)
-            progress_queue.put(("error", error_message))
-            return
+def finish_document_group(task, gray_pct):
+    """
+    Run the follow-up work that depends on the gray percentage, such as the
+    mixed-raster export of intermediate pages.
 
-        # List to hold all log entries
-        log_entries = []
-        flagged_count = 0  # Initialize counter for flagged files
+    Parameters:
+        task (tuple): The task passed to analyze_document_group.
+        gray_pct (float): Gray percentage of the shared content, or None if it couldn't be read.
 
-        total_files = len(all_jpg_files)
-        processed_files = 0
+    Returns:
+        float: gray_pct, unchanged.
+    """
+    members, low_threshold, high_threshold, mixed_raster_dir, _ = task
+    if gray_pct is not None and mixed_raster_dir and low_threshold <= gray_pct <= high_threshold:
+        for jpg_path, tiff_paths in members:
+            export_mixed_raster(jpg_path, tiff_paths, mixed_raster_dir)
+    return gray_pct
 
-        # Process each JPG file
-        for jpg_file in all_jpg_files:
-            # Notify the GUI of the current file
-            progress_queue.put(("current_file", jpg_file))
+def read_document_group(task):
+    """
+    Read the raw bytes of a task's representative JPG. Used by the pipeline's read stage.
 
-            base_name, _ = os.path.splitext(jpg_file)  # Extract base name without extension
-            first_digit = extract_first_digit(jpg_file)
-            last_four = extract_last_four_digits(jpg_file)
-            if not first_digit or not last_four:
-                logger.warning(f"Could not extract necessary digits from JPG '{jpg_file}'. Skipping.")
-                processed_files += 1
-                progress_queue.put(("progress", processed_files, total_files))
-                continue
+    Parameters:
+        task (tuple): The task passed to analyze_document_group.
 
-            # Find corresponding TIFF(s)
-            key = (first_digit, last_four)
-            tiff_files = tiff_mapping.get(key)
-            if not tiff_files:
-                logger.warning(f"No corresponding TIFF found for JPG '{jpg_file}' with key {key}. Skipping.")
-                processed_files += 1
-                progress_queue.put(("progress", processed_files, total_files))
-                continue
+    Returns:
+        bytes: The file content.
+    """
+    return read_bytes(task[0][0][0])
 
-            jpg_path = os.path.join(input_dir_jpg, jpg_file)
+def decode_document_group(task):
+    """
+    Read and decode a task's representative JPG. Used by the decoders of the shared-memory ring.
 
-            gray_pct = calculate_gray_percentage(jpg_path)
-            if gray_pct is None:
-                logger.error(f"Skipping {jpg_file} due to read error.")
-                processed_files += 1
-                progress_queue.put(("progress", processed_files, total_files))
-                continue
+    Parameters:
+        task (tuple): The task passed to analyze_document_group.
 
-            # Decision logic
-            if gray_pct < low_threshold:
-                selected_format = "TIFF"
-                # Log all corresponding TIFF base names, separated by commas
-                selected_documents = ', '.join([os.path.splitext(tiff)[0] for tiff in tiff_files])
-                flagged = "No"
-            elif gray_pct > high_threshold:
-                selected_format = "JPG"
-                # Log the JPG's base name
-                selected_documents = base_name
-                flagged = "No"
-            else:
-                selected_format = "TIF (Intermediate)"
-                # Log the TIFF's base names
-                selected_documents = ', '.join([os.path.splitext(tiff)[0] for tiff in tiff_files])
-                flagged_count += 1  # Increment counter for flagged files
-                flagged = "Yes"
+    Returns:
+        numpy.ndarray: The grayscale image, or None if it couldn't be decoded.
+    """
+    image = cv2.imdecode(np.frombuffer(read_bytes(task[0][0][0]), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        logger.error(f"Error decoding image: {task[0][0][0]}")
+    return image
+
+def analyze_document_raster(task, image):
+    """
+    Analyze an already decoded grayscale page. Used by the analyzers of the shared-memory ring.
+    With an orientation_dir in the task, the same raster also decides the page's orientation.
+
+    Parameters:
+        task (tuple): The task passed to analyze_document_group.
+        image (numpy.ndarray): The decoded page, possibly a view into shared memory.
+
+    Returns:
+        float: The gray percentage.
+    """
+    gray_pct = compute_gray_percentage(image)
+    if task[4]:
+        orient_document_group(task, image)
+    return finish_document_group(task, gray_pct)
+
+def analyze_document_bytes(task, data):
+    """
+    Decode a JPG from memory and analyze it. Used by the pipeline's decode/analyze stage.
+
+    Parameters:
+        task (tuple): The task passed to analyze_document_group.
+        data (bytes): The JPG file content.
+
+    Returns:
+        float: The gray percentage, or None if the image couldn't be decoded.
+    """
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        logger.error(f"Error decoding image: {task[0][0][0]}")
+        return None
+    return analyze_document_raster(task, image)
+
+class DocumentResult(namedtuple("DocumentResult", [
+        "jpg_file", "sort_key", "selected_documents", "gray_percentage", "selected_format", "flagged"])):
+    """
+    The decision for a single JPG. Skipped files (unpaired or unreadable) have a
+    selected_format of None.
+    """
+    __slots__ = ()
+
+    @property
+    def skipped(self):
+        return self.selected_format is None
+
+    @property
+    def order_key(self):
+        """Unique key that sorts results the same way as the final report."""
+        return (self.sort_key, self.jpg_file)
+
+    def to_log_entry(self):
+        """Return the (sort_key, selected_documents, gray_pct_str, selected_format, flagged) log entry."""
+        return (self.sort_key, self.selected_documents, f"{self.gray_percentage:.2f}", self.selected_format, self.flagged)
+
+def document_order_key(jpg_file):
+    """
+    Compute the DocumentResult.order_key of a JPG before it has been processed.
+
+    Parameters:
+        jpg_file (str): The JPG filename.
+
+    Returns:
+        tuple: (sort_key, jpg_file)
+    """
+    return (get_sort_key(extract_first_digit(jpg_file), extract_last_four_digits(jpg_file)), jpg_file)
+
+def skipped_result(jpg_file):
+    """
+    Build the DocumentResult of a JPG that was not analyzed.
+
+    Parameters:
+        jpg_file (str): The JPG filename.
+
+    Returns:
+        DocumentResult: A result with no selected format.
+    """
+    return DocumentResult(jpg_file, document_order_key(jpg_file)[0], None, None, None, None)
+
+class ProcessingError(Exception):
+    """
+    An error that stops a run and whose message is shown to the user as is.
+    """
+
+def plan_documents(input_dir_jpg, input_dir_tiff, low_threshold, high_threshold, mixed_raster_dir=None,
+                   orientation_dir=None):
+    """
+    Pair every JPG with its TIFF(s), group byte-identical JPGs, and build one analysis
+    task per unique JPG content. Either directory may be a folder inside a ZIP or TAR
+    archive (see archives.split_archive_path); its files are then listed from the archive's
+    directory in archive order and read straight from the archive, never extracted.
+
+    Parameters:
+        input_dir_jpg (str): Directory containing JPG files, possibly inside an archive.
+        input_dir_tiff (str): Directory containing TIFF files, possibly inside an archive.
+        low_threshold (float): Low gray threshold percentage.
+        high_threshold (float): High gray threshold percentage.
+        mixed_raster_dir (str): Directory for mixed-raster output, or None to skip it.
+        orientation_dir (str): Directory for upright copies of the pages that are not upright,
+                               or None to skip orientation correction.
 
-            # Append the entry with sort key based on first and last four digits
-            sort_key = get_sort_key(first_digit, last_four)
-            log_entries.append((sort_key, selected_documents, f"{gray_pct:.2f}", selected_format, flagged))
+    Returns:
+        dict: total_files (number of valid JPGs), skipped_files (JPGs that could not be paired),
+              groups (list of candidate lists, one per unique content, where each candidate is
+              (jpg_file, first_digit, last_four, tiff_files)), tasks (one analyze_document_group
+              task per group) and duplicate_groups (lists of duplicate JPG filenames).
+    """
+    # Build TIFF mapping
+    tiff_mapping = build_tiff_mapping(input_dir_tiff)
+    if not tiff_mapping:
+        raise ProcessingError("No valid TIFF files found in the selected directory.")
+
+    # Collect all JPG files
+    all_jpg_files = [
+        f for f in list_folder(input_dir_jpg)
+        if f.lower().endswith(('.jpg', '.jpeg')) and is_valid_jpg(f)
+    ]
+
+    if not all_jpg_files:
+        raise ProcessingError("No valid JPG files found in the selected directory.")
+
+    # Pair each JPG with its TIFF(s), skipping files that cannot be paired
+    candidates = []
+    skipped_files = []
+    for jpg_file in all_jpg_files:
+        first_digit = extract_first_digit(jpg_file)
+        last_four = extract_last_four_digits(jpg_file)
+        if not first_digit or not last_four:
+            logger.warning(f"Could not extract necessary digits from JPG '{jpg_file}'. Skipping.")
+            skipped_files.append(jpg_file)
+            continue
+
+        # Find corresponding TIFF(s)
+        key = (first_digit, last_four)
+        tiff_files = tiff_mapping.get(key)
+        if not tiff_files:
+            logger.warning(f"No corresponding TIFF found for JPG '{jpg_file}' with key {key}. Skipping.")
+            skipped_files.append(jpg_file)
+            continue
+
+        candidates.append((jpg_file, first_digit, last_four, tiff_files))
+
+    # Group byte-identical JPGs so each unique content is analyzed only once
+    jpg_paths = [os.path.join(input_dir_jpg, candidate[0]) for candidate in candidates]
+    canonical_map, duplicate_path_groups = find_duplicate_groups(jpg_paths)
+
+    content_groups = {}
+    for candidate, jpg_path in zip(candidates, jpg_paths):
+        content_groups.setdefault(canonical_map.get(jpg_path, jpg_path), []).append(candidate)
+    groups = list(content_groups.values())
+    tasks = [
+        (
+            [(os.path.join(input_dir_jpg, jpg_file), [os.path.join(input_dir_tiff, tiff) for tiff in tiff_files])
+             for jpg_file, _, _, tiff_files in group],
+            low_threshold,
+            high_threshold,
+            mixed_raster_dir,
+            orientation_dir,
+        )
+        for group in groups
+    ]
+
+    return {
+        "total_files": len(all_jpg_files),
+        "skipped_files": skipped_files,
+        "groups": groups,
+        "tasks": tasks,
+        "duplicate_groups": [[os.path.basename(path) for path in group] for group in duplicate_path_groups],
+    }
+
+def exclude_completed(plan, completed_files):
+    """
+    Remove already completed JPGs from a plan, dropping tasks whose files are all done.
+
+    Parameters:
+        plan (dict): The plan returned by plan_documents.
+        completed_files (set): JPG filenames that no longer need processing.
+
+    Returns:
+        dict: A new plan holding only the remaining work.
+    """
+    groups = []
+    tasks = []
+    for group, (members, *settings) in zip(plan["groups"], plan["tasks"]):
+        remaining = [(candidate, member) for candidate, member in zip(group, members) if candidate[0] not in completed_files]
+        if remaining:
+            groups.append([candidate for candidate, _ in remaining])
+            tasks.append(tuple([[member for _, member in remaining]] + settings))
+    return dict(plan, groups=groups, tasks=tasks)
+
+def result_to_record(result):
+    """
+    Convert a DocumentResult into a JSON-serializable journal record.
 
-            # Log the decision in debug log
-            logger.info(f"Document: {selected_documents}, Gray_Percentage: {gray_pct:.2f}, Selected_Format: {selected_format}, Flagged: {flagged}")
+    Parameters:
+        result (DocumentResult): The result to convert.
 
-            # Update progress
-            processed_files += 1
-            progress_queue.put(("progress", processed_files, total_files))
+    Returns:
+        dict: The record.
+    """
+    return result._asdict()
+
+def record_to_result(record):
+    """
+    Convert a journal record back into a DocumentResult.
 
+    Parameters:
+        record (dict): A record written by result_to_record.
+
+    Returns:
+        DocumentResult: The result.
+    """
+    return DocumentResult(**dict(record, sort_key=tuple(record["sort_key"])))
+
+def journal_results(results, journal):
+    """
+    Pass results through, appending every decided (not skipped) result to a checkpoint journal.
+    If the journal cannot be written (a full disk or a lost share), it is abandoned with a
+    warning and the run goes on without it.
+
+    Parameters:
+        results (iterable): DocumentResult objects.
+        journal (CheckpointJournal): The open journal.
+
+    Yields:
+        DocumentResult: The same results.
+    """
+    for result in results:
+        if journal is not None and not result.skipped:
+            try:
+                journal.append(result_to_record(result))
+            except OSError as e:
+                logger.warning(f"Could not write journal '{journal.path}'; continuing without it: {str(e)}")
+                journal.abandon()
+                journal = None
+        yield result
+
+def evaluate_group(group, gray_pct, low_threshold, high_threshold):
+    """
+    Turn the gray percentage of one unique content into a log entry for every file sharing it.
+
+    Parameters:
+        group (list): Candidates (jpg_file, first_digit, last_four, tiff_files) sharing the content.
+        gray_pct (float): Gray percentage of the content, or None if it couldn't be read.
+        low_threshold (float): Low gray threshold percentage.
+        high_threshold (float): High gray threshold percentage.
+
+    Yields:
+        DocumentResult: The decision for each file; skipped if the content couldn't be read.
+    """
+    for jpg_file, first_digit, last_four, tiff_files in group:
+        if gray_pct is None:
+            logger.error(f"Skipping {jpg_file} due to read error.")
+            yield skipped_result(jpg_file)
+            continue
+
+        # Decision logic
+        selected_documents, selected_format, flagged = decide_format(
+            jpg_file, tiff_files, gray_pct, low_threshold, high_threshold
+        )
+
+        # Log the decision in debug log
+        logger.info(f"Document: {selected_documents}, Gray_Percentage: {gray_pct:.2f}, Selected_Format: {selected_format}, Flagged: {flagged}")
+
+        # Sort key based on first and last four digits
+        sort_key = get_sort_key(first_digit, last_four)
+        yield DocumentResult(jpg_file, sort_key, selected_documents, gray_pct, selected_format, flagged)
+
+def report_order(tasks):
+    """
+    Order tasks by the final report position of their first document (see get_sort_key).
+
+    Parameters:
+        tasks (list): Tasks built by plan_documents.
+
+    Returns:
+        list: Task indices in report order.
+    """
+    keys = [min(document_order_key(os.path.basename(jpg_path)) for jpg_path, _ in members) for members, *_ in tasks]
+    return sorted(range(len(tasks)), key=keys.__getitem__)
+
+def iter_task_results(tasks, execution_mode="serial", max_workers=None, pipeline_options=None, job=None, executor=None,
+                      dispatch="size", staging=None):
+    """
+    Analyze tasks on the selected backend and yield each gray percentage as soon as it is known.
+    With dispatch="size" and several workers the largest pages are dispatched first (see
+    scheduling.schedule_tasks); with dispatch="report" tasks are dispatched in final report
+    order, so results arrive nearly sorted and a small reorder window restores the order;
+    with dispatch="physical" files are read in their on-disk order (see io_order) with
+    posix_fadvise read-ahead hints for the next files, for spinning disks and USB drives;
+    files inside an archive are read in archive order.
+    OpenCV's own threads are limited so that workers x library threads matches the CPU count
+    (see thread_budget), and the thread count and context-switch rate of the run are logged.
+    If a job handle is given, new work is held back while it is paused. After it is
+    cancelled, the work already in flight is finished and yielded, then iteration stops.
+    Tasks planned with an orientation_dir also have their orientation estimated from the
+    raster every backend decodes for the gray analysis (see orient_document_group).
+    With staging, the JPGs of upcoming tasks are copied from a slow network share to a
+    bounded local cache ahead of the workers and evicted as their results arrive (see
+    staging.StagingCache).
+
+    Parameters:
+        tasks (list): Tasks built by plan_documents, possibly from several plans.
+        execution_mode (str): "serial", "threads", "processes", "pipeline", "adaptive" or "shared".
+        max_workers (int): Number of workers for the pool backends or pipeline analyzers; defaults to the CPU count.
+        pipeline_options (dict): Extra keyword arguments for iter_pipeline, such as reader_threads and queue depths,
+                                 or for iter_shared_pipeline in "shared" mode, such as slot_count and slot_bytes.
+        job (jobs.JobHandle): Optional handle for pausing and cancelling the run.
+        executor (concurrent.futures.Executor): Optional long-lived pool (see executors.WarmWorkerPool)
+                                                used by the "threads" and "processes" modes instead of a
+                                                new executor; it is left running afterwards.
+        dispatch (str): One of DISPATCH_ORDERS.
+        staging (dict): Keyword arguments for staging.StagingCache, such as cache_dir and max_bytes,
+                        or None to read files where they are.
+
+    Yields:
+        tuple: (task index, gray percentage) in completion order. The gray percentage is
+               None if the task's JPG couldn't be read.
+    """
+    if not tasks:
+        return
+
+    workers = 1 if execution_mode == "serial" else (max_workers or default_worker_count())
+    chunksize = compute_chunksize(len(tasks), max_workers) if execution_mode == "processes" else 1
+    if isinstance(executor, LaneExecutor):
+        # A lane yields the pool between calls, so send single pages to keep interactive waits short
+        chunksize = 1
+    if dispatch == "report":
+        order = report_order(tasks)
+    elif dispatch == "physical":
+        order = physical_order([task[0][0][0] for task in tasks])
+    else:
+        order = schedule_tasks(tasks, workers, chunksize)
+    ordered_tasks = [tasks[index] for index in order]
+    cache = StagingCache(**staging) if staging is not None else None
+    if cache is not None:
+        ordered_tasks = cache.iter_staged(ordered_tasks, order)
+    elif dispatch == "physical":
+        ordered_tasks = iter_read_ahead(ordered_tasks, lambda task: task[0][0][0])
+    diagnostics = ThreadDiagnostics()
+    diagnostics.start()
+    results = None
+    try:
+        if execution_mode == "shared":
+            results = _iter_shared_results(ordered_tasks, order, workers, pipeline_options, job)
+        elif execution_mode == "processes":
+            logger.info(f"Thread budget: {workers} processes x {library_threads(execution_mode, workers)} OpenCV threads.")
+            results = _iter_executor_results(ordered_tasks, order, execution_mode, max_workers, workers, chunksize, job,
+                                             executor)
+        elif execution_mode in ("pipeline", "adaptive"):
+            results = _iter_pipeline_results(ordered_tasks, order, execution_mode, max_workers, pipeline_options, job)
+        else:
+            results = _iter_executor_results(ordered_tasks, order, execution_mode, max_workers, workers, chunksize, job,
+                                             executor)
+        # Worker processes (shared and processes modes) set their own budget
+        in_process = execution_mode not in ("shared", "processes")
+        with thread_budget(execution_mode, workers) if in_process else contextlib.nullcontext():
+            for index, gray_pct in results:
+                if cache is not None:
+                    cache.release(index)
+                yield index, gray_pct
+    finally:
+        if results is not None:
+            results.close()  # Finish the backend before its staged files are removed
+        diagnostics.stop()
+        if cache is not None:
+            cache.close()
+        close_handles()
+
+def _iter_pipeline_results(ordered_tasks, order, execution_mode, max_workers, pipeline_options, job):
+    """Run tasks, given in dispatch order, through the staged pipeline for iter_task_results."""
+    options = dict(pipeline_options or {})
+    if execution_mode == "adaptive":
+        options.setdefault("adaptive", True)
+    results = iter_pipeline(
+        ordered_tasks, read_document_group, analyze_document_bytes,
+        analyze_workers=max_workers, job=job, **options
+    )
+    for position, gray_pct in results:
+        yield order[position], gray_pct
+
+def _iter_shared_results(ordered_tasks, order, workers, pipeline_options, job):
+    """Run tasks through decoder and analyzer processes sharing a memory ring for iter_task_results."""
+    options = dict(pipeline_options or {})
+    # Decoding is the heavier half, so it gets the larger share of the workers
+    options.setdefault("decode_workers", max(1, workers - workers // 3))
+    options.setdefault("analyze_workers", max(1, workers // 3))
+    results = iter_shared_pipeline(
+        ordered_tasks, decode_document_group, analyze_document_raster,
+        job=job, **options
+    )
+    for position, gray_pct in results:
+        yield order[position], gray_pct
+
+def _iter_executor_results(ordered_tasks, order, execution_mode, max_workers, workers, chunksize, job, executor):
+    """Map tasks, given in dispatch order, over an executor for iter_task_results."""
+    # Serial work runs at submission, so submit one chunk at a time to keep results streaming
+    max_pending_chunks = 1 if execution_mode == "serial" else 2 * workers
+    owns_executor = executor is None or execution_mode == "serial"
+    if owns_executor:
+        executor = create_executor(execution_mode, max_workers)
+    try:
+        results = iter_map_bounded(
+            executor, analyze_document_group, ordered_tasks,
+            chunksize=chunksize, max_pending_chunks=max_pending_chunks, job=job
+        )
+        for position, gray_pct in enumerate(results):
+            yield order[position], gray_pct
+    finally:
+        if owns_executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+def iter_planned_documents(plan, execution_mode="serial", max_workers=None, pipeline_options=None, job=None, executor=None,
+                           dispatch="size", staging=None):
+    """
+    Analyze the tasks of a plan and yield a result for every JPG as soon as it is decided.
+    Skipped files are yielded first; the rest follow in completion order. Pausing and
+    cancelling work as in iter_task_results.
+
+    Parameters:
+        plan (dict): The plan returned by plan_documents.
+        execution_mode (str): "serial", "threads", "processes", "pipeline", "adaptive" or "shared".
+        max_workers (int): Number of workers for the pool backends or pipeline analyzers; defaults to the CPU count.
+        pipeline_options (dict): Extra keyword arguments for iter_pipeline, such as reader_threads and queue depths.
+        job (jobs.JobHandle): Optional handle for pausing and cancelling the run.
+        executor (concurrent.futures.Executor): Optional long-lived pool, see iter_task_results.
+        dispatch (str): One of DISPATCH_ORDERS, see iter_task_results.
+        staging (dict): Options of the local staging cache, or None, see iter_task_results.
+
+    Yields:
+        DocumentResult: The decision for each JPG.
+    """
+    for jpg_file in plan["skipped_files"]:
+        yield skipped_result(jpg_file)
+
+    tasks = plan["tasks"]
+    if not tasks:
+        return
+    _, low_threshold, high_threshold, *_ = tasks[0]
+
+    for group_index, gray_pct in iter_task_results(tasks, execution_mode, max_workers, pipeline_options, job, executor,
+                                                   dispatch, staging):
+        yield from evaluate_group(plan["groups"][group_index], gray_pct, low_threshold, high_threshold)
+
+def iter_documents(input_dir_jpg, input_dir_tiff, low_threshold, high_threshold, mixed_raster_dir=None,
+                   execution_mode="serial", max_workers=None, pipeline_options=None):
+    """
+    Stream the decision for every JPG in a folder pair as soon as it is made, without
+    holding the results of the whole run.
+
+    Parameters:
+        input_dir_jpg (str): Directory containing JPG files.
+        input_dir_tiff (str): Directory containing TIFF files.
+        low_threshold (float): Low gray threshold percentage.
+        high_threshold (float): High gray threshold percentage.
+        mixed_raster_dir (str): Directory for mixed-raster output, or None to skip it.
+        execution_mode (str): "serial", "threads", "processes", "pipeline", "adaptive" or "shared".
+        max_workers (int): Number of workers for the pool backends or pipeline analyzers; defaults to the CPU count.
+        pipeline_options (dict): Extra keyword arguments for iter_pipeline.
+
+    Yields:
+        DocumentResult: The decision for each JPG, in completion order.
+
+    Raises:
+        ProcessingError: If the folders hold no valid TIFF or JPG files.
+    """
+    plan = plan_documents(input_dir_jpg, input_dir_tiff, low_threshold, high_threshold, mixed_raster_dir)
+    yield from iter_planned_documents(plan, execution_mode, max_workers, pipeline_options)
+
+def iter_planned_documents_sorted(plan, results):
+    """
+    Reorder a stream of results for a plan into final report order (see get_sort_key).
+
+    Parameters:
+        plan (dict): The plan returned by plan_documents.
+        results (iterable): DocumentResult objects for the plan, in any order.
+
+    Yields:
+        DocumentResult: The results in final report order, each as soon as all earlier ones have arrived.
+                        If the stream ends early (a cancelled run), the results still held are
+                        released in order at the end.
+    """
+    expected_keys = [document_order_key(jpg_file) for jpg_file in plan["skipped_files"]]
+    expected_keys += [document_order_key(candidate[0]) for group in plan["groups"] for candidate in group]
+    buffer = ReorderBuffer(expected_keys)
+    for result in results:
+        yield from buffer.push(result.order_key, result)
+    yield from buffer.drain()
+    logger.info(f"Reorder window held at most {buffer.peak} of {len(expected_keys)} results.")
+
+def iter_documents_sorted(input_dir_jpg, input_dir_tiff, low_threshold, high_threshold, mixed_raster_dir=None,
+                          execution_mode="serial", max_workers=None, pipeline_options=None):
+    """
+    Like iter_documents, but yield the results in final report order through a reorder buffer.
+    Takes the same parameters as iter_documents.
+
+    Yields:
+        DocumentResult: The decision for each JPG, in final report order.
+    """
+    plan = plan_documents(input_dir_jpg, input_dir_tiff, low_threshold, high_threshold, mixed_raster_dir)
+    results = iter_planned_documents(plan, execution_mode, max_workers, pipeline_options, dispatch="report")
+    yield from iter_planned_documents_sorted(plan, results)
+
+def process_documents(input_dir_jpg, input_dir_tiff, progress_queue, low_threshold, high_threshold, mixed_raster_dir=None,
+                      execution_mode="serial", max_workers=None, pipeline_options=None, job=None,
+                      journal_path=None, resume=False, executor=None, sorted_output=False, tsv_path=None,
+                      excel_path=None, dispatch=None, orientation_dir=None, staging=None):
+    """
+    Process all JPG and TIFF pairs in the input directories, decide which format to use,
+    and prepare log entries based on the decision.
+    Sorts the log entries first by first digit (1 then 2), and within each group by last four digits from least to greatest.
+    Adds a count of "TIF (Intermediate)" selections.
+    Byte-identical JPGs are analyzed once and the result is shared by every duplicate;
+    the duplicate groups are reported with the completion message.
+    When mixed_raster_dir is given, "TIF (Intermediate)" pages are also exported as the bilevel
+    TIFF plus JPEG crops of their colored regions.
+    The analysis runs on the selected execution backend; results are the same in every mode.
+    The "pipeline" mode overlaps file reads with decoding and analysis through bounded queues
+    and logs the stall time of every stage; "adaptive" also tunes the number of readers and
+    analyzers while it runs.
+    If the job handle is cancelled, the work in flight is finished and a "cancelled" message
+    carrying the partial results is sent instead of "complete".
+    When journal_path is given, every decision is appended to a checkpoint journal; with
+    resume=True, documents already in a matching journal are not processed again and their
+    journaled decisions are merged into the results.
+    With sorted_output=True, documents are dispatched in final report order and results pass
+    through a small reorder window, so log entries are streamed to the GUI as ("entries", [...])
+    messages and written to the TSV/Excel reports while the run is in progress, already sorted.
+    Otherwise the reports are written once the run ends.
+    With staging, JPGs on a slow network share are copied to a bounded local cache just
+    ahead of the workers and removed once analyzed.
+    The input directories may be folders inside a ZIP or TAR archive, for example
+    "Box 12.zip/Folder 3/JPG"; pages are then decoded from the archive in memory, and
+    unless sorted_output asks for report order they are dispatched in archive order, so
+    the archive is read front to back.
+
+    Parameters:
+        input_dir_jpg (str): Directory containing JPG files, possibly inside an archive.
+        input_dir_tiff (str): Directory containing TIFF files, possibly inside an archive.
+        progress_queue (queue.Queue): Queue to communicate progress to the GUI. Progress updates are
+                                      coalesced and dropped rather than blocking when it is full.
+        low_threshold (float): Low gray threshold percentage.
+        high_threshold (float): High gray threshold percentage.
+        mixed_raster_dir (str): Directory for mixed-raster output, or None to skip it.
+        execution_mode (str): "serial", "threads", "processes", "pipeline", "adaptive" or "shared".
+        max_workers (int): Number of workers for the pool backends or pipeline analyzers; defaults to the CPU count.
+        pipeline_options (dict): Extra keyword arguments for iter_pipeline, such as reader_threads and queue depths.
+        job (jobs.JobHandle): Optional handle for cancelling, pausing and resuming the run.
+        journal_path (str): File path of the checkpoint journal, or None to run without one (see
+                            journal.default_journal_path). If it cannot be opened or written, the run goes on
+                            without it. It is deleted once the run completes.
+        resume (bool): Skip documents recorded in an existing journal for the same run.
+        executor (concurrent.futures.Executor): Optional long-lived pool reused across runs, see iter_task_results.
+        sorted_output (bool): Dispatch in report order and stream log entries in final order.
+        tsv_path (str): File path of a TSV log to write, or None.
+        excel_path (str): File path of an Excel log to write, or None.
+        dispatch (str): One of DISPATCH_ORDERS; defaults to "report" with sorted_output and "size" otherwise.
+                        Use "physical" for folders on spinning disks or USB drives; it is the default
+                        for archive input without sorted_output.
+        orientation_dir (str): Directory for upright copies of the pages (JPG and TIFFs) that are confidently
+                               not upright, estimated from the raster decoded for the gray analysis, so no
+                               file is decoded twice; or None to skip it. The scanned files are never changed.
+        staging (dict): Keyword arguments for staging.StagingCache, such as cache_dir and max_bytes,
+                        or None to read files in place.
+    """
+    journal = None
+    report = None
+    try:
+        plan = plan_documents(input_dir_jpg, input_dir_tiff, low_threshold, high_threshold, mixed_raster_dir,
+                              orientation_dir)
+        # The reorder window expects every document, including those restored from the journal
+        full_plan = plan
+        if tsv_path or excel_path:
+            report = ReportWriter(tsv_path, excel_path)
+
+        completed_results = []
+        if journal_path:
+            journal = CheckpointJournal(journal_path, {
+                "input_dir_jpg": os.path.abspath(input_dir_jpg),
+                "input_dir_tiff": os.path.abspath(input_dir_tiff),
+                "low_threshold": low_threshold,
+                "high_threshold": high_threshold,
+                # Output options too, so a resumed run writes every page's output the same way
+                "mixed_raster_dir": os.path.abspath(mixed_raster_dir) if mixed_raster_dir else None,
+                "orientation_dir": os.path.abspath(orientation_dir) if orientation_dir else None,
+            })
+            try:
+                completed_results = [record_to_result(record) for record in journal.open(resume)]
+            except OSError as e:
+                # A journal only protects against crashes; the run itself does not need it
+                logger.warning(f"Could not open journal '{journal_path}'; running without one: {str(e)}")
+                journal = None
+            plan = exclude_completed(plan, {result.jpg_file for result in completed_results})
+
+        # List to hold all log entries
+        log_entries = []
+
+        # Coalesces progress so the loop never waits on the GUI
+        reporter = ProgressReporter(progress_queue, plan["total_files"])
+
+        # Journaled decisions count as done; the rest are analyzed now
+        if dispatch is None:
+            if sorted_output:
+                dispatch = "report"
+            elif is_archive_path(input_dir_jpg):
+                dispatch = "physical"  # Archive order
+            else:
+                dispatch = "size"
+        results = iter_planned_documents(plan, execution_mode, max_workers, pipeline_options, job, executor, dispatch,
+                                         staging)
+        if journal is not None:
+            results = journal_results(results, journal)
+        results = itertools.chain(completed_results, results)
+        if sorted_output:
+            results = iter_planned_documents_sorted(full_plan, results)
+        for result in results:
+            if result.skipped:
+                reporter.file_done(skipped=True)
+                continue
+            entry = result.to_log_entry()
+            log_entries.append(entry)
+            if sorted_output:
+                reporter.file_done(result.jpg_file, flagged=result.flagged == "Yes", entry=entry)
+                if report is not None:
+                    report.write([entry])
+            else:
+                reporter.file_done(result.jpg_file, flagged=result.flagged == "Yes")
+
+        flagged_count = reporter.flagged
         # Sort the log entries based on the sort key (first digit, then last four digits)
         log_entries_sorted = sorted(log_entries, key=lambda x: x[0])
-
+        if report is not None:
+            if not sorted_output:
+                report.write(log_entries_sorted)
+            report.close(plan["duplicate_groups"])
+            report = None
+
+    except ProcessingError as e:
+        logger.error(str(e))
+        post_final(progress_queue, ("error", str(e)))
+        return
     except Exception as e:
         logger.error(f"An unexpected error occurred during processing: {str(e)}")
-        progress_queue.put(("error", f"An unexpected error occurred: {str(e)}"))
+        post_final(progress_queue, ("error", f"An unexpected error occurred: {str(e)}"))
         return
+    finally:
+        if journal is not None:
+            journal.close()
+        if report is not None:
+            report.close()
 
     # ---------------------------- Notify Completion with Log Data ---------------------------- #
+    if job is not None and job.cancelled:
+        cancel_message = f"Processing cancelled after {len(log_entries_sorted)} of {plan['total_files']} files."
+        logger.info(cancel_message)
+        reporter.finish("cancelled", cancel_message, flagged_count, log_entries_sorted, plan["duplicate_groups"])
+        return
+
+    if journal is not None:
+        # Nothing is left to resume
+        journal.discard()
     completion_message = "Processing complete."
     logger.info(completion_message)
-    progress_queue.put(("complete", completion_message, flagged_count, log_entries_sorted))
-
+    reporter.finish("complete", completion_message, flagged_count, log_entries_sorted, plan["duplicate_groups"])
@@ -0,0 +1,157 @@
+# progress.py
+
+import time
+import queue
+import logging
+from collections import deque
+
+logger = logging.getLogger()
+
+# At most this many progress updates are posted per second
+DEFAULT_MAX_RATE = 20.0
+# Maximum number of messages waiting in the GUI queue
+PROGRESS_QUEUE_SIZE = 100
+# Seconds a final message waits for room in the queue before the GUI is taken to be gone
+FINAL_PUT_TIMEOUT = 30.0
+
+def post_final(progress_queue, message, timeout=FINAL_PUT_TIMEOUT):
+    """
+    Post a message that ends a run (complete, cancelled, error), waiting at most timeout
+    seconds for room, so a closed or hung GUI cannot keep the processing thread alive.
+
+    Returns:
+        bool: True if the message was posted.
+    """
+    try:
+        progress_queue.put(message, timeout=timeout)
+        return True
+    except queue.Full:
+        logger.warning(f"The GUI did not take the '{message[0]}' message within {timeout:.0f}s; dropping it.")
+        return False
+
+class ProgressReporter:
+    """
+    Coalesces per-file progress into occasional updates on a bounded queue.
+
+    Updates are posted at most max_rate times per second and only after at least
+    min_batch files, with put_nowait: when the queue is full the update is dropped,
+    since the next one supersedes it. The processing loop therefore never blocks on a
+    slow GUI. Final messages (complete, cancelled, error) wait for room, but at most
+    FINAL_PUT_TIMEOUT seconds (see post_final).
+
+    Each update is a ("current_file", name) message followed by a
+    ("progress", processed, total, counters) message, where counters holds the
+    aggregate processed, flagged and skipped counts so far.
+
+    Log entries passed to file_done are collected and posted with the next update as
+    one ("entries", [entry, ...]) message. Unlike progress, entries are not dropped:
+    while the queue is full they wait in a backlog of at most one message, which
+    later entries are merged into, and go out ahead of the next progress update.
+    """
+
+    def __init__(self, progress_queue, total_files, max_rate=DEFAULT_MAX_RATE, min_batch=1):
+        """
+        Parameters:
+            progress_queue (queue.Queue): Queue read by the GUI; should be bounded.
+            total_files (int): Total number of files in the run.
+            max_rate (float): Maximum number of updates per second.
+            min_batch (int): Minimum number of files between updates.
+        """
+        self.progress_queue = progress_queue
+        self.total_files = total_files
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self.min_batch = max(1, min_batch)
+        self.processed = 0
+        self.flagged = 0
+        self.skipped = 0
+        self.dropped_updates = 0
+        self._current_file = None
+        self._entries = []
+        self._backlog = deque()
+        self._last_reported = 0
+        self._last_report_time = float('-inf')
+
+    @property
+    def counters(self):
+        return {"processed": self.processed, "flagged": self.flagged, "skipped": self.skipped}
+
+    def file_done(self, jpg_file=None, flagged=False, skipped=False, entry=None):
+        """
+        Record a finished file and post an update if one is due.
+
+        Parameters:
+            jpg_file (str): Name of the finished file, or None for files that were not analyzed.
+            flagged (bool): Whether the file was flagged as "TIF (Intermediate)".
+            skipped (bool): Whether the file was skipped.
+            entry (tuple): Log entry to stream to the GUI, or None.
+        """
+        self.processed += 1
+        if flagged:
+            self.flagged += 1
+        if skipped:
+            self.skipped += 1
+        if jpg_file is not None:
+            self._current_file = jpg_file
+        if entry is not None:
+            self._entries.append(entry)
+
+        now = time.monotonic()
+        if self.processed == self.total_files or (
+            self.processed - self._last_reported >= self.min_batch
+            and now - self._last_report_time >= self.min_interval
+        ):
+            self._post_update(now)
+
+    def flush(self):
+        """Post the latest progress now if anything changed since the last update."""
+        if self.processed != self._last_reported:
+            self._post_update(time.monotonic())
+
+    def _post_entries(self):
+        """Move collected entries to the backlog and post as much of it as fits; returns True if it all did."""
+        if self._entries:
+            if self._backlog:
+                self._backlog[-1][1].extend(self._entries)
+            else:
+                self._backlog.append(("entries", self._entries))
+            self._entries = []
+        try:
+            while self._backlog:
+                self.progress_queue.put_nowait(self._backlog[0])
+                self._backlog.popleft()
+        except queue.Full:
+            return False
+        return True
+
+    def _post_update(self, now):
+        self._last_reported = self.processed
+        self._last_report_time = now
+        if not self._post_entries():
+            # Entries still waiting go first; this update is superseded by the next one
+            self.dropped_updates += 1
+            return
+        try:
+            if self._current_file is not None:
+                self.progress_queue.put_nowait(("current_file", self._current_file))
+                self._current_file = None
+            self.progress_queue.put_nowait(("progress", self.processed, self.total_files, self.counters))
+        except queue.Full:
+            # The GUI is behind; a later update will carry the same information
+            self.dropped_updates += 1
+
+    def finish(self, *message):
+        """
+        Post any waiting entries, the latest progress and a final message, each waiting
+        for room at most FINAL_PUT_TIMEOUT seconds (see post_final).
+
+        Parameters:
+            *message: The final message tuple, for example ("complete", text, ...).
+        """
+        if self.dropped_updates:
+            logger.info(f"Dropped {self.dropped_updates} progress updates while the GUI was busy.")
+        self._last_reported = self.processed
+        self._post_entries()
+        self._backlog += [("progress", self.processed, self.total_files, self.counters), message]
+        while self._backlog:
+            if not post_final(self.progress_queue, self._backlog.popleft()):
+                self._backlog.clear()
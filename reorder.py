@@ -0,0 +1,58 @@
+# reorder.py
+
+class ReorderBuffer:
+    """
+    Turn results that arrive in any order back into a fixed final order.
+    Each result is held only until every result that sorts before it has arrived,
+    so the buffer stays small when results arrive roughly in order.
+    """
+
+    def __init__(self, expected_keys):
+        """
+        Parameters:
+            expected_keys (iterable): The unique key of every result that will be pushed.
+        """
+        self._order = sorted(expected_keys)
+        self._next = 0
+        self._pending = {}
+        self.peak = 0  # Most results held back at once
+
+    def push(self, key, item):
+        """
+        Add a result and release every result that is now next in order.
+
+        Parameters:
+            key: The result's key, one of the expected keys.
+            item: The result.
+
+        Returns:
+            list: Results ready to be emitted, in final order.
+        """
+        self._pending[key] = item
+        self.peak = max(self.peak, len(self._pending))
+        ready = []
+        while self._next < len(self._order) and self._order[self._next] in self._pending:
+            ready.append(self._pending.pop(self._order[self._next]))
+            self._next += 1
+        return ready
+
+    def drain(self):
+        """
+        Release every held result in final order, skipping the gaps left by results that
+        never arrived (for example after a cancelled run).
+
+        Returns:
+            list: The held results, in final order.
+        """
+        ready = [self._pending.pop(key) for key in self._order[self._next:] if key in self._pending]
+        self._next = len(self._order)
+        return ready
+
+    def __len__(self):
+        """Number of results held back waiting for an earlier result."""
+        return len(self._pending)
+
+    @property
+    def done(self):
+        """True once every expected result has been released."""
+        return self._next == len(self._order)
@@ -0,0 +1,95 @@
+# reports.py
+
+import csv
+import logging
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+logger = logging.getLogger()
+
+# Column headers of the selection log, as written by the GUI downloads
+TSV_HEADERS = ['Document', 'Gray_Percentage', 'Selected_Format', 'Flagged_Files']
+EXCEL_HEADERS = ['Document', 'Gray Percentage (%)', 'Selected Format', 'Flagged_Files']
+# Column widths of the streamed Excel log; widths must be set before the first row in write-only mode
+EXCEL_COLUMN_WIDTHS = {'A': 40, 'B': 20, 'C': 20, 'D': 15}
+
+class ReportWriter:
+    """
+    Writes selection log entries to a TSV and/or Excel file as they arrive, so a run that
+    produces entries in final order leaves a readable, sorted report behind at every point.
+
+    The TSV is flushed after every batch. The Excel workbook is written in openpyxl's
+    write-only mode, which keeps only the current row in memory; it is saved on close.
+    """
+
+    def __init__(self, tsv_path=None, excel_path=None):
+        """
+        Parameters:
+            tsv_path (str): File path of the TSV log, or None to skip it.
+            excel_path (str): File path of the Excel log, or None to skip it.
+        """
+        self.tsv_path = tsv_path
+        self.excel_path = excel_path
+        self.rows = 0
+        self._tsv_file = None
+        self._tsv_writer = None
+        self._workbook = None
+        self._sheet = None
+        if tsv_path:
+            self._tsv_file = open(tsv_path, mode='w', newline='')
+            self._tsv_writer = csv.writer(self._tsv_file, delimiter='\t')
+            self._tsv_writer.writerow(TSV_HEADERS)
+            self._tsv_file.flush()
+        if excel_path:
+            self._workbook = Workbook(write_only=True)
+            self._sheet = self._workbook.create_sheet(title="Selection Log")
+            for column_letter, width in EXCEL_COLUMN_WIDTHS.items():
+                self._sheet.column_dimensions[column_letter].width = width
+            self._sheet.append(self._header_row(EXCEL_HEADERS))
+
+    def _header_row(self, headers):
+        cells = []
+        for header in headers:
+            cell = WriteOnlyCell(self._sheet, value=header)
+            cell.font = Font(bold=True)
+            cells.append(cell)
+        return cells
+
+    def write(self, entries):
+        """
+        Append log entries in the order given.
+
+        Parameters:
+            entries (list): Log entries (sort_key, documents, gray_pct_str, selected_format, flagged).
+        """
+        for _, selected_documents, gray_pct_str, selected_format, flagged in entries:
+            if self._tsv_writer is not None:
+                self._tsv_writer.writerow([selected_documents, gray_pct_str, selected_format, flagged])
+            if self._sheet is not None:
+                self._sheet.append([selected_documents, float(gray_pct_str), selected_format, flagged])
+        self.rows += len(entries)
+        if self._tsv_file is not None:
+            self._tsv_file.flush()
+
+    def close(self, duplicate_groups=()):
+        """
+        Finish the reports. The Excel log gets a "Duplicate Groups" sheet if there are any.
+
+        Parameters:
+            duplicate_groups (list): Groups of byte-identical JPGs, representative first.
+        """
+        if self._tsv_file is not None:
+            self._tsv_file.close()
+            self._tsv_file = self._tsv_writer = None
+            logger.info(f"Wrote {self.rows} rows to '{self.tsv_path}'.")
+        if self._workbook is not None:
+            if duplicate_groups:
+                self._sheet = self._workbook.create_sheet(title="Duplicate Groups")
+                self._sheet.append(self._header_row(['Group', 'Representative', 'Duplicates']))
+                for number, group in enumerate(duplicate_groups, start=1):
+                    self._sheet.append([number, group[0], ', '.join(group[1:])])
+            self._workbook.save(self.excel_path)
+            self._workbook = self._sheet = None
+            logger.info(f"Wrote {self.rows} rows to '{self.excel_path}'.")
@@ -0,0 +1,116 @@
+# scheduling.py
+
+import heapq
+import logging
+
+from archives import file_size
+
+logger = logging.getLogger()
+
+def task_cost(task):
+    """
+    Estimate the processing cost of a task from the size of its representative JPG.
+    Decode and analysis time grow with the page area, which the compressed size tracks closely
+    enough to rank pages, and the size is already known from the listing (or, inside an
+    archive, from its index) so no file is opened.
+
+    Parameters:
+        task (tuple): A task built by processing.plan_documents.
+
+    Returns:
+        int: The file size in bytes, or 0 if it cannot be read.
+    """
+    try:
+        return file_size(task[0][0][0])
+    except OSError:
+        return 0
+
+def largest_first_order(costs):
+    """
+    Longest-processing-time-first order: task indices by decreasing cost, ties kept in listing order.
+
+    Parameters:
+        costs (list): Estimated cost of each task.
+
+    Returns:
+        list: Task indices in dispatch order.
+    """
+    return sorted(range(len(costs)), key=lambda index: -costs[index])
+
+def balanced_chunk_order(costs, chunksize):
+    """
+    Group tasks into chunks of balanced total cost and order the chunks largest first.
+
+    Tasks are placed largest first into the least loaded chunk that still has room. Every
+    chunk except the last is full, so cutting the returned order into consecutive runs of
+    chunksize (as executors.iter_map_bounded does) reproduces the chunks exactly.
+
+    Parameters:
+        costs (list): Estimated cost of each task.
+        chunksize (int): Number of tasks per chunk.
+
+    Returns:
+        list: Task indices in dispatch order.
+    """
+    if chunksize <= 1:
+        return largest_first_order(costs)
+
+    chunk_count = -(-len(costs) // chunksize)
+    capacities = [chunksize] * (chunk_count - 1) + [len(costs) - chunksize * (chunk_count - 1)]
+    chunks = [[] for _ in range(chunk_count)]
+    loads = [(0, chunk_index) for chunk_index in range(chunk_count)]
+    for index in largest_first_order(costs):
+        load, chunk_index = heapq.heappop(loads)
+        chunks[chunk_index].append(index)
+        if len(chunks[chunk_index]) < capacities[chunk_index]:
+            heapq.heappush(loads, (load + costs[index], chunk_index))
+
+    # The short chunk must stay last to keep the chunk boundaries aligned
+    full_chunks = sorted(chunks[:-1], key=lambda chunk: -sum(costs[index] for index in chunk))
+    return [index for chunk in full_chunks + chunks[-1:] for index in chunk]
+
+def estimate_makespan(costs, order, workers, chunksize=1):
+    """
+    Simulate a pool where each idle worker takes the next chunk in dispatch order.
+
+    Parameters:
+        costs (list): Estimated cost of each task.
+        order (list): Task indices in dispatch order.
+        workers (int): Number of workers.
+        chunksize (int): Number of tasks per chunk.
+
+    Returns:
+        float: The estimated finishing time of the last worker, in cost units.
+    """
+    finish_times = [0] * max(1, workers)
+    for start in range(0, len(order), chunksize):
+        chunk_cost = sum(costs[index] for index in order[start:start + chunksize])
+        heapq.heapreplace(finish_times, finish_times[0] + chunk_cost)
+    return max(finish_times)
+
+def schedule_tasks(tasks, workers, chunksize=1):
+    """
+    Order tasks so the largest pages start first and no large page is left to run alone at
+    the end of a run. Logs the estimated makespan against the listing order.
+
+    Parameters:
+        tasks (list): Tasks built by processing.plan_documents.
+        workers (int): Number of workers processing the tasks.
+        chunksize (int): Number of tasks sent to a worker at once.
+
+    Returns:
+        list: Task indices in dispatch order.
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        return list(range(len(tasks)))
+
+    costs = [task_cost(task) for task in tasks]
+    order = balanced_chunk_order(costs, chunksize)
+    listing_makespan = estimate_makespan(costs, range(len(tasks)), workers, chunksize)
+    scheduled_makespan = estimate_makespan(costs, order, workers, chunksize)
+    if listing_makespan:
+        logger.info(
+            f"Largest-first scheduling of {len(tasks)} tasks on {workers} workers: estimated makespan "
+            f"{scheduled_makespan / listing_makespan:.1%} of listing order."
+        )
+    return order
@@ -0,0 +1,219 @@
+# shared_ring.py
+
+import os
+import time
+import queue
+import threading
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from thread_budget import apply_thread_budget, library_threads
+
+logger = logging.getLogger()
+
+# Number of page slots in the ring; decoders wait for a free slot, so this bounds the rasters in flight
+DEFAULT_SLOT_COUNT = 8
+# Size of each slot: a 300 dpi grayscale tabloid page (3300 x 5100) with room to spare
+DEFAULT_SLOT_BYTES = 32 * 1024 * 1024
+# How often the parent checks for dead workers while waiting for results
+POLL_INTERVAL = 0.1
+
+class SlotRing:
+    """
+    Fixed-size slots in one shared memory block. A slot holds one decoded page; processes
+    exchange (slot, shape, dtype) descriptors and map the slot as a numpy array without copying.
+    """
+
+    def __init__(self, slot_count=DEFAULT_SLOT_COUNT, slot_bytes=DEFAULT_SLOT_BYTES, name=None):
+        """
+        Parameters:
+            slot_count (int): Number of slots.
+            slot_bytes (int): Size of each slot in bytes.
+            name (str): Name of an existing block to attach to, or None to create a new one.
+        """
+        self.slot_count = slot_count
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=slot_count * slot_bytes)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def view(self, slot, shape, dtype=np.uint8):
+        """Map a slot as an array of the given shape. The view must be dropped before the ring is closed."""
+        return np.ndarray(shape, dtype=dtype, buffer=self.memory.buf, offset=slot * self.slot_bytes)
+
+    def fits(self, image):
+        return image.nbytes <= self.slot_bytes
+
+    def close(self):
+        """Detach from the block; the creating process also frees it."""
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+def _decoder(ring_name, slot_count, slot_bytes, task_queue, free_slots, descriptor_queue, result_queue,
+             decode_func, analyze_func, threads):
+    """Decoder process: decode each task into a free slot and pass its descriptor to the analyzers."""
+    apply_thread_budget(threads)
+    ring = SlotRing(slot_count, slot_bytes, ring_name)
+    try:
+        while True:
+            item = task_queue.get()
+            if item is None:
+                break
+            index, task = item
+            try:
+                image = decode_func(task)
+            except Exception as e:
+                logger.error(f"Decode failed for task {index}: {str(e)}")
+                image = None
+            if image is None:
+                result_queue.put((index, None))
+            elif not ring.fits(image):
+                # Too large for a slot: analyze it here rather than failing the page
+                logger.debug(f"Page of task {index} ({image.nbytes} bytes) exceeds the slot size; analyzing in the decoder.")
+                result_queue.put((index, analyze_func(task, image)))
+            else:
+                slot = free_slots.get()  # Blocks while every slot is in use, bounding memory
+                ring.view(slot, image.shape, image.dtype)[...] = image
+                descriptor_queue.put((index, task, slot, image.shape, image.dtype.str))
+            del image
+    finally:
+        ring.close()
+
+def _analyzer(ring_name, slot_count, slot_bytes, descriptor_queue, free_slots, result_queue, analyze_func, threads):
+    """Analyzer process: analyze pages in place in their slots and hand the slots back."""
+    apply_thread_budget(threads)
+    ring = SlotRing(slot_count, slot_bytes, ring_name)
+    try:
+        while True:
+            item = descriptor_queue.get()
+            if item is None:
+                break
+            index, task, slot, shape, dtype = item
+            page = ring.view(slot, shape, np.dtype(dtype))
+            try:
+                result = analyze_func(task, page)
+            except Exception as e:
+                logger.error(f"Analysis failed for task {index}: {str(e)}")
+                result = None
+            del page  # Drop the view before the slot is reused
+            free_slots.put(slot)
+            result_queue.put((index, result))
+    finally:
+        ring.close()
+
+def iter_shared_pipeline(tasks, decode_func, analyze_func, decode_workers=None, analyze_workers=None,
+                         slot_count=DEFAULT_SLOT_COUNT, slot_bytes=DEFAULT_SLOT_BYTES, job=None):
+    """
+    Decode and analyze tasks in separate processes that hand pages over through a shared
+    memory ring, so only small descriptors are pickled between them. Peak raster memory is
+    bounded by slot_count x slot_bytes plus one page being decoded per decoder.
+
+    Parameters:
+        tasks (list): The tasks to process.
+        decode_func (callable): Picklable decode_func(task) -> numpy array, or None if the page can't be read.
+        analyze_func (callable): Picklable analyze_func(task, array) -> result. The array is a view
+                                 into the ring and must not be kept after returning.
+        decode_workers (int): Number of decoder processes; defaults to half the CPU count (at least 1).
+        analyze_workers (int): Number of analyzer processes; defaults to half the CPU count (at least 1).
+        slot_count (int): Number of page slots in the ring.
+        slot_bytes (int): Size of each slot; larger pages are analyzed in the decoder instead.
+        job (jobs.JobHandle): Optional handle; while paused no new tasks are handed out, and after
+                              a cancel the pages already handed out are finished and yielded.
+
+    Yields:
+        tuple: (index, result) in completion order. The result is None if the task failed.
+    """
+    cpus = os.cpu_count() or 1
+    decode_workers = decode_workers or max(1, cpus // 2)
+    analyze_workers = analyze_workers or max(1, cpus // 2)
+    threads = library_threads("processes", decode_workers + analyze_workers)
+    context = multiprocessing.get_context()
+    ring = SlotRing(slot_count, slot_bytes)
+    task_queue = context.Queue(maxsize=2 * slot_count)
+    free_slots = context.Queue()
+    descriptor_queue = context.Queue()
+    result_queue = context.Queue()
+    for slot in range(slot_count):
+        free_slots.put(slot)
+
+    workers = [
+        context.Process(target=_decoder, name=f"ring-decode-{n}", daemon=True, args=(
+            ring.name, slot_count, slot_bytes, task_queue, free_slots, descriptor_queue, result_queue,
+            decode_func, analyze_func, threads))
+        for n in range(decode_workers)
+    ] + [
+        context.Process(target=_analyzer, name=f"ring-analyze-{n}", daemon=True, args=(
+            ring.name, slot_count, slot_bytes, descriptor_queue, free_slots, result_queue, analyze_func, threads))
+        for n in range(analyze_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    logger.info(f"Shared-memory ring: {decode_workers} decoders, {analyze_workers} analyzers, "
+                f"{slot_count} slots of {slot_bytes // (1024 * 1024)} MB.")
+
+    stop_event = threading.Event()
+    submitted = [0]
+    feeding_done = threading.Event()
+
+    def feeder():
+        try:
+            for index, task in enumerate(tasks):
+                while job is not None and job.paused and not stop_event.is_set():
+                    job.wait_while_paused(POLL_INTERVAL)
+                if stop_event.is_set() or (job is not None and job.cancelled):
+                    break
+                while not stop_event.is_set():
+                    try:
+                        task_queue.put((index, task), timeout=POLL_INTERVAL)
+                        submitted[0] += 1
+                        break
+                    except queue.Full:
+                        continue
+        finally:
+            feeding_done.set()
+
+    feeder_thread = threading.Thread(target=feeder, name="ring-feed", daemon=True)
+    feeder_thread.start()
+
+    received = 0
+    start = time.perf_counter()
+    try:
+        while not (feeding_done.is_set() and received == submitted[0]):
+            try:
+                item = result_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                dead = [worker.name for worker in workers if not worker.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Shared-memory worker(s) exited unexpectedly: {', '.join(dead)}")
+                continue
+            received += 1
+            yield item
+    finally:
+        finished = feeding_done.is_set() and received == submitted[0]
+        stop_event.set()
+        feeder_thread.join()
+        if finished:
+            # Every page is done, so the workers are idle and can exit cleanly
+            for _ in range(decode_workers):
+                task_queue.put(None)
+            for _ in range(analyze_workers):
+                descriptor_queue.put(None)
+            for worker in workers:
+                worker.join()
+        else:
+            # Stopped early: pages still queued would keep the workers busy, so stop them now
+            for worker in workers:
+                worker.terminate()
+                worker.join()
+        ring.close()
+        logger.info(f"Shared-memory ring processed {received} pages in {time.perf_counter() - start:.2f}s.")
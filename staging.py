@@ -0,0 +1,194 @@
+# staging.py
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import logging
+
+from archives import open_file, file_size
+
+logger = logging.getLogger()
+
+# Local space the cache may fill with files waiting to be processed
+DEFAULT_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+# Files copied from the share at once
+DEFAULT_COPY_THREADS = 4
+# Read size of each copy; large blocks turn a file into a few sequential network reads
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024
+# How often waiting threads check whether staging was stopped
+POLL_INTERVAL = 0.1
+
+def staged_task(task, cached_path):
+    """Return a copy of a task whose representative JPG is read from the cache."""
+    members, *settings = task
+    return tuple([[(cached_path, members[0][1])] + members[1:]] + settings)
+
+class StagingCache:
+    """
+    Bounded local copy of the files a run is about to read from a slow network share.
+
+    Copy threads fetch the representative JPG of upcoming tasks, in dispatch order and with
+    large-block reads, into a local cache directory, so workers read from local disk instead
+    of issuing many small random reads over the network. Each file is evicted as soon as its
+    task's result arrives (release), and copying waits while the files that are staged but
+    not yet processed fill max_bytes. A file that cannot be staged is read from the share.
+    A JPG inside an archive is staged as a plain file under its own name.
+
+    Only the representative JPG is staged: it is the one file every task reads. The paired
+    TIFFs are needed only by the mixed-raster export of intermediate pages.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_CACHE_BYTES, copy_threads=DEFAULT_COPY_THREADS,
+                 block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Parameters:
+            cache_dir (str): Local folder for the cache, or None for a new folder in the system temp directory.
+                             The folder is created if needed and the staged files are removed on close.
+            max_bytes (int): Most bytes of staged but unprocessed files kept at once.
+            copy_threads (int): Files copied at once.
+            block_size (int): Read size of each copy.
+        """
+        self.owns_dir = cache_dir is None
+        if self.owns_dir:
+            self.cache_dir = tempfile.mkdtemp(prefix="gray-staging-")
+        else:
+            self.cache_dir = os.path.join(cache_dir, f"staging-{os.getpid()}-{id(self):x}")
+            os.makedirs(self.cache_dir)
+        self.max_bytes = max_bytes
+        self.copy_threads = max(1, copy_threads)
+        self.block_size = block_size
+        self.staged_bytes = 0
+        self.copied_bytes = 0
+        self.copy_seconds = 0.0
+        self.failed = 0
+        self.skipped = 0
+        self._consumed = -1
+        self._copying = set()
+        self._entries = {}
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def _copy(self, source, destination):
+        """Copy a file with large-block reads."""
+        with open_file(source) as src, open(destination, 'wb') as dst:
+            shutil.copyfileobj(src, dst, self.block_size)
+
+    def _reserve(self, position, size):
+        """
+        Wait until size bytes fit in the cache (the first file always fits) and mark the
+        position as being copied. Returns False if the consumer already passed the position
+        or staging was stopped; the file is then read from the share.
+        """
+        with self._condition:
+            while self.staged_bytes and self.staged_bytes + size > self.max_bytes:
+                if self._stopped.is_set() or position <= self._consumed:
+                    return False
+                self._condition.wait(POLL_INTERVAL)
+            if position <= self._consumed:
+                return False
+            self.staged_bytes += size
+            self._copying.add(position)
+            return True
+
+    def iter_staged(self, tasks, keys):
+        """
+        Yield tasks in order, each rewritten to read its JPG from the cache once it is staged.
+        Copy threads work ahead of the consumer within the cache's byte budget. The consumer
+        never waits for space: a task whose copy has not started when it is reached is
+        yielded unchanged, because the space it needs is only freed by results that may
+        still be waiting behind it.
+
+        Parameters:
+            tasks (list): Tasks in dispatch order.
+            keys (list): A unique key per task, passed to release once the task is done.
+
+        Yields:
+            tuple: The staged task, or the original task if its JPG was not staged.
+        """
+        ready = [threading.Event() for _ in tasks]
+        staged = [None] * len(tasks)
+        next_position = [0]
+        # Held while reserving, so space is handed out in dispatch order
+        position_lock = threading.Lock()
+
+        def copier():
+            while not self._stopped.is_set():
+                with position_lock:
+                    position = next_position[0]
+                    next_position[0] += 1
+                    if position >= len(tasks):
+                        return
+                    source = tasks[position][0][0][0]
+                    try:
+                        size = file_size(source)
+                    except OSError as e:
+                        logger.warning(f"Could not stage '{source}'; reading it from the share: {str(e)}")
+                        self.failed += 1
+                        ready[position].set()
+                        continue
+                    if not self._reserve(position, size):
+                        self.skipped += 1
+                        ready[position].set()
+                        continue
+                try:
+                    destination = os.path.join(self.cache_dir, str(position), os.path.basename(source))
+                    os.makedirs(os.path.dirname(destination))
+                    start = time.perf_counter()
+                    self._copy(source, destination)
+                    with self._condition:
+                        self.copy_seconds += time.perf_counter() - start
+                        self.copied_bytes += size
+                        self._entries[keys[position]] = (destination, size)
+                    staged[position] = staged_task(tasks[position], destination)
+                except Exception as e:
+                    logger.warning(f"Could not stage '{source}'; reading it from the share: {str(e)}")
+                    self.failed += 1
+                    with self._condition:
+                        self.staged_bytes -= size
+                        self._condition.notify_all()
+                finally:
+                    ready[position].set()
+
+        self._threads = [threading.Thread(target=copier, name=f"staging-copy-{n}", daemon=True)
+                         for n in range(self.copy_threads)]
+        for thread in self._threads:
+            thread.start()
+        for position, task in enumerate(tasks):
+            with self._condition:
+                self._consumed = position
+                copying = position in self._copying
+                self._condition.notify_all()
+            if copying:
+                while not ready[position].wait(POLL_INTERVAL):
+                    if self._stopped.is_set():
+                        return
+            yield staged[position] or task
+
+    def release(self, key):
+        """Evict the staged file of a finished task, freeing its space for upcoming files."""
+        with self._condition:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            path, size = entry
+            self.staged_bytes -= size
+            self._condition.notify_all()
+        try:
+            os.remove(path)
+            os.rmdir(os.path.dirname(path))
+        except OSError as e:
+            logger.debug(f"Could not evict '{path}': {str(e)}")
+
+    def close(self):
+        """Stop copying and remove the cache folder with anything still staged."""
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        rate = self.copied_bytes / (1024 * 1024) / self.copy_seconds if self.copy_seconds else 0.0
+        logger.info(f"Staged {self.copied_bytes / (1024 * 1024):.1f} MB through '{self.cache_dir}' "
+                    f"({rate:.1f} MB/s per copy thread); {self.skipped} files were reached before they could be "
+                    f"staged and {self.failed} could not be copied.")
@@ -0,0 +1,58 @@
+# conftest.py
+
+import os
+import sys
+import queue
+
+import cv2
+import numpy as np
+import pytest
+
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import processing
+
+# Pages of the synthetic scan folder: (document number, share of gray pixels)
+PAGES = [(number, share) for number, share in enumerate((0.0, 0.02, 0.05, 0.08, 0.12, 0.14, 0.2, 0.3, 0.5, 0.7))]
+
+def _page(share, seed):
+    """A white page with black rules and a mid-gray band covering about the given share of it."""
+    page = np.full((240, 176), 255, np.uint8)
+    page[16 + 8 * (seed % 4)::48, 16:160] = 0
+    # Aligned to the 8x8 JPEG blocks, so compression adds little gray around the edges
+    page[:int(240 * share) // 8 * 8, :] = 128
+    return page
+
+def make_scan_folder(root):
+    """
+    Write a parent folder with JPG/ and TIF/ subfolders as the scanner delivers them: a front
+    (1...) JPG and its TIFF per page, one byte-identical duplicate JPG and one JPG without a TIFF.
+    """
+    os.makedirs(os.path.join(root, "JPG"))
+    os.makedirs(os.path.join(root, "TIF"))
+    for number, share in PAGES:
+        page = _page(share, number)
+        cv2.imwrite(os.path.join(root, "JPG", f"1100{number:04d}.jpg"), cv2.cvtColor(page, cv2.COLOR_GRAY2BGR))
+        cv2.imwrite(os.path.join(root, "TIF", f"1000{number:04d}.tif"), page)
+    # Same bytes as page 3 under the number of page 20, which has a TIFF of its own
+    with open(os.path.join(root, "JPG", "11000003.jpg"), "rb") as f:
+        duplicate = f.read()
+    with open(os.path.join(root, "JPG", "11000020.jpg"), "wb") as f:
+        f.write(duplicate)
+    cv2.imwrite(os.path.join(root, "TIF", "10000020.tif"), _page(0.08, 3))
+    cv2.imwrite(os.path.join(root, "JPG", "11000099.jpg"), cv2.cvtColor(_page(0.1, 99), cv2.COLOR_GRAY2BGR))
+    return root
+
+@pytest.fixture
+def scan_folder(tmp_path):
+    return make_scan_folder(str(tmp_path / "Box 1"))
+
+def run_documents(input_dir_jpg, input_dir_tiff, **kwargs):
+    """Run process_documents with thresholds 10/15 and return the final GUI message."""
+    progress_queue = queue.Queue()
+    processing.process_documents(input_dir_jpg, input_dir_tiff, progress_queue, 10, 15, **kwargs)
+    messages = []
+    while not progress_queue.empty():
+        messages.append(progress_queue.get())
+    return messages[-1]
@@ -0,0 +1,40 @@
+# test_archives.py
+
+import os
+import shutil
+import tarfile
+
+import pytest
+
+from conftest import run_documents, make_scan_folder
+from archives import close_handles
+
+@pytest.fixture(scope="module")
+def box(tmp_path_factory):
+    """A scan folder and ZIP and TAR archives of it (JPG/ and TIF/ at the archive root)."""
+    root = tmp_path_factory.mktemp("archives")
+    folder = make_scan_folder(str(root / "Box 1"))
+    zip_path = shutil.make_archive(str(root / "Box 1"), "zip", folder)
+    tar_path = str(root / "Box 1.tar")
+    with tarfile.open(tar_path, "w") as archive:
+        for subfolder in ("JPG", "TIF"):
+            archive.add(os.path.join(folder, subfolder), arcname=subfolder)
+    yield {"folder": folder, "zip": zip_path, "tar": tar_path}
+    close_handles()
+
+@pytest.mark.parametrize("archive", ["zip", "tar"])
+@pytest.mark.parametrize("execution_mode", ["serial", "threads", "processes", "shared"])
+def test_archive_matches_folder(box, archive, execution_mode):
+    expected = run_documents(os.path.join(box["folder"], "JPG"), os.path.join(box["folder"], "TIF"),
+                             execution_mode="serial")
+    result = run_documents(os.path.join(box[archive], "JPG"), os.path.join(box[archive], "TIF"),
+                           execution_mode=execution_mode, max_workers=2)
+    assert result == expected
+
+@pytest.mark.parametrize("archive", ["zip", "tar"])
+def test_archive_staged_locally_matches_folder(box, archive, tmp_path):
+    expected = run_documents(os.path.join(box["folder"], "JPG"), os.path.join(box["folder"], "TIF"),
+                             execution_mode="serial")
+    result = run_documents(os.path.join(box[archive], "JPG"), os.path.join(box[archive], "TIF"),
+                           execution_mode="threads", max_workers=2, staging={"cache_dir": str(tmp_path)})
+    assert result == expected
@@ -0,0 +1,31 @@
+# test_execution_modes.py
+
+import os
+
+import pytest
+
+from conftest import run_documents
+from processing import PROCESSING_MODES, DISPATCH_ORDERS
+
+@pytest.fixture
+def serial_result(scan_folder):
+    return run_documents(os.path.join(scan_folder, "JPG"), os.path.join(scan_folder, "TIF"), execution_mode="serial")
+
+def test_serial_run_completes(serial_result):
+    status, _, flagged_count, log_entries, duplicate_groups = serial_result
+    assert status == "complete"
+    assert len(log_entries) == 11  # Every paired JPG, including the duplicate
+    assert 0 < flagged_count < len(log_entries)
+    assert duplicate_groups == [["11000003.jpg", "11000020.jpg"]]
+
+@pytest.mark.parametrize("dispatch", DISPATCH_ORDERS)
+@pytest.mark.parametrize("execution_mode", PROCESSING_MODES)
+def test_modes_match_serial(scan_folder, serial_result, execution_mode, dispatch):
+    result = run_documents(os.path.join(scan_folder, "JPG"), os.path.join(scan_folder, "TIF"),
+                           execution_mode=execution_mode, max_workers=2, dispatch=dispatch)
+    assert result == serial_result
+
+def test_sorted_output_matches_serial(scan_folder, serial_result):
+    result = run_documents(os.path.join(scan_folder, "JPG"), os.path.join(scan_folder, "TIF"),
+                           execution_mode="threads", max_workers=2, sorted_output=True)
+    assert result == serial_result
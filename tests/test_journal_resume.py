@@ -0,0 +1,61 @@
+# test_journal_resume.py
+
+import os
+import json
+
+import processing
+from conftest import run_documents
+from jobs import JobHandle
+
+def test_cancelled_run_resumes_from_journal(scan_folder, tmp_path, monkeypatch):
+    input_dir_jpg, input_dir_tiff = os.path.join(scan_folder, "JPG"), os.path.join(scan_folder, "TIF")
+    journal_path = str(tmp_path / "journal.jsonl")
+    uninterrupted = run_documents(input_dir_jpg, input_dir_tiff, execution_mode="serial")
+
+    # Cancel once three decisions are journaled, as the Cancel button would mid-run
+    job = JobHandle()
+    append = processing.CheckpointJournal.append
+
+    def append_then_cancel(self, record):
+        append(self, record)
+        self._appended = getattr(self, "_appended", 0) + 1
+        if self._appended == 3:
+            job.cancel()
+
+    monkeypatch.setattr(processing.CheckpointJournal, "append", append_then_cancel)
+    cancelled = run_documents(input_dir_jpg, input_dir_tiff, execution_mode="serial", job=job,
+                              journal_path=journal_path)
+    monkeypatch.undo()
+    assert cancelled[0] == "cancelled"
+    with open(journal_path) as f:
+        header, *records = [json.loads(line) for line in f]
+    assert header["input_dir_jpg"] == os.path.abspath(input_dir_jpg)
+    assert header["orientation_dir"] is None
+    assert 0 < len(records) < len(uninterrupted[3])
+
+    resumed = run_documents(input_dir_jpg, input_dir_tiff, execution_mode="serial", journal_path=journal_path,
+                            resume=True)
+    assert resumed == uninterrupted
+    assert not os.path.exists(journal_path)  # A completed run leaves nothing to resume
+
+def test_journal_for_other_thresholds_is_not_resumed(scan_folder, tmp_path):
+    input_dir_jpg, input_dir_tiff = os.path.join(scan_folder, "JPG"), os.path.join(scan_folder, "TIF")
+    journal_path = str(tmp_path / "journal.jsonl")
+    with open(journal_path, "w") as f:
+        f.write(json.dumps({"input_dir_jpg": os.path.abspath(input_dir_jpg), "low_threshold": 1}) + "\n")
+        f.write(json.dumps({"jpg_file": "11000000.jpg"}) + "\n")
+
+    resumed = run_documents(input_dir_jpg, input_dir_tiff, execution_mode="serial", journal_path=journal_path,
+                            resume=True)
+    assert resumed == run_documents(input_dir_jpg, input_dir_tiff, execution_mode="serial")
+
+def test_unwritable_journal_does_not_stop_the_run(scan_folder, tmp_path, monkeypatch):
+    input_dir_jpg, input_dir_tiff = os.path.join(scan_folder, "JPG"), os.path.join(scan_folder, "TIF")
+
+    def fail(self, record):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(processing.CheckpointJournal, "append", fail)
+    result = run_documents(input_dir_jpg, input_dir_tiff, execution_mode="serial",
+                           journal_path=str(tmp_path / "journal.jsonl"))
+    assert result == run_documents(input_dir_jpg, input_dir_tiff, execution_mode="serial")
@@ -0,0 +1,91 @@
+# test_orientation.py
+
+import os
+import hashlib
+
+import cv2
+import numpy as np
+import pytest
+
+import orientation
+import processing
+from conftest import run_documents
+
+@pytest.fixture
+def page():
+    """A portrait page with a few dark text lines."""
+    image = np.full((400, 300), 255, np.uint8)
+    for top in range(40, 360, 40):
+        image[top:top + 8, 30:270] = 0
+    return image
+
+def _digests(folder):
+    digests = {}
+    for name in os.listdir(folder):
+        with open(os.path.join(folder, name), "rb") as f:
+            digests[name] = hashlib.sha1(f.read()).hexdigest()
+    return digests
+
+def test_confident_estimate_is_used(page, monkeypatch):
+    monkeypatch.setattr(orientation, "estimate_orientation", lambda image: (270, 0.9))
+    monkeypatch.setattr(orientation, "osd_rotation", lambda image: pytest.fail("OSD should not run"))
+    assert orientation.detect_rotation(page) == 270
+
+def test_uncertain_page_is_left_alone_without_osd(page, monkeypatch):
+    monkeypatch.setattr(orientation, "estimate_orientation", lambda image: (90, 0.1))
+    monkeypatch.setattr(orientation, "osd_rotation", lambda image: None)
+    assert orientation.detect_rotation(page) == 0
+
+def test_uncertain_page_follows_osd(page, monkeypatch):
+    monkeypatch.setattr(orientation, "estimate_orientation", lambda image: (90, 0.1))
+    monkeypatch.setattr(orientation, "osd_rotation", lambda image: 180)
+    assert orientation.detect_rotation(page) == 180
+
+def test_blank_page_is_not_turned(monkeypatch):
+    monkeypatch.setattr(orientation, "osd_rotation", lambda image: None)
+    assert orientation.detect_rotation(np.full((400, 300), 255, np.uint8)) == 0
+
+@pytest.mark.parametrize("rotation", [90, 180, 270])
+def test_jpeg_rotation_is_lossless(page, tmp_path, rotation):
+    source = str(tmp_path / "11000001.jpg")
+    cv2.imwrite(source, cv2.cvtColor(page, cv2.COLOR_GRAY2BGR))
+    output = str(tmp_path / "upright.jpg")
+    orientation.rotate_image_file(source, rotation, output)
+
+    with open(source, "rb") as f:
+        original = f.read()
+    with open(output, "rb") as f:
+        rotated = f.read()
+    # Only the Orientation tag is added; the compressed scan data is kept byte for byte
+    scan = original[original.index(b"\xff\xda"):]
+    assert rotated.endswith(scan)
+    expected = np.rot90(cv2.imread(source, cv2.IMREAD_GRAYSCALE), k=-rotation // 90)
+    assert np.array_equal(cv2.imread(output, cv2.IMREAD_GRAYSCALE), expected)
+
+def test_tiff_rotation_keeps_pixels_and_resolution(page, tmp_path):
+    source = str(tmp_path / "10000001.tif")
+    cv2.imwrite(source, page, [cv2.IMWRITE_TIFF_XDPI, 300, cv2.IMWRITE_TIFF_YDPI, 300, cv2.IMWRITE_TIFF_RESUNIT, 2])
+    output = str(tmp_path / "upright.tif")
+    orientation.rotate_image_file(source, 90, output)
+
+    assert np.array_equal(cv2.imread(output, cv2.IMREAD_GRAYSCALE), np.rot90(page, k=-1))
+    with open(source, "rb") as f:
+        resolution = orientation._tiff_resolution(f.read())
+    with open(output, "rb") as f:
+        assert orientation._tiff_resolution(f.read()) == resolution
+
+def test_run_writes_upright_copies_and_keeps_sources(scan_folder, tmp_path, monkeypatch):
+    input_dir_jpg, input_dir_tiff = os.path.join(scan_folder, "JPG"), os.path.join(scan_folder, "TIF")
+    before = _digests(input_dir_jpg), _digests(input_dir_tiff)
+    # Page 4 is confidently sideways; every other page is upright or uncertain
+    monkeypatch.setattr(processing, "detect_rotation",
+                        lambda image, image_name="": 90 if image_name.endswith("11000004.jpg") else 0)
+    orientation_dir = str(tmp_path / "Upright")
+
+    result = run_documents(input_dir_jpg, input_dir_tiff, execution_mode="serial", orientation_dir=orientation_dir)
+    assert result[0] == "complete"
+    assert sorted(os.listdir(orientation_dir)) == ["10000004.tif", "11000004.jpg"]
+    assert (_digests(input_dir_jpg), _digests(input_dir_tiff)) == before
+    for name in os.listdir(orientation_dir):
+        source = cv2.imread(os.path.join(input_dir_jpg if name.endswith(".jpg") else input_dir_tiff, name))
+        assert cv2.imread(os.path.join(orientation_dir, name)).shape[:2] == source.shape[1::-1]
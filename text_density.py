@@ -0,0 +1,99 @@
+# text_density.py
+
+import cv2
+import numpy as np
+import logging
+
+from archives import read_image
+
+logger = logging.getLogger()
+
+# Character heights as a fraction of the page's longer side (roughly 5pt to 40pt type)
+MIN_CHAR_HEIGHT_FRACTION = 0.003
+MAX_CHAR_HEIGHT_FRACTION = 0.04
+# Width/height bounds for a single glyph or a short run of touching glyphs
+MIN_CHAR_ASPECT = 0.08
+MAX_CHAR_ASPECT = 8.0
+# Fraction of the bounding box covered by ink for glyph-like components
+MIN_CHAR_FILL = 0.08
+MAX_CHAR_FILL = 0.95
+# Pages with fewer text-like components than this hold little text (matches the old 50 character OCR cut-off)
+MIN_TEXT_COMPONENTS = 50
+# Pages where text-like components hold less than this share of the ink are mostly graphics
+MIN_TEXT_INK_RATIO = 0.5
+
+def estimate_text_density(binary_image):
+    """
+    Estimate how much of a bilevel page is text using connected-component statistics.
+    Components whose height, aspect ratio and fill match printed glyphs are counted as text;
+    everything else (large blobs, halftone dots merged into areas, rules) is counted as graphics.
+
+    Parameters:
+        binary_image (numpy.ndarray): Grayscale or bilevel page image with dark ink on a light background.
+
+    Returns:
+        dict: text_components, total_components, text_ink_ratio, median_char_height and ink_fraction.
+    """
+    # Ink becomes foreground (non-zero) for the labelling
+    _, ink = cv2.threshold(binary_image, 127, 255, cv2.THRESH_BINARY_INV)
+    num_labels, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+
+    # Drop the background label
+    widths = stats[1:, cv2.CC_STAT_WIDTH].astype(np.float64)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT].astype(np.float64)
+    areas = stats[1:, cv2.CC_STAT_AREA].astype(np.float64)
+
+    long_side = float(max(binary_image.shape[:2]))
+    min_height = max(4.0, MIN_CHAR_HEIGHT_FRACTION * long_side)
+    max_height = MAX_CHAR_HEIGHT_FRACTION * long_side
+
+    aspect = widths / np.maximum(heights, 1.0)
+    fill = areas / np.maximum(widths * heights, 1.0)
+    text_like = (
+        (heights >= min_height) & (heights <= max_height)
+        & (aspect >= MIN_CHAR_ASPECT) & (aspect <= MAX_CHAR_ASPECT)
+        & (fill >= MIN_CHAR_FILL) & (fill <= MAX_CHAR_FILL)
+    )
+
+    total_ink = areas.sum()
+    text_ink = areas[text_like].sum()
+    return {
+        "text_components": int(np.count_nonzero(text_like)),
+        "total_components": int(num_labels - 1),
+        "text_ink_ratio": float(text_ink / total_ink) if total_ink else 0.0,
+        "median_char_height": float(np.median(heights[text_like])) if text_like.any() else 0.0,
+        "ink_fraction": float(total_ink / binary_image.size),
+    }
+
+def is_mostly_graphics(tiff_path, min_text_components=MIN_TEXT_COMPONENTS, min_text_ink_ratio=MIN_TEXT_INK_RATIO):
+    """
+    Decide whether a bilevel TIFF holds mainly pictures or graphs rather than text.
+    This replaces running OCR on every page just to count the characters returned.
+
+    Parameters:
+        tiff_path (str): The file path to the bilevel TIFF, possibly inside an archive.
+        min_text_components (int): Minimum number of glyph-like components for a text page.
+        min_text_ink_ratio (float): Minimum share of ink in glyph-like components for a text page.
+
+    Returns:
+        bool: True if the page is mostly graphics, False if it is mostly text, or None if the image couldn't be read.
+    """
+    try:
+        image = read_image(tiff_path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            logger.error(f"Error reading image: {tiff_path}")
+            return None
+
+        stats = estimate_text_density(image)
+        mostly_graphics = (
+            stats["text_components"] < min_text_components
+            or stats["text_ink_ratio"] < min_text_ink_ratio
+        )
+        logger.debug(
+            f"Image '{tiff_path}' has {stats['text_components']} text-like components, "
+            f"text ink ratio {stats['text_ink_ratio']:.2f}, mostly graphics: {mostly_graphics}."
+        )
+        return mostly_graphics
+    except Exception as e:
+        logger.error(f"Exception while estimating text density for '{tiff_path}': {str(e)}")
+        return None
@@ -0,0 +1,183 @@
+# thread_budget.py
+
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+logger = logging.getLogger()
+
+# Environment variables read by the OpenMP and BLAS runtimes when they load
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS", "VECLIB_MAXIMUM_THREADS"
+)
+# Seconds between samples of the thread diagnostic
+DEFAULT_SAMPLE_INTERVAL = 1.0
+
+def library_threads(execution_mode, workers):
+    """
+    Number of threads OpenCV and BLAS may use inside each of our workers, so that
+    workers x library threads stays at the CPU count instead of multiplying past it.
+
+    Parameters:
+        execution_mode (str): The processing mode.
+        workers (int): Number of file-level workers (processes, threads or pipeline analyzers).
+
+    Returns:
+        int: Threads per worker; the whole CPU for serial runs.
+    """
+    cpus = os.cpu_count() or 1
+    if execution_mode == "serial":
+        return cpus
+    return max(1, cpus // max(1, workers))
+
+def apply_thread_budget(threads):
+    """
+    Limit OpenCV, OpenMP and BLAS to the given number of threads in this process.
+
+    The environment variables only take effect for runtimes loaded afterwards, so worker
+    initializers call this before importing the analysis code. Runtimes that are already
+    loaded are limited through threadpoolctl when it is installed.
+
+    Parameters:
+        threads (int): Threads each library may use.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    import cv2  # Imported here so the environment is set before a fresh worker loads it
+    cv2.setNumThreads(threads)
+    if threadpool_limits is not None:
+        threadpool_limits(threads)
+
+@contextmanager
+def thread_budget(execution_mode, workers):
+    """
+    Apply the thread budget of a run in this process and restore OpenCV's setting afterwards.
+    Used for the modes that analyze on threads of this process.
+
+    Parameters:
+        execution_mode (str): The processing mode.
+        workers (int): Number of threads analyzing files.
+    """
+    import cv2
+    previous = cv2.getNumThreads()
+    threads = library_threads(execution_mode, workers)
+    cv2.setNumThreads(threads)
+    logger.info(f"Thread budget: {workers} {execution_mode} workers x {threads} OpenCV threads.")
+    try:
+        yield threads
+    finally:
+        cv2.setNumThreads(previous)
+
+def _proc_status(pid):
+    """Read (threads, voluntary, involuntary context switches) of a process from /proc."""
+    values = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Threads", "voluntary_ctxt_switches", "nonvoluntary_ctxt_switches"):
+                values[key] = int(value)
+    return values["Threads"], values["voluntary_ctxt_switches"], values["nonvoluntary_ctxt_switches"]
+
+def _proc_descendants(pid):
+    """Find every descendant of a process by scanning /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The parent pid follows the command name, which is in parentheses and may contain spaces
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    descendants, pending = [], [pid]
+    while pending:
+        for child in children.get(pending.pop(), []):
+            descendants.append(child)
+            pending.append(child)
+    return descendants
+
+def sample_threads():
+    """
+    Count the threads and context switches of this process and all its worker processes.
+
+    Returns:
+        tuple: (threads, voluntary switches, involuntary switches), or None if neither psutil
+               nor /proc is available.
+    """
+    totals = [0, 0, 0]
+    if psutil is not None:
+        parent = psutil.Process()
+        for process in [parent] + parent.children(recursive=True):
+            try:
+                switches = process.num_ctx_switches()
+                sample = (process.num_threads(), switches.voluntary, switches.involuntary)
+            except psutil.Error:
+                continue  # The worker exited between listing and reading it
+            totals = [total + value for total, value in zip(totals, sample)]
+        return tuple(totals)
+    if not os.path.exists("/proc/self/status"):
+        return None
+    for pid in [os.getpid()] + _proc_descendants(os.getpid()):
+        try:
+            sample = _proc_status(pid)
+        except (OSError, KeyError, ValueError):
+            continue
+        totals = [total + value for total, value in zip(totals, sample)]
+    return tuple(totals)
+
+class ThreadDiagnostics(threading.Thread):
+    """
+    Samples the thread count and context-switch rate of this process and its workers during
+    a run and logs a summary when stopped. A high involuntary switch rate means more threads
+    are runnable than there are cores.
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        super().__init__(name="thread-diagnostics", daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._stopped = threading.Event()
+
+    def run(self):
+        previous = sample_threads()
+        if previous is None:
+            logger.info("Thread diagnostics unavailable: install psutil on this platform.")
+            return
+        previous_time = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            current, now = sample_threads(), time.perf_counter()
+            elapsed = now - previous_time
+            # Workers that exited take their counts with them, so a negative delta counts as zero
+            voluntary = max(0, current[1] - previous[1]) / elapsed
+            involuntary = max(0, current[2] - previous[2]) / elapsed
+            self.samples.append((current[0], voluntary, involuntary))
+            logger.debug(f"Threads: {current[0]}, context switches: {voluntary:.0f}/s voluntary, {involuntary:.0f}/s involuntary.")
+            previous, previous_time = current, now
+
+    def stop(self):
+        """Stop sampling and log the summary."""
+        self._stopped.set()
+        self.join()
+        if not self.samples:
+            return
+        count = len(self.samples)
+        logger.info(
+            f"Thread diagnostics: {sum(s[0] for s in self.samples) / count:.0f} threads on average "
+            f"(peak {max(s[0] for s in self.samples)}) on {os.cpu_count() or 1} CPUs; context switches "
+            f"{sum(s[1] for s in self.samples) / count:.0f}/s voluntary, "
+            f"{sum(s[2] for s in self.samples) / count:.0f}/s involuntary."
+        )